@@ -5,8 +5,7 @@ import os
 from arch import compute_routing_usage
 from arch import parse_routing
 from arch import compute_total_wire
-from arch import parse_placement, parse_cgra, compute_area_usage
-from arch.cgra_route import parse_routing_resource, build_routing_resource
+from arch import parse_placement, load_cgra_arch, compute_area_usage
 
 
 def main():
@@ -20,7 +19,9 @@ def main():
     route_file = sys.argv[3]
     packed_file = route_file.replace(".route", ".packed")
     placement_file = route_file.replace(".route", ".place")
-    board_layout = parse_cgra(cgra_file)["CGRA"]
+    # both the layout and routing resource come from a single parse
+    layouts, routing_resource = load_cgra_arch(cgra_file)
+    board_layout = layouts["CGRA"]
     routing_result = parse_routing(route_file)
     placement, _ = parse_placement(placement_file)
 
@@ -52,8 +53,6 @@ def main():
     # timing removed for future development
 
     print("-" * cols)
-    r = parse_routing_resource(cgra_file)
-    routing_resource = build_routing_resource(r)
     resource_usage = compute_routing_usage(routing_result, routing_resource)
     for bus in resource_usage:
         print("BUS:", bus)
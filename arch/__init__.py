@@ -1,4 +1,6 @@
 from .arch import parse_cgra, parse_vpr, parse_fpga, get_layout
+from .arch import parse_fpga_sites
+from .arch import parse_cgra_info, load_cgra_arch
 from .netlist import group_reg_nets
 from .cgra_packer import load_packed_file
 from .cgra_packer import read_netlist_json
@@ -1,8 +1,13 @@
 from __future__ import print_function
 from lxml import etree
+import numpy as np
 import sys
 import os
 import pythunder
+from .cgra_route import iter_cgra_tiles, parse_tile_routing_resource
+from .cgra_route import build_routing_resource
+from .arch_cache import ARCH_CACHE_DIR, get_arch_cache_key
+from .arch_cache import load_arch_cache, save_arch_cache
 
 
 """
@@ -37,11 +42,8 @@ def parse_vpr(filename):
         width = int(layout_attr["width"])
         height = int(layout_attr["height"])
 
-        # create the board
-        layout_board = []
-        for h in range(height):
-            row = [None] * width
-            layout_board.append(row)
+        # create the board. ' ' is an empty tile, same as in get_layout
+        layout_board = np.full((height, width), ' ', dtype="U1")
 
         available_blk_types = set()
         # filling in tile types
@@ -56,9 +58,7 @@ def parse_vpr(filename):
             raw_blk_type = fill.attrib["type"]
             blk_type = convert_vpr_type(raw_blk_type)
             available_blk_types.add(blk_type)
-            for y in range(height):
-                for x in range(width):
-                    layout_board[y][x] = blk_type
+            layout_board[:, :] = get_board_type(blk_type)
 
         peri_priority = fill_priority
         for peri in layout.iter("perimeter"):
@@ -72,12 +72,8 @@ def parse_vpr(filename):
             blk_type = convert_vpr_type(raw_blk_type)
             available_blk_types.add(blk_type)
             # fill in
-            for x in range(width):
-                layout_board[0][x] = blk_type
-                layout_board[height - 1][x] = blk_type
-            for y in range(height):
-                layout_board[y][0] = blk_type
-                layout_board[y][width - 1] = blk_type
+            layout_board[[0, height - 1], :] = get_board_type(blk_type)
+            layout_board[:, [0, width - 1]] = get_board_type(blk_type)
         corners_priority = fill_priority
         for corners in layout.iter("corners"):
             priority = int(corners.attrib["priority"])
@@ -89,10 +85,8 @@ def parse_vpr(filename):
             raw_blk_type = corners.attrib["type"]
             blk_type = convert_vpr_type(raw_blk_type)
             available_blk_types.add(blk_type)
-            layout_board[0][0] = blk_type
-            layout_board[0][width - 1] = blk_type
-            layout_board[height - 1][0] = blk_type
-            layout_board[height - 1][width - 1] = blk_type
+            layout_board[np.ix_([0, height - 1], [0, width - 1])] = \
+                get_board_type(blk_type)
 
         cols_priority = {}
         for col in layout.iter("col"):
@@ -109,12 +103,9 @@ def parse_vpr(filename):
             raw_blk_type = col.attrib["type"]
             blk_type = convert_vpr_type(raw_blk_type)
             available_blk_types.add(blk_type)
-            xx = startx
-            while xx < width:
-                # we have peri defined already
-                for y in range(starty, height - 1):
-                    layout_board[y][xx] = blk_type
-                xx += repeatx
+            # we have peri defined already
+            layout_board[starty:height - 1, startx::repeatx] = \
+                get_board_type(blk_type)
 
         # need to figure out the height
         # we are not concerned with routing in VPR for now
@@ -161,23 +152,21 @@ def convert_cgra_type(tile_type):
         raise Exception("Unknown tile type " + tile_type)
 
 
+def get_board_type(blk_type):
+    return ' ' if blk_type is None else blk_type
+
+
 def get_layout(board_layout):
-    new_layout = []
-    for y in range(len(board_layout)):
-        row = []
-        for x in range(len(board_layout[y])):
-            if board_layout[y][x] is None:
-                row.append(' ')
-            else:
-                row.append(board_layout[y][x])
-        new_layout.append(row)
+    if not isinstance(board_layout, np.ndarray):
+        board_layout = np.array([[get_board_type(blk_type) for blk_type in row]
+                                 for row in board_layout], dtype="U1")
 
     default_priority = pythunder.Layout.DEFAULT_PRIORITY
     # not the best practice to use the layers here
     # but this requires minimum amount of work to convert the old
     # code to the new codebase
     # FIXME: change the CGRA_INFO parser to remove the changes
-    layout = pythunder.Layout(new_layout)
+    layout = pythunder.Layout.from_numpy(board_layout)
     # add a reg layer to the layout, the same as PE
     clb_layer = layout.get_layer('p')
     reg_layer = pythunder.Layer(clb_layer)
@@ -211,48 +200,101 @@ def set_io_mask(layout, io_mask_table):
     layout.add_layer_mask(mask)
 
 
-def parse_cgra(filename, use_tile_addr=False):
-    root = etree.parse(filename)
+def parse_cgra(filename, use_tile_addr=False, cache_dir=ARCH_CACHE_DIR):
+    key = get_arch_cache_key(filename)
+    board_info = load_arch_cache(cache_dir, key, "board")
+    if board_info is None:
+        board_info = create_board_info()
+        for tile in iter_cgra_tiles(filename):
+            parse_cgra_tile(tile, board_info)
+        save_arch_cache(cache_dir, key, "board", board_info)
+    return build_cgra_layouts(board_info, use_tile_addr)
+
+
+def parse_cgra_info(filename, use_tile_addr=False):
+    """parses the layouts and the raw routing resource in a single pass, i.e.
+       the same as parse_cgra and cgra_route.parse_routing_resource"""
+    board_info, routing_resource = parse_cgra_tiles(filename)
+    return build_cgra_layouts(board_info, use_tile_addr), routing_resource
+
+
+def load_cgra_arch(filename, use_tile_addr=False, cache_dir=ARCH_CACHE_DIR):
+    """returns the layouts and the routing resource from
+       build_routing_resource. both are cached on disk and only parsed again
+       when the file content changes"""
+    key = get_arch_cache_key(filename)
+    board_info = load_arch_cache(cache_dir, key, "board")
+    routing_resource = load_arch_cache(cache_dir, key, "routing")
+    if board_info is None or routing_resource is None:
+        board_info, raw_routing_resource = parse_cgra_tiles(filename)
+        routing_resource = build_routing_resource(raw_routing_resource)
+        save_arch_cache(cache_dir, key, "board", board_info)
+        save_arch_cache(cache_dir, key, "routing", routing_resource)
+    return build_cgra_layouts(board_info, use_tile_addr), routing_resource
+
+
+def parse_cgra_tiles(filename):
+    board_info = create_board_info()
+    routing_resource = {}
+    parse_routing = True
+    for tile in iter_cgra_tiles(filename):
+        parse_cgra_tile(tile, board_info)
+        if parse_routing:
+            entry = parse_tile_routing_resource(tile)
+            if entry is None:
+                # don't care about gst for now
+                parse_routing = False
+            else:
+                pos, resource = entry
+                routing_resource[pos] = resource
+    return board_info, routing_resource
+
+
+def create_board_info():
+    # because CGRA file doesn't tell the size beforehand
+    return {"board_dict": {}, "available_types": set(), "tile_mapping": {},
+            "io_pad_name": {}, "io_pad_bit": {}, "io16_tile": {},
+            "io_mask_table": {}}
+
+
+def parse_cgra_tile(tile, board_info):
+    if "type" not in tile.attrib or tile.attrib["type"] == "gst":
+        return
+    board_dict = board_info["board_dict"]
+    io_pad_name = board_info["io_pad_name"]
+    io16_tile = board_info["io16_tile"]
+    io_mask_table = board_info["io_mask_table"]
+    tile_type = tile.attrib["type"]
+    x = int(tile.attrib["col"])
+    y = int(tile.attrib["row"])
+    tile_addr = int(tile.attrib["tile_addr"], 16)
+    blk_type = convert_cgra_type(tile_type)
+    board_dict[(x, y)] = blk_type
+    board_info["available_types"].add(blk_type)
+    board_info["tile_mapping"][(x, y)] = tile_addr
+    # figure out where the 16 bit IO tiles
+    if tile_type == "io1bit":
+        # only 16 bit IO tiles has this
+        if tile.find("p2f_wide") is not None:
+            board_dict[(x, y)] = "I"
+        pad_name = tile.attrib["name"]
+        io_pad_name[(x, y)] = pad_name
+        # obtain the io pad bit number
+        io_bit_elem = tile.find("io_bit")
+        assert io_bit_elem is not None
+        board_info["io_pad_bit"][(x, y)] = io_bit_elem.text
+
+        # add it to the io 16 tiles
+        if pad_name not in io16_tile:
+            io16_tile[pad_name] = []
+            io_mask_table[pad_name] = []
+        io16_tile[pad_name].append(tile_addr)
+        io_mask_table[pad_name].append((x, y))
+
+
+def build_cgra_layouts(board_info, use_tile_addr=False):
     layout_name = "CGRA"
-    # only one layout in CGRA files
-    board_dict = {}     # because CGRA file doesn't tell the size beforehand
-    available_types = set()
-    tile_mapping = {}
-    io_pad_name = {}
-    io_pad_bit = {}
-    io16_tile = {}
-    io_mask_table = {}
-
-    for tile in root.iter("tile"):
-        if "type" not in tile.attrib or tile.attrib["type"] == "gst":
-            continue
-        tile_type = tile.attrib["type"]
-        x = int(tile.attrib["col"])
-        y = int(tile.attrib["row"])
-        tile_addr = int(tile.attrib["tile_addr"], 16)
-        blk_type = convert_cgra_type(tile_type)
-        board_dict[(x, y)] = blk_type
-        available_types.add(blk_type)
-        tile_mapping[(x, y)] = tile_addr
-        # figure out where the 16 bit IO tiles
-        if tile_type == "io1bit":
-            # only 16 bit IO tiles has this
-            if tile.find("p2f_wide") is not None:
-                board_dict[(x, y)] = "I"
-            pad_name = tile.attrib["name"]
-            io_pad_name[(x, y)] = pad_name
-            # obtain the io pad bit number
-            io_bit_elem = tile.find("io_bit")
-            assert io_bit_elem is not None
-            io_pad_bit[(x, y)] = io_bit_elem.text
-
-            # add it to the io 16 tiles
-            if pad_name not in io16_tile:
-                io16_tile[pad_name] = []
-                io_mask_table[pad_name] = []
-            io16_tile[pad_name].append(tile_addr)
-            io_mask_table[pad_name].append((x, y))
-
+    board_dict = board_info["board_dict"]
     positions = list(board_dict.keys())
     positions.sort(key=lambda entry: entry[0], reverse=True)
     width = positions[0][0] + 1
@@ -267,67 +309,63 @@ def parse_cgra(filename, use_tile_addr=False):
 
     blk_height = {}
     blk_capacity = {}
-    for blk in available_types:
+    for blk in board_info["available_types"]:
         blk_height[blk] = 1
         blk_capacity[blk] = 1
 
-    info = {"io_pad_name": io_pad_name,
-            "io_pad_bit": io_pad_bit, "io16_tile": io16_tile}
+    info = {"io_pad_name": board_info["io_pad_name"],
+            "io_pad_bit": board_info["io_pad_bit"],
+            "io16_tile": board_info["io16_tile"]}
 
     # NOTE:
     # the CGRA file sets the height for each tiles implicitly
     # no need to worry about the height
     layouts = {}
     layout = get_layout(layout_board)
-    set_io_mask(layout, io_mask_table)
+    set_io_mask(layout, board_info["io_mask_table"])
     if use_tile_addr:
         layouts[layout_name] = (layout, info,
-                                tile_mapping)
+                                board_info["tile_mapping"])
     else:
         layouts[layout_name] = layout
     return layouts
 
 
-def parse_fpga(fpga_file):
-    """parse ISPD FPGA benchmark"""
+FPGA_SITE_TYPES = {"IO": "i", "SLICE": "c", "BRAM": "m", "DSP": "d"}
+
+
+def parse_fpga_sites(fpga_file):
+    """parse the SITEMAP section of an ISPD FPGA benchmark. returns the board
+       as a char array indexed by [y][x] and the (x, y) of every IO site as
+       an N x 2 array"""
+    board_layout = None
     with open(fpga_file) as f:
-        lines = f.readlines()
-
-    board_layout = []
-
-    io_tiles = set()
-    read_site = False
-
-    for line in lines:
-        if not read_site:
-            if "SITEMAP" in line:
-                read_site = True
-                _, raw_width, raw_height = line.split()
-                width = int(raw_width)
-                height = int(raw_height)
-                for j in range(height):
-                    row = [None] * width
-                    board_layout.append(row)
-        else:
+        for line in f:
+            if board_layout is None:
+                if "SITEMAP" in line:
+                    _, raw_width, raw_height = line.split()
+                    width = int(raw_width)
+                    height = int(raw_height)
+                    board_layout = np.full((height, width), ' ', dtype="U1")
+                continue
             line = line.strip()
             if len(line) == 0 or "END" in line:
                 break
             raw_x, raw_y, site_type = line.split()
-            x = int(raw_x)
-            y = int(raw_y)
-            if site_type == "IO":
-                board_layout[y][x] = "i"
-                io_tiles.add((x, y))
-            elif site_type == "SLICE":
-                board_layout[y][x] = "c"
-            elif site_type == "BRAM":
-                board_layout[y][x] = "m"
-            elif site_type == "DSP":
-                board_layout[y][x] = "d"
-            else:
+            if site_type not in FPGA_SITE_TYPES:
                 raise Exception("Unknown SITE " + site_type)
+            board_layout[int(raw_y), int(raw_x)] = FPGA_SITE_TYPES[site_type]
+    if board_layout is None:
+        raise Exception("No SITEMAP found in " + fpga_file)
+    io_sites = np.argwhere(board_layout == "i")[:, ::-1]
+    return board_layout, io_sites
+
+
+def parse_fpga(fpga_file):
+    """parse ISPD FPGA benchmark"""
+    board_layout, _ = parse_fpga_sites(fpga_file)
     layout_name = "fpga"
-    layouts = {layout_name: pythunder.Layout(board_layout)}
+    layouts = {layout_name: pythunder.Layout.from_numpy(board_layout)}
     return layouts
 
 
@@ -0,0 +1,81 @@
+"""
+On-disk cache of parsed cgra_info files. Entries are keyed on the hash of
+the file and ARCH_PARSER_VERSION. Each entry is a directory with a "board"
+pickle holding the tile information from parse_cgra_tile and a "routing"
+pickle holding the output of build_routing_resource, so that tools that only
+need the layout do not have to load the routing resource. The least recently
+used entries are evicted once the cache is larger than ARCH_CACHE_SIZE.
+"""
+from __future__ import print_function
+import hashlib
+import os
+import pickle
+import tempfile
+from .pack_cache import evict_cache
+
+# bump this whenever the parsed result of the same cgra_info file changes
+ARCH_PARSER_VERSION = 1
+# set ARCH_CACHE_DIR to an empty string to turn off the cache
+ARCH_CACHE_DIR = os.environ.get("ARCH_CACHE_DIR",
+                                os.path.join(os.path.expanduser("~"),
+                                             ".cache", "cgra_pnr", "arch"))
+ARCH_CACHE_SIZE = 1 << 30
+
+
+def get_arch_cache_key(arch_filename):
+    sha = hashlib.sha256()
+    with open(arch_filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    sha.update("version={}".format(ARCH_PARSER_VERSION).encode())
+    return sha.hexdigest()
+
+
+def get_entry_filename(cache_dir, key, name):
+    return os.path.join(cache_dir, key, name + ".pickle")
+
+
+def load_arch_cache(cache_dir, key, name):
+    """returns None if there is no valid entry"""
+    if not cache_dir:
+        return None
+    entry_filename = get_entry_filename(cache_dir, key, name)
+    if not os.path.isfile(entry_filename):
+        return None
+    try:
+        with open(entry_filename, "rb") as f:
+            entry_key, value = pickle.load(f)
+    except Exception:
+        # truncated or written by an incompatible Python
+        return None
+    if entry_key != key:
+        return None
+    # mark the entry as recently used
+    try:
+        os.utime(os.path.dirname(entry_filename), None)
+    except OSError:
+        # evicted in the meantime
+        pass
+    return value
+
+
+def save_arch_cache(cache_dir, key, name, value, max_size=ARCH_CACHE_SIZE):
+    if not cache_dir:
+        return
+    try:
+        entry_dir = os.path.join(cache_dir, key)
+        if not os.path.isdir(entry_dir):
+            try:
+                os.makedirs(entry_dir)
+            except OSError:
+                # created by another process in the meantime
+                if not os.path.isdir(entry_dir):
+                    raise
+        fd, tmp_filename = tempfile.mkstemp(dir=cache_dir, prefix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump((key, value), f, pickle.HIGHEST_PROTOCOL)
+        # readers either see the complete entry or nothing
+        os.rename(tmp_filename, get_entry_filename(cache_dir, key, name))
+        evict_cache(cache_dir, max_size)
+    except (IOError, OSError) as ex:
+        print("Unable to save architecture cache:", ex)
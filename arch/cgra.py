@@ -195,6 +195,7 @@ def generate_bitstream(board_filename, netlist_filename,
 
 def generate_routing(routing_file, tile_mapping, board_layout):
     routes = parse_routing(routing_file)
+    blk_types, _ = board_layout.to_numpy()
     result = {}
     for net_id in routes:
         lines = []
@@ -213,7 +214,7 @@ def generate_routing(routing_file, tile_mapping, board_layout):
                         port_name = "validb"
                     x, y = seg[2], seg[3]
                     pos = (x, y)
-                    blk_type = board_layout.get_blk_type(x, y)
+                    blk_type = blk_types[y, x]
                     if blk_type == "i" or blk_type == "I":
                         seg_index += 2
                         line = ""
@@ -258,7 +259,7 @@ def generate_routing(routing_file, tile_mapping, board_layout):
                     one_bit = seg[-1] != 16
                     x, y = seg[2], seg[3]
                     pos = (x, y)
-                    blk_type = board_layout.get_blk_type(x, y)
+                    blk_type = blk_types[y, x]
                     if blk_type == "i" or blk_type == "I":
                         seg_index += 1
                         continue
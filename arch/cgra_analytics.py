@@ -1,3 +1,5 @@
+import numpy as np
+
 # FIXME
 # random numbers
 TIMING_INFO = {
@@ -64,23 +66,17 @@ def compute_total_wire(routing_result):
 
 def compute_area_usage(placement, board_layout):
     result = {}
-    height = board_layout.height()
-    width = board_layout.width()
-    for y in range(height):
-        for x in range(width):
-            blk_type = board_layout.get_blk_type(x, y)
-            if blk_type is None:
-                continue
-            if blk_type not in result:
-                result[blk_type] = [0, 0]
-            result[blk_type][-1] += 1
+    blk_types, _ = board_layout.to_numpy()
+    types, counts = np.unique(blk_types, return_counts=True)
+    for blk_type, count in zip(types.tolist(), counts.tolist()):
+        result[blk_type] = [0, count]
     pos_set = set()
     for blk_id in placement:
         pos = placement[blk_id]
         if pos in pos_set:
             continue
         x, y = pos
-        blk_type = board_layout.get_blk_type(x, y)
+        blk_type = blk_types[y, x]
         result[blk_type][0] += 1
         pos_set.add(pos)
     # remove entries
@@ -7,42 +7,62 @@ very first packing/clustering tools for AHA group
 """
 from __future__ import print_function
 import sys
-import json
 import os
+import pythunder
 from .netlist import is_conn_out, is_conn_in
+from .coreir import load_top_module
+from .packed_binary import save_packed_binary, load_packed_binary
+from .pack_cache import get_cache_key, load_from_cache, save_to_cache
+from .pack_cache import CACHE_SIZE
 
 
 def convert2netlist(connections):
+    """merges pairwise connections into nets. each endpoint string is mapped
+       to the index of the net it belongs to, so every connection is
+       processed only once. nets are ordered by their first connection and
+       endpoints by their first appearance, then sorted src -> sink
+    """
+    nets = []
+    port_to_net = {}
+    for conn in connections:
+        assert(len(conn) == 2)
+        conn0, conn1 = conn[0], conn[1]
+        net_index0 = port_to_net.get(conn0, None)
+        net_index1 = port_to_net.get(conn1, None)
+        if net_index0 is None and net_index1 is None:
+            net_index = len(nets)
+            nets.append([conn0, conn1])
+            port_to_net[conn0] = net_index
+            port_to_net[conn1] = net_index
+        elif net_index1 is None:
+            nets[net_index0].append(conn1)
+            port_to_net[conn1] = net_index0
+        elif net_index0 is None:
+            nets[net_index1].append(conn0)
+            port_to_net[conn0] = net_index1
+        elif net_index0 != net_index1:
+            # two partial nets joined by this connection. merge the later
+            # one into the earlier one to keep the net order stable
+            net_index = min(net_index0, net_index1)
+            merged_index = max(net_index0, net_index1)
+            for port in nets[merged_index]:
+                port_to_net[port] = net_index
+            nets[net_index] += nets[merged_index]
+            nets[merged_index] = None
+
+    def sort_value(key):
+        raw_splits = key.split(".")
+        if is_conn_in(raw_splits):
+            return 2
+        elif is_conn_out(raw_splits):
+            return 0
+        else:
+            return 1
+
     netlists = []
-    skip_index = set()
-    for i in range(len(connections)):
-        if i in skip_index:
+    for net in nets:
+        if net is None:
             continue
-        conn = connections[i]
-        assert(len(conn) == 2)
-        # brute force search
-        net = [conn[0], conn[1]]
-        for j in range(len(connections)):
-            if i == j:
-                continue
-            conn0 = connections[j][0]
-            conn1 = connections[j][1]
-
-            if conn0 in net and conn1 not in net:
-                net.append(conn1)
-                skip_index.add(j)
-            if conn1 in net and conn0 not in net:
-                skip_index.add(j)
-                net.append(conn0)
-
-        def sort_value(key):
-            raw_splits = key.split(".")
-            if is_conn_in(raw_splits):
-                return 2
-            elif is_conn_out(raw_splits):
-                return 0
-            else:
-                return 1
         # rearrange the net so that it's src -> sink
         net.sort(key=lambda p: sort_value(p))
         # sanity check to make sure that the first one is indeed an out
@@ -83,15 +103,56 @@ def determine_track_bus(netlists, id_to_name):
     return track_mode
 
 
-def save_packing_result(netlist_filename, pack_filename, fold_reg=True):
+def save_packing_result(netlist_filename, pack_filename, fold_reg=True,
+                        save_binary=False, cache_dir=None,
+                        cache_size=CACHE_SIZE, prev_pack_filename=None):
+    """if prev_pack_filename is set, block and net IDs of the previous
+       packing result are kept for the instances and nets that still exist.
+       the result then depends on the previous file, so the cache is not used.
+       returns the number of PE, IO, MEM, and REG blocks in the packed netlists
+    """
+    prev_netlists, prev_id_to_name = None, None
+    if prev_pack_filename is not None:
+        prev_netlists, _, prev_id_to_name, _ = \
+            load_packed_file(prev_pack_filename)
+        cache_dir = None
+    if cache_dir is not None:
+        key = get_cache_key(netlist_filename, fold_reg)
+        if load_from_cache(cache_dir, key, pack_filename):
+            print("Packing cache hit:", key)
+            result = load_packed_binary(pack_filename)
+            if result is None:
+                result = load_packed_text(pack_filename)
+                if save_binary:
+                    # the entry has no sidecar or the mtime is not kept
+                    save_packed_binary(pack_filename, *result)
+            return count_blocks(result[0])
+        print("Packing cache miss:", key)
+
     netlists, folded_blocks, id_to_name, changed_pe = \
-        parse_and_pack_netlist(netlist_filename, fold_reg=fold_reg)
+        parse_and_pack_netlist(netlist_filename, fold_reg=fold_reg,
+                               prev_id_to_name=prev_id_to_name)
 
     rename_id_changed(id_to_name, changed_pe)
+    if prev_netlists is not None:
+        netlists, added, removed, changed = match_net_ids(netlists,
+                                                          prev_netlists)
+        print("Added nets:", len(added), "Removed nets:", len(removed),
+              "Changed nets:", len(changed))
+        for title, net_ids in (("Added", added), ("Removed", removed),
+                               ("Changed", changed)):
+            if net_ids:
+                print(title + ":", " ".join(net_ids))
     track_mode = determine_track_bus(netlists, id_to_name)
 
     write_packing_result(changed_pe, folded_blocks, id_to_name, netlists,
                          pack_filename, track_mode)
+    if save_binary:
+        save_packed_binary(pack_filename, netlists, folded_blocks, id_to_name,
+                           changed_pe, track_mode)
+    if cache_dir is not None:
+        save_to_cache(cache_dir, key, pack_filename, cache_size)
+    return count_blocks(netlists)
 
 
 def write_packing_result(changed_pe, folded_blocks, id_to_name, netlists,
@@ -142,6 +203,21 @@ def write_packing_result(changed_pe, folded_blocks, id_to_name, netlists,
 
 
 def load_packed_file(pack_filename, load_track_mode=False):
+    # use the binary sidecar if it is written for this very file
+    result = load_packed_binary(pack_filename)
+    if result is None and hasattr(pythunder.io, "load_packed_file"):
+        # same parser as the C++ tools
+        result = pythunder.io.load_packed_file(pack_filename)
+    elif result is None:
+        result = load_packed_text(pack_filename)
+    netlists, folded_blocks, id_to_name, changed_pe, track_mode = result
+    if load_track_mode:
+        return netlists, folded_blocks, id_to_name, changed_pe, track_mode
+    else:
+        return netlists, folded_blocks, id_to_name, changed_pe
+
+
+def load_packed_text(pack_filename):
     with open(pack_filename) as f:
         lines = f.readlines()
 
@@ -251,15 +327,14 @@ def load_packed_file(pack_filename, load_track_mode=False):
         track_mode[net_id] = mode
 
         line_num += 1
-    if load_track_mode:
-        return netlists, folded_blocks, id_to_name, changed_pe, track_mode
-    else:
-        return netlists, folded_blocks, id_to_name, changed_pe
+    return netlists, folded_blocks, id_to_name, changed_pe, track_mode
 
 
-def parse_and_pack_netlist(netlist_filename, fold_reg=True):
+def parse_and_pack_netlist(netlist_filename, fold_reg=True,
+                           prev_id_to_name=None):
     connections, instances = read_netlist_json(netlist_filename)
-    netlists, name_to_id = generate_netlists(connections, instances)
+    netlists, name_to_id = generate_netlists(connections, instances,
+                                             prev_id_to_name)
     before_packing = len(netlists)
     netlists, folded_blocks, changed_pe = pack_netlists(netlists, name_to_id,
                                                         fold_reg=fold_reg)
@@ -267,16 +342,22 @@ def parse_and_pack_netlist(netlist_filename, fold_reg=True):
     print("Before packing: num of netlists:", before_packing,
           "After packing: num of netlists:", after_packing)
 
-    pes = set()
-    ios = set()
-    mems = set()
-    regs = set()
-
     id_to_name = {}
     for name in name_to_id:
         blk_id = name_to_id[name]
         id_to_name[blk_id] = name
 
+    counts = count_blocks(netlists)
+    print("PE:", counts["PE"], "IO:", counts["IO"], "MEM:", counts["MEM"],
+          "REG:", counts["REG"])
+    return netlists, folded_blocks, id_to_name, changed_pe
+
+
+def count_blocks(netlists):
+    pes = set()
+    ios = set()
+    mems = set()
+    regs = set()
     for net_id in netlists:
         net = netlists[net_id]
         for blk_id, _ in net:
@@ -288,18 +369,17 @@ def parse_and_pack_netlist(netlist_filename, fold_reg=True):
                 mems.add(blk_id)
             elif blk_id[0] == "r":
                 regs.add(blk_id)
-    print("PE:", len(pes), "IO:", len(ios), "MEM:", len(mems), "REG:",
-          len(regs))
-    return netlists, folded_blocks, id_to_name, changed_pe
+    return {"PE": len(pes), "IO": len(ios), "MEM": len(mems),
+            "REG": len(regs)}
 
 
-def generate_netlists(connections, instances):
+def generate_netlists(connections, instances, prev_id_to_name=None):
     """
     convert connection to netlists with (id, port).
     port is something like reg, data0, or const, or value, which will be packed
     later
     """
-    name_to_id = change_name_to_id(instances)
+    name_to_id = change_name_to_id(instances, prev_id_to_name)
     h_edge_count = 0
     netlists = {}
     for conn in connections:
@@ -360,8 +440,40 @@ def generate_netlists(connections, instances):
     return netlists, name_to_id
 
 
+def index_netlists(netlists):
+    """builds blk_id -> {(net_id, pin_index)} so that the packer only touches
+       the pins of the blocks it absorbs or rewrites
+    """
+    blk_pins = {}
+    for net_id in netlists:
+        index_net(blk_pins, net_id, netlists[net_id])
+    return blk_pins
+
+
+def index_net(blk_pins, net_id, net):
+    for index, (blk_id, _) in enumerate(net):
+        if blk_id not in blk_pins:
+            blk_pins[blk_id] = set()
+        blk_pins[blk_id].add((net_id, index))
+
+
+def unindex_net(blk_pins, net_id, net):
+    for index, (blk_id, _) in enumerate(net):
+        blk_pins[blk_id].discard((net_id, index))
+
+
+def replace_pin(blk_pins, net_id, net, index, pin):
+    old_blk_id = net[index][0]
+    new_blk_id = pin[0]
+    if old_blk_id != new_blk_id:
+        blk_pins[old_blk_id].discard((net_id, index))
+        if new_blk_id not in blk_pins:
+            blk_pins[new_blk_id] = set()
+        blk_pins[new_blk_id].add((net_id, index))
+    net[index] = pin
+
+
 def pack_netlists(raw_netlists, name_to_id, fold_reg=True):
-    netlist_ids = set(raw_netlists.keys())
     folded_blocks = {}
     id_to_name = {}
     for name in name_to_id:
@@ -372,22 +484,30 @@ def pack_netlists(raw_netlists, name_to_id, fold_reg=True):
     dont_absorb = set()
     nets_to_remove = set()
 
+    # block -> pins index. it has to be kept up to date whenever a pin
+    # is moved, removed or re-assigned to a different block
+    blk_pins = index_netlists(raw_netlists)
+
     # first pass to figure out the reg's net connections
     connected_pe_tiles = {}
-    for net_id in netlist_ids:
-        net = raw_netlists[net_id]
-        for index, (blk_id, port) in enumerate(net):
-            if blk_id[0] == "r" and port == "out":
-                for b_id, b_port in net:
-                    if b_id == blk_id and port == b_port:
-                        continue
-                    if b_id[0] == "r":
-                        # oh damn
-                        dont_absorb.add(blk_id)
-                    elif b_id[0] == "p":
-                        if blk_id not in connected_pe_tiles:
-                            connected_pe_tiles[blk_id] = set()
-                        connected_pe_tiles[blk_id].add((b_id, b_port))
+    for blk_id in blk_pins:
+        if blk_id[0] != "r":
+            continue
+        for net_id, index in blk_pins[blk_id]:
+            net = raw_netlists[net_id]
+            port = net[index][1]
+            if port != "out":
+                continue
+            for b_id, b_port in net:
+                if b_id == blk_id and port == b_port:
+                    continue
+                if b_id[0] == "r":
+                    # oh damn
+                    dont_absorb.add(blk_id)
+                elif b_id[0] == "p":
+                    if blk_id not in connected_pe_tiles:
+                        connected_pe_tiles[blk_id] = set()
+                    connected_pe_tiles[blk_id].add((b_id, b_port))
 
     for blk_id in connected_pe_tiles:
         connected = connected_pe_tiles[blk_id]
@@ -395,7 +515,7 @@ def pack_netlists(raw_netlists, name_to_id, fold_reg=True):
             # you can't drive two PE tiles. damn
             dont_absorb.add(blk_id)
 
-    for net_id in netlist_ids:
+    for net_id in raw_netlists:
         net = raw_netlists[net_id]
         remove_blks = set()
         for index, (blk_id, port) in enumerate(net):
@@ -409,7 +529,8 @@ def pack_netlists(raw_netlists, name_to_id, fold_reg=True):
                 next_blk, next_port = net[next_index]
             # replace them if they're already folded
             if (blk_id, port) in folded_blocks:
-                net[index] = folded_blocks[blk_id]
+                replace_pin(blk_pins, net_id, net, index,
+                            folded_blocks[blk_id])
                 continue
             if blk_id[0] == "c" or blk_id[0] == "b":
                 # FIXME:
@@ -441,12 +562,16 @@ def pack_netlists(raw_netlists, name_to_id, fold_reg=True):
                 elif blk_id in dont_absorb:
                     changed_pe.add(blk_id)
 
-        for entry in remove_blks:
-            blk_id = entry[0]
-            # print("Absorb", id_to_name[blk_id], "to", entry[1])
-            item = (entry[0], entry[2])
-            net.remove(item)
-            assert (blk_id not in changed_pe)
+        if remove_blks:
+            # pin indices shift after removal. only re-index this net
+            unindex_net(blk_pins, net_id, net)
+            for entry in remove_blks:
+                blk_id = entry[0]
+                # print("Absorb", id_to_name[blk_id], "to", entry[1])
+                item = (entry[0], entry[2])
+                net.remove(item)
+                assert (blk_id not in changed_pe)
+            index_net(blk_pins, net_id, net)
 
         assert(len(net) > 0)
 
@@ -459,15 +584,19 @@ def pack_netlists(raw_netlists, name_to_id, fold_reg=True):
         # print("Remove net_id:", net_id, "->".join(
         #     ["{}::{}".format(id_to_name[blk], port)
         #     for blk, port in raw_netlists[net_id]]), file=sys.stderr)
-        raw_netlists.pop(net_id, None)
+        if net_id in raw_netlists:
+            unindex_net(blk_pins, net_id, raw_netlists.pop(net_id))
 
     # second pass to reconnect nets
-    for net_id in raw_netlists:
-        net = raw_netlists[net_id]
-        for index, (blk_id, port) in enumerate(net):
-            if port == "in" and (blk_id, "out") in folded_blocks:
+    for blk_id, port in folded_blocks:
+        if port != "out" or blk_id not in blk_pins:
+            continue
+        for net_id, index in list(blk_pins[blk_id]):
+            net = raw_netlists[net_id]
+            if net[index][1] == "in":
                 # replace with new folded blocks
-                net[index] = folded_blocks[(blk_id, "out")]
+                replace_pin(blk_pins, net_id, net, index,
+                            folded_blocks[(blk_id, "out")])
 
     # Keyi:
     # Improved routing so that we are able to allow src -> reg -> reg
@@ -480,24 +609,23 @@ def pack_netlists(raw_netlists, name_to_id, fold_reg=True):
     for blk_id in changed_pe:
         print("Change", id_to_name[blk_id], "to a PE tile")
         # rewrite the nets
-        for net_id in raw_netlists:
+        for net_id, index in list(blk_pins.get(blk_id, [])):
             net = raw_netlists[net_id]
-            for index, (b_id, port) in enumerate(net):
-                if b_id == blk_id and port == "in":
-                    # always fold at data0 port
-                    b_id = "p" + b_id[1:]
-                    net[index] = (b_id, "data0")
-                elif b_id == blk_id and port == "out":
-                    b_id = "p" + b_id[1:]
-                    net[index] = (b_id, "out")
+            b_id, port = net[index]
+            if port == "in":
+                # always fold at data0 port
+                b_id = "p" + b_id[1:]
+                replace_pin(blk_pins, net_id, net, index, (b_id, "data0"))
+            elif port == "out":
+                b_id = "p" + b_id[1:]
+                replace_pin(blk_pins, net_id, net, index, (b_id, "out"))
 
     if fold_reg:
         # last pass to change any un-folded register's port to "reg"
-        for net_id in raw_netlists:
-            net = raw_netlists[net_id]
-            for index, (blk_id, port) in enumerate(net):
-                if blk_id[0] == "r" and blk_id not in changed_pe:
-                    net[index] = (blk_id, "reg")
+        for blk_id in blk_pins:
+            if blk_id[0] == "r" and blk_id not in changed_pe:
+                for net_id, index in blk_pins[blk_id]:
+                    raw_netlists[net_id][index] = (blk_id, "reg")
     else:
         assert (len(changed_pe) == len(dont_absorb))
         for net_id in raw_netlists:
@@ -508,9 +636,52 @@ def pack_netlists(raw_netlists, name_to_id, fold_reg=True):
     return raw_netlists, folded_blocks, changed_pe
 
 
-def change_name_to_id(instances):
+def match_net_ids(netlists, prev_netlists):
+    """
+    renames the nets after the nets from a previous packing result that are
+    driven by the same pin, and numbers the new nets after the previous ones.
+    returns the renamed netlists along with the added, removed, and changed
+    net ids
+    """
+    prev_net_ids = {}
+    for net_id in prev_netlists:
+        prev_net_ids[prev_netlists[net_id][0]] = net_id
+    net_count = max([int(net_id[1:]) for net_id in prev_netlists] + [-1]) + 1
+
+    new_netlists = {}
+    added = []
+    changed = []
+    net_ids = list(netlists.keys())
+    net_ids.sort(key=lambda x: int(x[1:]))
+    for net_id in net_ids:
+        net = netlists[net_id]
+        if net[0] in prev_net_ids:
+            new_net_id = prev_net_ids.pop(net[0])
+            if set(net) != set(prev_netlists[new_net_id]):
+                changed.append(new_net_id)
+        else:
+            new_net_id = "e" + str(net_count)
+            net_count += 1
+            added.append(new_net_id)
+        new_netlists[new_net_id] = net
+    removed = list(prev_net_ids.values())
+    removed.sort(key=lambda x: int(x[1:]))
+    changed.sort(key=lambda x: int(x[1:]))
+    return new_netlists, added, removed, changed
+
+
+def change_name_to_id(instances, prev_id_to_name=None):
+    """
+    assigns block ids by the sorted instance names. if prev_id_to_name is
+    given, instances from the previous packing result keep their numbers and
+    only new instances get new ones
+    """
+    prev_ids = {}
+    if prev_id_to_name is not None:
+        for blk_id in prev_id_to_name:
+            prev_ids[prev_id_to_name[blk_id]] = int(blk_id[1:])
     name_to_id = {}
-    id_count = 0
+    id_count = max(list(prev_ids.values()) + [-1]) + 1
     instances_name = list(instances.keys())
     instances_name.sort()
     for name in instances_name:
@@ -542,20 +713,19 @@ def change_name_to_id(instances):
                 blk_type = "r"
             else:
                 raise Exception("Unknown instance type", instance_type)
-        blk_id = blk_type + str(id_count)
-        id_count += 1
+        if name in prev_ids:
+            blk_id = blk_type + str(prev_ids[name])
+        else:
+            blk_id = blk_type + str(id_count)
+            id_count += 1
         name_to_id[name] = blk_id
     return name_to_id
 
 
 def read_netlist_json(netlist_filename):
     assert (os.path.isfile(netlist_filename))
-    with open(netlist_filename) as f:
-        raw_data = json.load(f)
-    namespace = raw_data["namespaces"]
-    # load design names
-    top = raw_data["top"].split(".")[-1]
-    design = namespace["global"]["modules"][top]
+    # only the top module is loaded
+    design = load_top_module(netlist_filename)
     instances = design["instances"]
     connections = design["connections"]
     # the standard json input is not a netlist
@@ -564,12 +734,7 @@ def read_netlist_json(netlist_filename):
 
 
 def load_unmapped_netlist(netlist_filename):
-    with open(netlist_filename) as f:
-        data = json.load(f)
-
-    # load design names
-    top = data["top"].split(".")[-1]
-    design = data["namespaces"]["global"]["modules"][top]
+    design = load_top_module(netlist_filename)
     instances = design["instances"]
     connections = design["connections"]
 
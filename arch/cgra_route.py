@@ -1,111 +1,145 @@
 from __future__ import print_function
 from lxml import etree
+from six.moves import intern
 import sys
 
+# the same wire names show up in every tile, so decoded wires are cached.
+# the cache is cleared once it holds WIRE_CACHE_SIZE names
+WIRE_CACHE_SIZE = 1 << 16
+WIRE_CACHE = {}
+
+
+def intern_text(elem):
+    # empty elements such as <src/> have no text
+    if elem.text is None:
+        return None
+    return intern(elem.text)
+
+
+def iter_cgra_tiles(cgra_file):
+    """yields the tile elements of a cgra_info file as they are parsed. a
+       tile is freed once the next one is requested, so only one tile is kept
+       in memory at a time"""
+    for _, tile_elem in etree.iterparse(cgra_file, events=("end",),
+                                        tag="tile"):
+        yield tile_elem
+        tile_elem.clear()
+        while tile_elem.getprevious() is not None:
+            del tile_elem.getparent()[0]
+
 
 def parse_routing_resource(cgra_file):
     """build routing resource files based on the CGRA definition
        returns resources indexed by """
-    root = etree.parse(cgra_file)
     result = {}
-    for tile_elem in root.iter("tile"):
-        tile_attr = tile_elem.attrib
-        if tile_attr["type"] == "gst":
+    for tile_elem in iter_cgra_tiles(cgra_file):
+        entry = parse_tile_routing_resource(tile_elem)
+        if entry is None:
             # don't care about gst for now
             break
-        address = int(tile_attr["tile_addr"], 16)
-        # random gst stuff
-        if "row" not in tile_attr:
-            raise Exception("Unable to find row/col at tile " + str(address))
-        row = int(tile_attr["row"])
-        col = int(tile_attr["col"])
-        # get tri elem
-        tri = tile_elem.find("tri")
-        if tri is None:
-            # more complicated routing is here
-
-            # connection box
-            cb_bus = {}
-            for cb_elem in tile_elem.iter("cb"):
-                bus = cb_elem.attrib["bus"]
-                mux_elem = cb_elem.find("mux")
-                if mux_elem is None:
-                    raise Exception("mux is none for tile " + str(address))
-                sink = mux_elem.attrib["snk"]
+        pos, resource = entry
+        result[pos] = resource
+    return result
+
+
+def parse_tile_routing_resource(tile_elem):
+    """returns the (col, row) and routing resource of the tile, or None if it
+       is a gst tile"""
+    tile_attr = tile_elem.attrib
+    if tile_attr["type"] == "gst":
+        return None
+    address = int(tile_attr["tile_addr"], 16)
+    # random gst stuff
+    if "row" not in tile_attr:
+        raise Exception("Unable to find row/col at tile " + str(address))
+    row = int(tile_attr["row"])
+    col = int(tile_attr["col"])
+    # get tri elem
+    tri = tile_elem.find("tri")
+    if tri is None:
+        # more complicated routing is here
+
+        # connection box
+        cb_bus = {}
+        for cb_elem in tile_elem.iter("cb"):
+            bus = cb_elem.attrib["bus"]
+            mux_elem = cb_elem.find("mux")
+            if mux_elem is None:
+                raise Exception("mux is none for tile " + str(address))
+            sink = intern(mux_elem.attrib["snk"])
+            sink_connections = set()
+            # find all tracks connected to the sink
+            for src_elem in mux_elem.iter("src"):
+                sink_connections.add(intern_text(src_elem))
+
+            # add it to cb bus collection
+            if bus not in cb_bus:
+                cb_bus[bus] = {}
+            cb_bus[bus][sink] = sink_connections
+
+        # switch box
+        sb_bus = {}
+        for sb_elem in tile_elem.iter("sb"):
+            bus = sb_elem.attrib["bus"]
+            sb_entry = {"mux": {}, "reg": set()}
+            # we will have reg and mux
+            for mux_elem in sb_elem.iter("mux"):
+                sink = intern(mux_elem.attrib["snk"])
                 sink_connections = set()
                 # find all tracks connected to the sink
                 for src_elem in mux_elem.iter("src"):
-                    sink_connections.add(src_elem.text)
-
-                # add it to cb bus collection
-                if bus not in cb_bus:
-                    cb_bus[bus] = {}
-                cb_bus[bus][sink] = sink_connections
-
-            # switch box
-            sb_bus = {}
-            for sb_elem in tile_elem.iter("sb"):
-                bus = sb_elem.attrib["bus"]
-                sb_entry = {"mux": {}, "reg": set()}
-                # we will have reg and mux
-                for mux_elem in sb_elem.iter("mux"):
-                    sink = mux_elem.attrib["snk"]
-                    sink_connections = set()
-                    # find all tracks connected to the sink
-                    for src_elem in mux_elem.iter("src"):
-                        sink_connections.add(src_elem.text)
-                    sb_entry["mux"][sink] = sink_connections
-                for reg_elem in sb_elem.iter("reg"):
-                    src = reg_elem.attrib["src"]
-                    sb_entry["reg"].add(src)
-
-                if bus in sb_bus:
-                    sb_bus[bus]["mux"].update(sb_entry["mux"])
-                    sb_bus[bus]["reg"] = sb_bus[bus]["reg"].union(
-                        sb_entry["reg"]
-                    )
-                else:
-                    sb_bus[bus] = sb_entry
-
-            # put into result, using (col, row) as an index
-            result[(col, row)] = {"cb": cb_bus, "sb": sb_bus}
+                    sink_connections.add(intern_text(src_elem))
+                sb_entry["mux"][sink] = sink_connections
+            for reg_elem in sb_elem.iter("reg"):
+                src = intern(reg_elem.attrib["src"])
+                sb_entry["reg"].add(src)
 
-        else:
-            # IO direction
-            io_entry = {}
-            directions = set()
-            for direction in tri.iter("direction"):
-                directions.add(direction.text)
-            io_entry["directions"] = directions
-
-            # IO input and outputs
-            input_elem = tile_elem.find("f2p_1bit")
-            assert input_elem is not None, "tile " + str(address) + \
-                                           " does not have f2p_1bit element"
-
-            io_entry["input"] = set()
-            io_entry["input"].add(input_elem.text)
-            io_entry["output"] = set()
-            for output_elem in tile_elem.iter("p2f_1bit"):
-                io_entry["output"].add(output_elem.text)
-
-            # 16 bit IO
-            if tile_elem.find("p2f_wide") is not None:
-                for elem in tile_elem.findall("p2f_wide"):
-                    io_entry["output"].add(elem.text)
-                assert tile_elem.find("f2p_wide") is not None
-                for elem in tile_elem.findall("f2p_wide"):
-                    io_entry["input"].add(elem.text)
+            if bus in sb_bus:
+                sb_bus[bus]["mux"].update(sb_entry["mux"])
+                sb_bus[bus]["reg"] = sb_bus[bus]["reg"].union(
+                    sb_entry["reg"]
+                )
             else:
-                assert tile_elem.find("p2f_1bit") is not None
-                for elem in tile_elem.findall("p2f_1bit"):
-                    io_entry["output"].add(elem.text)
-                assert tile_elem.find("f2p_1bit") is not None
-                for elem in tile_elem.findall("f2p_1bit"):
-                    io_entry["input"].add(elem.text)
-
-            result[(col, row)] = io_entry
-    return result
+                sb_bus[bus] = sb_entry
+
+        # (col, row) is used as an index
+        return (col, row), {"cb": cb_bus, "sb": sb_bus}
+
+    else:
+        # IO direction
+        io_entry = {}
+        directions = set()
+        for direction in tri.iter("direction"):
+            directions.add(direction.text)
+        io_entry["directions"] = directions
+
+        # IO input and outputs
+        input_elem = tile_elem.find("f2p_1bit")
+        assert input_elem is not None, "tile " + str(address) + \
+                                       " does not have f2p_1bit element"
+
+        io_entry["input"] = set()
+        io_entry["input"].add(intern_text(input_elem))
+        io_entry["output"] = set()
+        for output_elem in tile_elem.iter("p2f_1bit"):
+            io_entry["output"].add(intern_text(output_elem))
+
+        # 16 bit IO
+        if tile_elem.find("p2f_wide") is not None:
+            for elem in tile_elem.findall("p2f_wide"):
+                io_entry["output"].add(intern_text(elem))
+            assert tile_elem.find("f2p_wide") is not None
+            for elem in tile_elem.findall("f2p_wide"):
+                io_entry["input"].add(intern_text(elem))
+        else:
+            assert tile_elem.find("p2f_1bit") is not None
+            for elem in tile_elem.findall("p2f_1bit"):
+                io_entry["output"].add(intern_text(elem))
+            assert tile_elem.find("f2p_1bit") is not None
+            for elem in tile_elem.findall("f2p_1bit"):
+                io_entry["input"].add(intern_text(elem))
+
+        return (col, row), io_entry
 
 
 def convert_bus_to_tuple(wire):
@@ -150,6 +184,20 @@ def convert_bus_to_tuple(wire):
     return bus, in_out, side, track
 
 
+def decode_wire(wire):
+    """cached convert_bus_to_tuple. the same wire name always gives the same
+       tuple object"""
+    try:
+        return WIRE_CACHE[wire]
+    except KeyError:
+        pass
+    wire_info = convert_bus_to_tuple(wire)
+    if len(WIRE_CACHE) >= WIRE_CACHE_SIZE:
+        WIRE_CACHE.clear()
+    WIRE_CACHE[wire] = wire_info
+    return wire_info
+
+
 def build_routing_resource(parsed_resource):
     """build routing resource so that we can pass it to a generic router
        raw string representation will be changed to
@@ -167,7 +215,7 @@ def build_routing_resource(parsed_resource):
             input_channels = entry["input"]
             output_channels = entry["output"]
             for wire_info in input_channels:
-                wire = convert_bus_to_tuple(wire_info)
+                wire = decode_wire(wire_info)
                 if wire is not None:
                     assert wire[1] == 0
                     if wire[0] == 1:
@@ -176,7 +224,7 @@ def build_routing_resource(parsed_resource):
                         sink = "in"
                     operands[sink].add(wire)
             for wire_info in output_channels:
-                wire = convert_bus_to_tuple(wire_info)
+                wire = decode_wire(wire_info)
                 if wire is not None:
                     assert wire[1] == 1
                     if wire[0] == 1:
@@ -211,7 +259,7 @@ def build_routing_resource(parsed_resource):
                 operands[sink] = set()
                 wires = entry["cb"][bus][sink]
                 for wire in wires:
-                    wire_info = convert_bus_to_tuple(wire)
+                    wire_info = decode_wire(wire)
                     if wire_info is not None:
                         operands[sink].add(wire_info)
                         port_io[sink] = 0
@@ -219,11 +267,11 @@ def build_routing_resource(parsed_resource):
         for bus in entry["sb"]:
             muxes = entry["sb"][bus]["mux"]
             for sink in muxes:
-                sink_wire = convert_bus_to_tuple(sink)
+                sink_wire = decode_wire(sink)
                 if sink not in connections:
                     connections[sink] = set()
                 for wire in muxes[sink]:
-                    sink_info = convert_bus_to_tuple(wire)
+                    sink_info = decode_wire(wire)
                     if sink_info is not None:
                         connections[sink].add(sink_info)
                     elif wire == "pe_out_res":
@@ -245,7 +293,7 @@ def build_routing_resource(parsed_resource):
         # build real routing resources on the chip
         route_resource = set()
         for w1 in connections:
-            w1_info = convert_bus_to_tuple(w1)
+            w1_info = decode_wire(w1)
             for w2 in connections[w1]:
                 # NOTE:
                 # we might not use all the mem routing resource, which allows
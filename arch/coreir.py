@@ -0,0 +1,205 @@
+"""
+Incremental CoreIR JSON reader. Mapped designs ship with every namespace,
+generator and library module, yet the packer only needs the instances and
+connections of the top module. The reader walks the file chunk by chunk,
+skips everything else without building Python objects, and only decodes
+the values it is asked for.
+"""
+from __future__ import print_function
+import io
+import json
+import re
+
+CHUNK_SIZE = 1 << 16
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+# everything up to the next bracket, with complete strings consumed as a whole
+SKIP_RUN = re.compile(r"(?:[^\"{}\[\]]+|\"[^\"\\]*(?:\\.[^\"\\]*)*\")*",
+                      re.DOTALL)
+# body of a string after the opening quote, including the closing quote
+STRING_BODY = re.compile(r"[^\"\\]*(?:\\.[^\"\\]*)*\"", re.DOTALL)
+SCALAR = re.compile(r"[^,:\]} \t\n\r]*")
+DECODER = json.JSONDecoder()
+
+
+class JSONStreamReader(object):
+    """reads JSON values from a file object without loading the whole file.
+       consumed text is discarded whenever a new chunk is read, unless it is
+       part of the value that is being decoded
+    """
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        self._f = f
+        self._chunk_size = chunk_size
+        self._buf = ""
+        self._pos = 0
+        self._mark = None
+
+    def _fill(self, size=None):
+        chunk = self._f.read(self._chunk_size if size is None else size)
+        if not chunk:
+            return False
+        start = self._pos if self._mark is None else self._mark
+        self._buf = self._buf[start:] + chunk
+        self._pos -= start
+        if self._mark is not None:
+            self._mark = 0
+        return True
+
+    def _peek(self):
+        while True:
+            self._pos = WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of JSON file")
+
+    def _expect(self, token):
+        c = self._peek()
+        if c != token:
+            raise ValueError("Expect " + token + " got " + c)
+        self._pos += 1
+
+    def _skip_string_body(self):
+        while True:
+            match = STRING_BODY.match(self._buf, self._pos)
+            if match is not None:
+                self._pos = match.end()
+                return
+            if not self._fill():
+                raise ValueError("Unterminated JSON string")
+
+    def read_string(self):
+        self._expect('"')
+        start = self._pos
+        self._mark = start - 1
+        self._skip_string_body()
+        start = self._mark + 1
+        self._mark = None
+        value, _ = json.decoder.scanstring(self._buf, start)
+        return value
+
+    def skip_value(self):
+        c = self._peek()
+        if c == '"':
+            self._pos += 1
+            self._skip_string_body()
+            return
+        if c != "{" and c != "[":
+            # number, true, false or null
+            while True:
+                match = SCALAR.match(self._buf, self._pos)
+                if match.end() < len(self._buf) or not self._fill():
+                    self._pos = match.end()
+                    return
+        depth = 0
+        while True:
+            self._pos = SKIP_RUN.match(self._buf, self._pos).end()
+            if self._pos == len(self._buf) or self._buf[self._pos] == '"':
+                # either out of data or a string is cut by the chunk
+                if not self._fill():
+                    raise ValueError("Unexpected end of JSON file")
+                continue
+            token = self._buf[self._pos]
+            self._pos += 1
+            if token == "{" or token == "[":
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return
+
+    def read_value(self):
+        """decodes the next value. only the text of this value is kept in
+           memory while it is being read
+        """
+        self._peek()
+        while True:
+            try:
+                value, end = DECODER.raw_decode(self._buf, self._pos)
+            except ValueError:
+                end = None
+            if end is not None and end < len(self._buf):
+                self._pos = end
+                return value
+            # the value is cut by the chunk. grow the buffer geometrically
+            # so that large values are not decoded over and over again
+            self._mark = self._pos
+            size = max(self._chunk_size, len(self._buf) - self._pos)
+            has_more = self._fill(size)
+            self._mark = None
+            if not has_more:
+                if end is None:
+                    raise ValueError("Unable to decode JSON value")
+                self._pos = end
+                return value
+
+    def iter_object(self):
+        """yields the keys of the next object. the value of each key has to
+           be consumed, either read or skipped, before asking for the next key
+        """
+        self._expect("{")
+        if self._peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self.read_string()
+            self._expect(":")
+            yield key
+            c = self._peek()
+            self._pos += 1
+            if c == "}":
+                return
+            if c != ",":
+                raise ValueError("Expect , or } got " + c)
+
+
+def scan_top_module(reader, top_name=None):
+    top = None
+    design = None
+    for key in reader.iter_object():
+        if key == "top":
+            top = reader.read_value()
+            if top_name is None:
+                top_name = top.split(".")[-1]
+        elif key == "namespaces" and top_name is not None:
+            for namespace in reader.iter_object():
+                if namespace != "global":
+                    reader.skip_value()
+                    continue
+                for entry in reader.iter_object():
+                    if entry != "modules":
+                        reader.skip_value()
+                        continue
+                    for module_name in reader.iter_object():
+                        if module_name != top_name:
+                            reader.skip_value()
+                            continue
+                        design = {}
+                        for attr in reader.iter_object():
+                            if attr == "instances" or attr == "connections":
+                                design[attr] = reader.read_value()
+                            else:
+                                reader.skip_value()
+                        # no need to read the rest of the file
+                        return top, design
+        else:
+            reader.skip_value()
+    return top, design
+
+
+def load_top_module(netlist_filename, chunk_size=CHUNK_SIZE):
+    """returns the top module with only its instances and connections"""
+    with io.open(netlist_filename, encoding="utf-8") as f:
+        top, design = scan_top_module(JSONStreamReader(f, chunk_size))
+        if design is None and top is not None:
+            # top is declared after the namespaces. need another pass now
+            # that we know its name
+            f.seek(0)
+            _, design = scan_top_module(JSONStreamReader(f, chunk_size),
+                                        top.split(".")[-1])
+    if top is None:
+        raise Exception("Unable to find top in " + netlist_filename)
+    if design is None:
+        raise Exception("Unable to find top module " + top + " in " +
+                        netlist_filename)
+    return design
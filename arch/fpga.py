@@ -118,7 +118,7 @@ def convert_netlist(board_layout, raw_result, ripple_result, skip_clk_net=True):
 
 def save_packed_netlist(arch_file, design_net_file, placement_file,
                         output_file):
-    board_layout = arch.parse_fpga(arch_file)["fpga"][0]
+    board_layout, _ = arch.parse_fpga_sites(arch_file)
 
     raw_result = parse_raw_netlist(design_net_file)
     ripple_result = parse_ripple_placer(placement_file)
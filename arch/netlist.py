@@ -1,4 +1,5 @@
 import six
+from collections import deque
 
 
 def group_reg_nets(netlists):
@@ -6,16 +7,22 @@ def group_reg_nets(netlists):
     linked_nets = {}
 
     reg_srcs = {}
-    reg_srcs_nets = set()
+    # reg id -> nets that are not driven by a reg but drive that reg
+    reg_drivers = {}
     # first pass to find any nets whose sources are a reg
     for net_id in netlists:
         net = netlists[net_id]
         if net[0][0][0] == "r":
             reg_id = net[0][0]
             reg_srcs[reg_id] = net_id
-            reg_srcs_nets.add(net_id)
             # also means we have to remove it from the main netlists
             net_id_to_remove.add(net_id)
+    for net_id in netlists:
+        if net_id in net_id_to_remove:
+            continue
+        for blk_id, _ in netlists[net_id]:
+            if blk_id in reg_srcs:
+                reg_drivers.setdefault(blk_id, []).append(net_id)
 
     # Keyi:
     # because a reg cannot drive more than one wire (otherwise they will be
@@ -24,62 +31,35 @@ def group_reg_nets(netlists):
     # it is possible to have reg (src) -> reg (sink) and both of them are
     # unfolded, we need to create a list of nets in order that's going to be
     # merged into the main net.
-
-    def squash_net(nets, src_id):
-        result = [src_id]
-        for b_id, _ in nets[src_id][1:]:
-            if b_id[0] == "r":
-                # found another one
-                next_id = reg_srcs[b_id]
-                result += squash_net(nets, next_id)
-        return result
-
+    # starting from the ultimate src, the reg nets are visited breadth-first
+    # so that each net is merged after the net that drives it
+    reg_net_order = {}
     resolved_net = set()
     for reg_id in reg_srcs:
-        r_net_id = reg_srcs[reg_id]
-        if r_net_id in resolved_net:
+        if reg_srcs[reg_id] in resolved_net:
             continue
-        # search for the ultimate src
-        reg = netlists[r_net_id][0][0]  # id for that reg
-        for net_id in netlists:
-            if net_id in reg_srcs_nets:
+        for net_id in reg_drivers.get(reg_id, []):
+            if net_id in linked_nets:
                 continue
-            net = netlists[net_id]
-            for blk_id, _ in net:
-                if blk_id == reg:
-                    # found the ultimate src
-                    # now do a squash to obtain the set of all nets
-                    merged_nets = squash_net(netlists, r_net_id)
-                    for m_id in merged_nets:
-                        resolved_net.add(m_id)
-                    if net_id in linked_nets:
-                        linked_nets[net_id] += merged_nets
-                    else:
-                        linked_nets[net_id] = merged_nets
+            reg_nets = []
+            working_set = deque([net_id])
+            while len(working_set) > 0:
+                n_id = working_set.popleft()
+                for blk, _ in netlists[n_id][1:]:
+                    if blk not in reg_srcs:
+                        continue
+                    reg_net_id = reg_srcs[blk]
+                    if reg_net_id in reg_net_order:
+                        continue
+                    working_set.append(reg_net_id)
+                    reg_nets.append(reg_net_id)
+                    reg_net_order[reg_net_id] = n_id
+            resolved_net.update(reg_nets)
+            linked_nets[net_id] = reg_nets
 
     # make sure we've merged every nets
     assert(len(resolved_net) == len(net_id_to_remove))
 
-    # last pass to ensure the order of the linked nets is correct
-    reg_net_order = {}
-    for net_id in linked_nets:
-        reg_nets = linked_nets[net_id]
-        reg_net_index = {}
-        index = 0
-        working_set = [net_id]
-        while len(working_set) > 0:
-            n_id = working_set.pop(0)
-            for blk, _ in netlists[n_id][1:]:
-                if blk[0] == "r":
-                    # find the reg_net that has it as src
-                    for reg_net_id in reg_nets:
-                        if netlists[reg_net_id][0][0] == blk:
-                            working_set.append(reg_net_id)
-                            reg_net_index[reg_net_id] = index
-                            index += 1
-                            reg_net_order[reg_net_id] = n_id
-        reg_nets.sort(key=lambda x: reg_net_index[x])
-
     return linked_nets, net_id_to_remove, reg_net_order
 
 
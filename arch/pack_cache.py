@@ -0,0 +1,92 @@
+"""
+Content-addressed cache for packing results. An entry is keyed on the hash of
+the CoreIR JSON, the fold_reg flag and PACKER_VERSION, and holds the text
+packed file plus its binary sidecar if one was written.
+"""
+from __future__ import print_function
+import hashlib
+import os
+import shutil
+import tempfile
+from .packed_binary import get_binary_filename, load_packed_binary
+
+# bump this whenever the packer produces a different result for the same
+# input, so that stale entries are not reused
+PACKER_VERSION = 1
+CACHE_SIZE = 256 << 20
+PACKED_NAME = "design.packed"
+
+
+def get_cache_key(netlist_filename, fold_reg):
+    sha = hashlib.sha256()
+    with open(netlist_filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    sha.update("fold_reg={} version={}".format(fold_reg,
+                                               PACKER_VERSION).encode())
+    return sha.hexdigest()
+
+
+def get_entry_size(entry_dir):
+    return sum([os.path.getsize(os.path.join(entry_dir, filename))
+                for filename in os.listdir(entry_dir)])
+
+
+def load_from_cache(cache_dir, key, pack_filename):
+    """copies the cached result to pack_filename. returns False if there is
+       no such entry"""
+    entry_dir = os.path.join(cache_dir, key)
+    cached_packed = os.path.join(entry_dir, PACKED_NAME)
+    if not os.path.isfile(cached_packed):
+        return False
+    # copy2 keeps the mtime, which the sidecar is stamped with
+    shutil.copy2(cached_packed, pack_filename)
+    cached_binary = get_binary_filename(cached_packed)
+    if os.path.isfile(cached_binary):
+        shutil.copy2(cached_binary, get_binary_filename(pack_filename))
+    # mark the entry as recently used
+    os.utime(entry_dir, None)
+    return True
+
+
+def save_to_cache(cache_dir, key, pack_filename, max_size=CACHE_SIZE):
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    entry_dir = os.path.join(cache_dir, key)
+    # populate a temporary entry first so that concurrent packers never see
+    # a partial entry
+    tmp_dir = tempfile.mkdtemp(dir=cache_dir, prefix=".tmp")
+    cached_packed = os.path.join(tmp_dir, PACKED_NAME)
+    shutil.copy2(pack_filename, cached_packed)
+    binary_filename = get_binary_filename(pack_filename)
+    if load_packed_binary(pack_filename) is not None:
+        shutil.copy2(binary_filename, get_binary_filename(cached_packed))
+    try:
+        os.rename(tmp_dir, entry_dir)
+    except OSError:
+        # some other process has saved the same entry
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    evict_cache(cache_dir, max_size)
+
+
+def evict_cache(cache_dir, max_size=CACHE_SIZE):
+    """removes the least recently used entries until the cache fits in
+       max_size bytes. returns the number of removed entries"""
+    entries = []
+    total_size = 0
+    for key in os.listdir(cache_dir):
+        entry_dir = os.path.join(cache_dir, key)
+        if key.startswith(".") or not os.path.isdir(entry_dir):
+            continue
+        size = get_entry_size(entry_dir)
+        entries.append((os.path.getmtime(entry_dir), size, entry_dir))
+        total_size += size
+    entries.sort()
+    num_removed = 0
+    for _, size, entry_dir in entries:
+        if total_size <= max_size:
+            break
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        total_size -= size
+        num_removed += 1
+    return num_removed
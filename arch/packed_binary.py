@@ -0,0 +1,177 @@
+"""
+Binary sidecar for the packed netlist. The text .packed file stays the
+canonical format shared with the C++ tools, while the sidecar keeps the same
+content with interned strings and CSR arrays so that Python tools can mmap it
+instead of re-parsing the text file.
+
+Layout (little-endian, every section is a uint32 array unless noted):
+    header
+    net_ids         num_nets
+    net_ptr         num_nets + 1
+    pin_blks        num_pins
+    pin_ports       num_pins
+    folded_ptr      2 * num_folded + 1, key and value tuples of folded blocks
+    folded_items    num_folded_items
+    name_ids        num_names
+    name_values     num_names
+    changed_pe      num_changed
+    bus_nets        num_bus
+    bus_widths      num_bus
+    strings         string_bytes, utf-8 strings separated by new lines
+"""
+from __future__ import print_function
+import array
+import mmap
+import os
+import struct
+import sys
+
+MAGIC = b"CGRAPACK"
+VERSION = 1
+# magic, version, text file size, text file mtime (ns), then section sizes:
+# num_strings, string_bytes, num_nets, num_pins, num_folded,
+# num_folded_items, num_names, num_changed, num_bus
+HEADER = struct.Struct("<8sIQQ9I")
+
+
+def get_binary_filename(pack_filename):
+    return pack_filename + ".bin"
+
+
+def get_text_stamp(pack_filename):
+    stat = os.stat(pack_filename)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def save_packed_binary(pack_filename, netlists, folded_blocks, id_to_name,
+                       changed_pe, track_mode):
+    """has to be called after the text file is written, since the sidecar is
+       only valid for that exact text file"""
+    strings = []
+    string_index = {}
+
+    def intern(value):
+        value = str(value)
+        if value not in string_index:
+            assert "\n" not in value
+            string_index[value] = len(strings)
+            strings.append(value)
+        return string_index[value]
+
+    net_ids = array.array("I")
+    net_ptr = array.array("I", [0])
+    pin_blks = array.array("I")
+    pin_ports = array.array("I")
+    ids = list(netlists.keys())
+    ids.sort(key=lambda x: int(x[1:]))
+    for net_id in ids:
+        net_ids.append(intern(net_id))
+        for blk_id, port in netlists[net_id]:
+            pin_blks.append(intern(blk_id))
+            pin_ports.append(intern(port))
+        net_ptr.append(len(pin_blks))
+
+    folded_ptr = array.array("I", [0])
+    folded_items = array.array("I")
+    for entry in folded_blocks:
+        for t_val in (entry, folded_blocks[entry]):
+            folded_items.extend([intern(val) for val in t_val])
+            folded_ptr.append(len(folded_items))
+
+    name_ids = array.array("I")
+    name_values = array.array("I")
+    ids = list(id_to_name.keys())
+    ids.sort(key=lambda x: int(x[1:]))
+    for blk_id in ids:
+        name_ids.append(intern(blk_id))
+        name_values.append(intern(id_to_name[blk_id]))
+
+    changed = array.array("I", [intern(blk_id) for blk_id in changed_pe])
+    bus_nets = array.array("I")
+    bus_widths = array.array("I")
+    for net_id in track_mode:
+        bus_nets.append(intern(net_id))
+        bus_widths.append(track_mode[net_id])
+
+    string_blob = "\n".join(strings).encode("utf-8")
+    text_size, text_mtime = get_text_stamp(pack_filename)
+    header = HEADER.pack(MAGIC, VERSION, text_size, text_mtime,
+                         len(strings), len(string_blob), len(net_ids),
+                         len(pin_blks), len(folded_blocks), len(folded_items),
+                         len(name_ids), len(changed), len(bus_nets))
+    sections = [net_ids, net_ptr, pin_blks, pin_ports, folded_ptr,
+                folded_items, name_ids, name_values, changed, bus_nets,
+                bus_widths]
+    with open(get_binary_filename(pack_filename), "wb") as f:
+        f.write(header)
+        for section in sections:
+            if sys.byteorder != "little":
+                section.byteswap()
+            f.write(section.tobytes())
+        f.write(string_blob)
+
+
+def load_packed_binary(pack_filename):
+    """returns None if the sidecar does not exist or does not match the text
+       file, in which case the caller should parse the text file instead"""
+    binary_filename = get_binary_filename(pack_filename)
+    if sys.byteorder != "little" or not os.path.isfile(binary_filename) or \
+            os.path.getsize(binary_filename) < HEADER.size:
+        return None
+    with open(binary_filename, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        return read_packed_binary(mm, get_text_stamp(pack_filename))
+    finally:
+        mm.close()
+
+
+def read_packed_binary(mm, text_stamp):
+    magic, version, text_size, text_mtime, num_strings, string_bytes, \
+        num_nets, num_pins, num_folded, num_folded_items, num_names, \
+        num_changed, num_bus = HEADER.unpack_from(mm, 0)
+    if magic != MAGIC or version != VERSION or \
+            (text_size, text_mtime) != text_stamp:
+        return None
+    section_sizes = [num_nets, num_nets + 1, num_pins, num_pins,
+                     2 * num_folded + 1, num_folded_items, num_names,
+                     num_names, num_changed, num_bus, num_bus]
+    if len(mm) != HEADER.size + 4 * sum(section_sizes) + string_bytes:
+        return None
+
+    view = memoryview(mm)
+    sections = []
+    offset = HEADER.size
+    for size in section_sizes:
+        sections.append(view[offset:offset + 4 * size].cast("I").tolist())
+        offset += 4 * size
+    strings = bytes(view[offset:]).decode("utf-8").split("\n")
+    view.release()
+    assert len(strings) == num_strings or num_strings == 0
+    net_ids, net_ptr, pin_blks, pin_ports, folded_ptr, folded_items, \
+        name_ids, name_values, changed, bus_nets, bus_widths = sections
+
+    pins = list(zip([strings[i] for i in pin_blks],
+                    [strings[i] for i in pin_ports]))
+    netlists = {}
+    for index, net_id in enumerate(net_ids):
+        netlists[strings[net_id]] = pins[net_ptr[index]:net_ptr[index + 1]]
+
+    folded_blocks = {}
+    folded_tuples = [tuple([strings[i] for i in
+                            folded_items[folded_ptr[index]:
+                                         folded_ptr[index + 1]]])
+                     for index in range(2 * num_folded)]
+    for index in range(num_folded):
+        folded_blocks[folded_tuples[2 * index]] = \
+            folded_tuples[2 * index + 1]
+
+    id_to_name = {}
+    for blk_id, name in zip(name_ids, name_values):
+        id_to_name[strings[blk_id]] = strings[name]
+    changed_pe = set([strings[blk_id] for blk_id in changed])
+    track_mode = {}
+    for net_id, width in zip(bus_nets, bus_widths):
+        track_mode[strings[net_id]] = width
+
+    return netlists, folded_blocks, id_to_name, changed_pe, track_mode
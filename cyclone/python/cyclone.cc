@@ -1,5 +1,6 @@
 #include <pybind11/pybind11.h>
 #include <pybind11/stl.h>
+#include <pybind11/numpy.h>
 #include <sstream>
 #include "../src/graph.hh"
 #include "../src/route.hh"
@@ -209,6 +210,46 @@ void init_graph(py::module &m) {
              py::overload_cast<const Node &,
                                const Node &,
                                uint32_t>(&RoutingGraph::add_edge))
+        .def("add_edges", [](RoutingGraph &r,
+                             const py::array_t<uint32_t,
+                                               py::array::c_style |
+                                               py::array::forcecast> &edges,
+                             const std::vector<std::string> &names) {
+            constexpr auto edge_size = 2 * RoutingGraph::ENDPOINT_SIZE;
+            if (edges.ndim() != 2 || edges.shape(1) != edge_size)
+                throw std::runtime_error("edges has to be an N x " +
+                                         to_string(edge_size) + " array");
+            // graphs are independent, so they can be built in parallel
+            py::gil_scoped_release release;
+            r.add_edges(edges.data(), edges.shape(0), names);
+        }, py::arg("edges"), py::arg("names") = std::vector<std::string>())
+        .def("stamp_edges", [](RoutingGraph &r,
+                               const std::vector<
+                                       py::array_t<int32_t,
+                                                   py::array::c_style |
+                                                   py::array::forcecast>>
+                                       &templates,
+                               const py::array_t<uint32_t,
+                                                 py::array::c_style |
+                                                 py::array::forcecast> &stamps,
+                               const std::vector<std::string> &names) {
+            constexpr auto edge_size = 2 * RoutingGraph::ENDPOINT_SIZE;
+            ::vector<::vector<int32_t>> edges;
+            for (auto const &t: templates) {
+                if (t.ndim() != 2 || t.shape(1) != edge_size)
+                    throw std::runtime_error("template has to be an N x " +
+                                             to_string(edge_size) + " array");
+                edges.emplace_back(t.data(), t.data() + t.size());
+            }
+            if (stamps.ndim() != 2 ||
+                stamps.shape(1) != RoutingGraph::STAMP_SIZE)
+                throw std::runtime_error("stamps has to be an N x " +
+                                         to_string(RoutingGraph::STAMP_SIZE) +
+                                         " array");
+            py::gil_scoped_release release;
+            r.stamp_edges(edges, stamps.data(), stamps.shape(0), names);
+        }, py::arg("templates"), py::arg("stamps"),
+           py::arg("names") = std::vector<std::string>())
 
         .def("get_sb", &RoutingGraph::get_sb)
         .def("get_port", &RoutingGraph::get_port)
@@ -294,8 +335,17 @@ void init_util(py::module &m) {
 
 void init_io(py::module &m) {
     auto io_m = m.def_submodule("io");
-    io_m.def("dump_routing_graph", &dump_routing_graph)
-        .def("load_routing_graph", &load_routing_graph)
+    io_m.def("dump_routing_graph", &dump_routing_graph,
+             py::call_guard<py::gil_scoped_release>())
+        .def("load_routing_graph", &load_routing_graph,
+             py::call_guard<py::gil_scoped_release>())
+        .def("dump_routing_graph_binary", &dump_routing_graph_binary,
+             py::call_guard<py::gil_scoped_release>())
+        .def("load_routing_graph_binary", &load_routing_graph_binary,
+             py::call_guard<py::gil_scoped_release>())
+        .def("is_binary_routing_graph", &is_binary_routing_graph)
+        .def("convert_routing_graph", &convert_routing_graph,
+             py::call_guard<py::gil_scoped_release>())
         .def("load_placement", &load_placement)
         .def("load_netlist", &load_netlist)
         .def("dump_routing_result", &dump_routing_result)
@@ -1,6 +1,7 @@
 #include "graph.hh"
 #include "net.hh"
 #include "util.hh"
+#include <array>
 #include <cassert>
 #include <sstream>
 #include <string>
@@ -267,8 +268,134 @@ void RoutingGraph::add_edge(const Node &node1, const Node &node2,
                             uint32_t wire_delay) {
     // we don't use the nodes passed in, instead, we manage our own node
     // internally
-    auto n1 = search_create_node(node1);
-    auto n2 = search_create_node(node2);
+    add_edge(search_create_node(node1), search_create_node(node2),
+             wire_delay);
+}
+
+void RoutingGraph::add_edges(const uint32_t *edges, uint64_t num_edges,
+                             const std::vector<std::string> &names) {
+    for (uint64_t i = 0; i < num_edges; i++) {
+        auto const *edge = edges + i * 2 * ENDPOINT_SIZE;
+        auto const *edge_end = edge + ENDPOINT_SIZE;
+        auto n1 = search_create_node(get_tile(edge[1], edge[2]), edge, names);
+        auto n2 = search_create_node(get_tile(edge_end[1], edge_end[2]),
+                                     edge_end, names);
+        add_edge(n1, n2, Node::DEFAULT_WIRE_DELAY);
+    }
+}
+
+namespace {
+// an edge template with duplicated endpoints and tile offsets merged
+struct ResolvedTemplate {
+    std::vector<std::pair<int32_t, int32_t>> offsets;
+    // endpoints with the index of their offset
+    std::vector<std::array<uint32_t, RoutingGraph::ENDPOINT_SIZE>> endpoints;
+    std::vector<uint32_t> endpoint_offsets;
+    std::vector<std::pair<uint32_t, uint32_t>> edges;
+};
+
+ResolvedTemplate resolve_template(const std::vector<int32_t> &edges) {
+    constexpr auto endpoint_size = RoutingGraph::ENDPOINT_SIZE;
+    if (edges.size() % (2 * endpoint_size))
+        throw ::runtime_error("template size has to be a multiple of " +
+                              ::to_string(2 * endpoint_size));
+    ResolvedTemplate result;
+    std::map<std::pair<int32_t, int32_t>, uint32_t> offset_index;
+    std::map<std::vector<int32_t>, uint32_t> endpoint_index;
+    auto get_endpoint = [&](const int32_t *endpoint) -> uint32_t {
+        std::vector<int32_t> key(endpoint, endpoint + endpoint_size);
+        auto iter = endpoint_index.find(key);
+        if (iter != endpoint_index.end())
+            return iter->second;
+        std::pair<int32_t, int32_t> offset = {endpoint[1], endpoint[2]};
+        if (offset_index.find(offset) == offset_index.end()) {
+            offset_index[offset] = static_cast<uint32_t>(
+                    result.offsets.size());
+            result.offsets.emplace_back(offset);
+        }
+        std::array<uint32_t, endpoint_size> values{};
+        for (uint32_t i = 0; i < endpoint_size; i++) {
+            if (i != 1 && i != 2 && endpoint[i] < 0)
+                throw ::runtime_error("only x and y can be negative");
+            values[i] = static_cast<uint32_t>(endpoint[i]);
+        }
+        auto const index = static_cast<uint32_t>(result.endpoints.size());
+        result.endpoints.emplace_back(values);
+        result.endpoint_offsets.emplace_back(offset_index.at(offset));
+        endpoint_index[key] = index;
+        return index;
+    };
+    for (uint64_t i = 0; i < edges.size(); i += 2 * endpoint_size) {
+        auto const from = get_endpoint(edges.data() + i);
+        auto const to = get_endpoint(edges.data() + i + endpoint_size);
+        result.edges.emplace_back(from, to);
+    }
+    return result;
+}
+}
+
+void RoutingGraph::stamp_edges(const std::vector<std::vector<int32_t>> &templates,
+                               const uint32_t *stamps, uint64_t num_stamps,
+                               const std::vector<std::string> &names) {
+    ::vector<ResolvedTemplate> resolved_templates;
+    resolved_templates.reserve(templates.size());
+    for (auto const &edges: templates)
+        resolved_templates.emplace_back(resolve_template(edges));
+
+    ::vector<Tile *> tiles;
+    ::vector<std::shared_ptr<Node>> nodes;
+    for (uint64_t i = 0; i < num_stamps; i++) {
+        auto const *stamp = stamps + i * STAMP_SIZE;
+        if (stamp[0] >= resolved_templates.size())
+            throw ::runtime_error("template index " + ::to_string(stamp[0]) +
+                                  " out of range");
+        auto const &t = resolved_templates[stamp[0]];
+        tiles.clear();
+        for (auto const &[dx, dy]: t.offsets) {
+            // negative coordinates wrap around and are reported as missing
+            // tiles
+            tiles.emplace_back(&get_tile(stamp[1] + dx, stamp[2] + dy));
+        }
+        nodes.clear();
+        for (uint64_t j = 0; j < t.endpoints.size(); j++) {
+            nodes.emplace_back(
+                    search_create_node(*tiles[t.endpoint_offsets[j]],
+                                       t.endpoints[j].data(), names));
+        }
+        for (auto const &[from, to]: t.edges)
+            add_edge(nodes[from], nodes[to], Node::DEFAULT_WIRE_DELAY);
+    }
+}
+
+void RoutingGraph::add_adjacency(const uint32_t *nodes, uint64_t num_nodes,
+                                 const uint64_t *offsets,
+                                 const uint32_t *targets,
+                                 const std::vector<std::string> &names) {
+    ::vector<std::shared_ptr<Node>> graph_nodes;
+    graph_nodes.reserve(num_nodes);
+    for (uint64_t i = 0; i < num_nodes; i++) {
+        auto const *endpoint = nodes + i * ENDPOINT_SIZE;
+        graph_nodes.emplace_back(
+                search_create_node(get_tile(endpoint[1], endpoint[2]),
+                                   endpoint, names));
+    }
+    for (uint64_t i = 0; i < num_nodes; i++) {
+        if (offsets[i] > offsets[i + 1])
+            throw ::runtime_error("adjacency offsets have to be sorted");
+        for (uint64_t j = offsets[i]; j < offsets[i + 1]; j++) {
+            if (targets[j] >= num_nodes)
+                throw ::runtime_error("node index " +
+                                      ::to_string(targets[j]) +
+                                      " out of range");
+            add_edge(graph_nodes[i], graph_nodes[targets[j]],
+                     Node::DEFAULT_WIRE_DELAY);
+        }
+    }
+}
+
+void RoutingGraph::add_edge(const std::shared_ptr<Node> &n1,
+                            const std::shared_ptr<Node> &n2,
+                            uint32_t wire_delay) {
     if (n1 == nullptr)
         throw ::runtime_error("cannot find node1");
     if (n2 == nullptr)
@@ -282,58 +409,89 @@ void RoutingGraph::add_edge(const Node &node1, const Node &node2,
     n1->add_edge(n2, wire_delay);
 }
 
-std::shared_ptr<Node> RoutingGraph::search_create_node(const Node &node) {
-    uint32_t x = node.x;
-    uint32_t y = node.y;
-
-    if (grid_.find({x, y}) == grid_.end()) {
+Tile &RoutingGraph::get_tile(uint32_t x, uint32_t y) {
+    auto tile_iter = grid_.find({x, y});
+    if (tile_iter == grid_.end()) {
         // a new tile. creating on the fly not supported any more
         ostringstream stream;
         stream << "unable to find tile at (" << x << ", " << y << ")";
         throw ::runtime_error(stream.str());
-    } else {
-        // depends on which type the nodes is. we need to
-        // treat differently
-        auto &tile = grid_.at({x, y});
-        switch (node.type) {
-            case NodeType::Register:
-                if (tile.registers.find(node.name) == tile.registers.end())
-                    tile.registers[node.name] =
-                            ::make_shared<RegisterNode>(node.name,
-                                                        node.x,
-                                                        node.y,
-                                                        node.width,
-                                                        node.track);
-                return tile.registers.at(node.name);
-            case NodeType::Port:
-                if (tile.ports.find(node.name) == tile.ports.end())
-                    tile.ports[node.name] =
-                            ::make_shared<PortNode>(node.name, node.x,
-                                                    node.y, node.width);
-                return tile.ports.at(node.name);
-            case NodeType::SwitchBox: {
-                auto const &sb_node = dynamic_cast<const SwitchBoxNode &>(node);
-                auto const &track = sb_node.track;
-                auto const &side = sb_node.side;
-                auto const &io = sb_node.io;
-                if (track > tile.switchbox.num_track)
-                    throw ::runtime_error("node is on a track that doesn't "
-                                          "exist in the switch box");
-
-                return tile.switchbox[{track, side, io}];
-            }
-            case NodeType::Generic:
-                // genetic node
-                if (tile.rmux_nodes.find(node.name)
-                    == tile.rmux_nodes.end())
-                    tile.rmux_nodes[node.name] =
-                            ::make_shared<RegisterMuxNode>(node.name,
-                                                           node.x,
-                                                           node.y,
-                                                           node.width,
-                                                           node.track);
-                return tile.rmux_nodes.at(node.name);
+    }
+    return tile_iter->second;
+}
+
+std::shared_ptr<Node> RoutingGraph::search_create_node(const Node &node) {
+    auto side = SwitchBoxSide::Right;
+    auto io = SwitchBoxIO::SB_IN;
+    if (node.type == NodeType::SwitchBox) {
+        auto const &sb_node = dynamic_cast<const SwitchBoxNode &>(node);
+        side = sb_node.side;
+        io = sb_node.io;
+    }
+    return search_create_node(get_tile(node.x, node.y), node.type,
+                              node.width, node.track, side, io, node.name);
+}
+
+std::shared_ptr<Node>
+RoutingGraph::search_create_node(Tile &tile, const uint32_t *endpoint,
+                                 const std::vector<std::string> &names) {
+    // x and y of the endpoint are already resolved into the tile
+    static const std::string empty_name;
+    auto const type = endpoint[0], width = endpoint[3], track = endpoint[4],
+               side = endpoint[5], io = endpoint[6], name = endpoint[7];
+    if (type > static_cast<uint32_t>(NodeType::Generic))
+        throw ::runtime_error("unknown node type " + ::to_string(type));
+    auto const node_type = static_cast<NodeType>(type);
+    if (node_type == NodeType::SwitchBox) {
+        if (side >= Switch::SIDES || io >= Switch::IOS)
+            throw ::runtime_error("invalid switch box side/io");
+        return search_create_node(tile, node_type, width, track,
+                                  static_cast<SwitchBoxSide>(side),
+                                  static_cast<SwitchBoxIO>(io), empty_name);
+    }
+    if (name >= names.size())
+        throw ::runtime_error("node name index " + ::to_string(name) +
+                              " out of range");
+    return search_create_node(tile, node_type, width, track,
+                              SwitchBoxSide::Right, SwitchBoxIO::SB_IN,
+                              names[name]);
+}
+
+std::shared_ptr<Node> RoutingGraph::search_create_node(Tile &tile,
+                                                       NodeType type,
+                                                       uint32_t width,
+                                                       uint32_t track,
+                                                       SwitchBoxSide side,
+                                                       SwitchBoxIO io,
+                                                       const std::string &name) {
+    auto const x = tile.x;
+    auto const y = tile.y;
+    // depends on which type the nodes is. we need to
+    // treat differently
+    switch (type) {
+        case NodeType::Register:
+            if (tile.registers.find(name) == tile.registers.end())
+                tile.registers[name] =
+                        ::make_shared<RegisterNode>(name, x, y, width, track);
+            return tile.registers.at(name);
+        case NodeType::Port:
+            if (tile.ports.find(name) == tile.ports.end())
+                tile.ports[name] = ::make_shared<PortNode>(name, x, y, width);
+            return tile.ports.at(name);
+        case NodeType::SwitchBox: {
+            if (track > tile.switchbox.num_track)
+                throw ::runtime_error("node is on a track that doesn't "
+                                      "exist in the switch box");
+
+            return tile.switchbox[{track, side, io}];
         }
+        case NodeType::Generic:
+            // genetic node
+            if (tile.rmux_nodes.find(name) == tile.rmux_nodes.end())
+                tile.rmux_nodes[name] =
+                        ::make_shared<RegisterMuxNode>(name, x, y, width,
+                                                       track);
+            return tile.rmux_nodes.at(name);
     }
     return nullptr;
 }
@@ -258,6 +258,30 @@ public:
     { add_edge(node1, node2, Node::DEFAULT_WIRE_DELAY); }
     void add_edge(const Node &node1, const Node &node2, uint32_t wire_delay);
 
+    // bulk version of add_edge that does not need node objects. every edge
+    // is two endpoints of ENDPOINT_SIZE values:
+    // (type, x, y, width, track, side, io, name)
+    // where name is an index into names, used by port, register and generic
+    // nodes. side and io are only used by switch box nodes
+    static constexpr uint32_t ENDPOINT_SIZE = 8;
+    void add_edges(const uint32_t *edges, uint64_t num_edges,
+                   const std::vector<std::string> &names);
+    // stamps edge templates across the graph. a template is a list of edges
+    // encoded the same way as add_edges, except that x and y are offsets
+    // from where the template is stamped. stamps are (template, x, y) and
+    // are applied in order. every template is resolved once, so a stamp only
+    // looks up each of its tiles and nodes once
+    static constexpr uint32_t STAMP_SIZE = 3;
+    void stamp_edges(const std::vector<std::vector<int32_t>> &templates,
+                     const uint32_t *stamps, uint64_t num_stamps,
+                     const std::vector<std::string> &names);
+    // adds edges stored as adjacency lists. nodes are endpoints encoded the
+    // same way as add_edges, and the neighbors of node i are
+    // targets[offsets[i]] to targets[offsets[i + 1] - 1], in order
+    void add_adjacency(const uint32_t *nodes, uint64_t num_nodes,
+                       const uint64_t *offsets, const uint32_t *targets,
+                       const std::vector<std::string> &names);
+
     // TODO
     // add remove edge functions
 
@@ -290,7 +314,18 @@ private:
     // grid is for fast locating the nodes. no longer used for routing
     std::map<std::pair<uint32_t, uint32_t>, Tile> grid_;
 
+    Tile &get_tile(uint32_t x, uint32_t y);
     std::shared_ptr<Node> search_create_node(const Node &node);
+    std::shared_ptr<Node> search_create_node(Tile &tile, NodeType type,
+                                             uint32_t width, uint32_t track,
+                                             SwitchBoxSide side,
+                                             SwitchBoxIO io,
+                                             const std::string &name);
+    std::shared_ptr<Node>
+    search_create_node(Tile &tile, const uint32_t *endpoint,
+                       const std::vector<std::string> &names);
+    void add_edge(const std::shared_ptr<Node> &n1,
+                  const std::shared_ptr<Node> &n2, uint32_t wire_delay);
 };
 
 // hold information for routed graph
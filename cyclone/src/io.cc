@@ -5,7 +5,13 @@
 #include <algorithm>
 #include <functional>
 #include <sstream>
+#include <unordered_map>
 #include <unordered_set>
+#include <cstring>
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
 
 using std::ifstream;
 using std::map;
@@ -69,8 +75,8 @@ load_netlist(const std::string &filename);
     return oss.str();
 }
 
-void print_conn(std::ofstream &out, const std::string &pad,
-                const std::shared_ptr<Node> &node) {
+::vector<std::shared_ptr<Node>>
+get_sorted_neighbors(const std::shared_ptr<Node> &node) {
     // need to sort them to make the dump process deterministic
     ::vector<std::shared_ptr<Node>> nodes;
     for (const auto &n : *node)
@@ -124,8 +130,12 @@ void print_conn(std::ofstream &out, const std::string &pad,
                         const std::shared_ptr<Node> &n2) {
                          return n1->y > n2->y;
                      });
+    return nodes;
+}
 
-    for (auto const &n : nodes) {
+void print_conn(std::ofstream &out, const std::string &pad,
+                const std::shared_ptr<Node> &node) {
+    for (auto const &n : get_sorted_neighbors(node)) {
         out << pad << pad << node_to_string(pad, n) << endl;
     }
 }
@@ -205,6 +215,297 @@ void dump_routing_graph(RoutingGraph &graph,
 }
 
 
+// binary graph format. every section starts at a multiple of 8 bytes:
+//   header
+//   switches: (width, id, num_track, num_wires) per switch box
+//   wires: (track_from, side_from, track_to, side_to) in switch box order
+//   tiles: (x, y, height, switch_id)
+//   nodes: endpoints encoded the same way as RoutingGraph::add_edges
+//   offsets: num_nodes + 1 uint64 offsets into targets
+//   targets: neighbor node indices
+//   name offsets: num_names + 1 uint64 offsets into name data
+//   name data
+// nodes with edges come first, in the order of the text dump, so loading
+// either format adds the edges in the same order
+constexpr char GRAPH_MAGIC[8] = {'C', 'Y', 'G', 'R', 'A', 'P', 'H', '\0'};
+constexpr uint32_t GRAPH_VERSION = 1;
+
+struct GraphHeader {
+    char magic[8];
+    uint32_t version;
+    uint32_t endpoint_size;
+    uint64_t num_switches;
+    uint64_t num_wires;
+    uint64_t num_tiles;
+    uint64_t num_nodes;
+    uint64_t num_edges;
+    uint64_t num_names;
+    uint64_t name_size;
+};
+
+inline uint64_t align_section(uint64_t size) { return (size + 7) & ~7ull; }
+
+template<typename T>
+void write_section(std::ofstream &out, const ::vector<T> &values) {
+    static const char padding[8] = {};
+    auto const size = values.size() * sizeof(T);
+    out.write(reinterpret_cast<const char *>(values.data()), size);
+    out.write(padding, align_section(size) - size);
+}
+
+void dump_routing_graph_binary(RoutingGraph &graph,
+                               const std::string &filename) {
+    ::vector<uint32_t> switches, wires, tiles, nodes;
+    ::vector<uint64_t> offsets = {0};
+    ::vector<uint32_t> targets;
+    ::vector<uint64_t> name_offsets = {0};
+    ::string name_data;
+    ::map<uint32_t, Switch> switch_boxes;
+    for (const auto &iter : graph) {
+        auto const &switch_box = iter.second.switchbox;
+        if (switch_boxes.find(switch_box.id) == switch_boxes.end())
+            switch_boxes.insert({switch_box.id, switch_box});
+    }
+    for (const auto &iter : switch_boxes) {
+        auto const &sb = iter.second;
+        auto const sb_wires = sb.internal_wires();
+        switches.insert(switches.end(),
+                        {sb.width, sb.id, sb.num_track,
+                         static_cast<uint32_t>(sb_wires.size())});
+        for (auto const &[track_from, side_from, track_to, side_to]:
+                sb_wires) {
+            wires.insert(wires.end(),
+                         {track_from, gsv(side_from), track_to,
+                          gsv(side_to)});
+        }
+    }
+
+    // same order as dump_routing_graph
+    ::vector<std::shared_ptr<Node>> sources;
+    for (auto &iter : graph) {
+        auto const &tile = iter.second;
+        tiles.insert(tiles.end(),
+                     {tile.x, tile.y, tile.height, tile.switchbox.id});
+        for (uint32_t side = 0; side < Switch::SIDES; side++) {
+            for (auto const &sb : tile.switchbox.get_sbs_by_side(gsi(side))) {
+                if (sb->io == SwitchBoxIO::SB_OUT && sb->size() > 0)
+                    sources.emplace_back(sb);
+            }
+        }
+        for (auto const &port_iter : tile.ports)
+            sources.emplace_back(port_iter.second);
+        for (auto const &reg_iter : tile.registers)
+            sources.emplace_back(reg_iter.second);
+        for (auto const &rmux_iter : tile.rmux_nodes)
+            sources.emplace_back(rmux_iter.second);
+    }
+
+    std::unordered_map<::string, uint32_t> name_index;
+    std::unordered_map<const Node *, uint32_t> node_index;
+    auto add_node = [&](const std::shared_ptr<Node> &node) {
+        if (node_index.find(node.get()) != node_index.end())
+            return;
+        node_index[node.get()] = static_cast<uint32_t>(node_index.size());
+        uint32_t side = 0, io = 0, name = 0;
+        if (node->type == NodeType::SwitchBox) {
+            auto const sb = std::static_pointer_cast<SwitchBoxNode>(node);
+            side = gsv(sb->side);
+            io = static_cast<uint32_t>(sb->io);
+        } else {
+            if (name_index.find(node->name) == name_index.end()) {
+                name_index[node->name] =
+                        static_cast<uint32_t>(name_index.size());
+                name_data += node->name;
+                name_offsets.emplace_back(name_data.size());
+            }
+            name = name_index.at(node->name);
+        }
+        nodes.insert(nodes.end(),
+                     {static_cast<uint32_t>(node->type), node->x, node->y,
+                      node->width, node->track, side, io, name});
+    };
+    ::vector<::vector<std::shared_ptr<Node>>> neighbors;
+    for (auto const &node : sources) {
+        if (node->size() == 0)
+            continue;
+        add_node(node);
+        neighbors.emplace_back(get_sorted_neighbors(node));
+    }
+    for (auto const &node_neighbors : neighbors) {
+        for (auto const &n : node_neighbors) {
+            add_node(n);
+            targets.emplace_back(node_index.at(n.get()));
+        }
+        offsets.emplace_back(targets.size());
+    }
+    // the rest of the nodes only have incoming edges
+    offsets.resize(node_index.size() + 1, targets.size());
+
+    GraphHeader header{};
+    std::memcpy(header.magic, GRAPH_MAGIC, sizeof(GRAPH_MAGIC));
+    header.version = GRAPH_VERSION;
+    header.endpoint_size = RoutingGraph::ENDPOINT_SIZE;
+    header.num_switches = switch_boxes.size();
+    header.num_wires = wires.size() / 4;
+    header.num_tiles = tiles.size() / 4;
+    header.num_nodes = node_index.size();
+    header.num_edges = targets.size();
+    header.num_names = name_index.size();
+    header.name_size = name_data.size();
+
+    std::ofstream out(filename, std::ios::binary);
+    if (!out)
+        throw ::runtime_error("unable to open " + filename);
+    out.write(reinterpret_cast<const char *>(&header), sizeof(header));
+    write_section(out, switches);
+    write_section(out, wires);
+    write_section(out, tiles);
+    write_section(out, nodes);
+    write_section(out, offsets);
+    write_section(out, targets);
+    write_section(out, name_offsets);
+    write_section(out, ::vector<char>(name_data.begin(), name_data.end()));
+    if (!out)
+        throw ::runtime_error("unable to write " + filename);
+}
+
+namespace {
+// read-only mapping of a whole file. pages are shared between all the
+// processes that map the same graph
+class MappedFile {
+public:
+    explicit MappedFile(const ::string &filename) {
+        auto const fd = ::open(filename.c_str(), O_RDONLY);
+        if (fd < 0)
+            throw ::runtime_error("unable to open " + filename);
+        struct stat st{};
+        if (::fstat(fd, &st) != 0) {
+            ::close(fd);
+            throw ::runtime_error("unable to stat " + filename);
+        }
+        size_ = static_cast<uint64_t>(st.st_size);
+        if (size_ > 0) {
+            data_ = ::mmap(nullptr, size_, PROT_READ, MAP_SHARED, fd, 0);
+        }
+        ::close(fd);
+        if (data_ == MAP_FAILED)
+            throw ::runtime_error("unable to map " + filename);
+    }
+    ~MappedFile() {
+        if (data_ != nullptr && data_ != MAP_FAILED)
+            ::munmap(data_, size_);
+    }
+    MappedFile(const MappedFile &) = delete;
+    MappedFile &operator=(const MappedFile &) = delete;
+
+    const char *data() const { return static_cast<const char *>(data_); }
+    uint64_t size() const { return size_; }
+
+private:
+    void *data_ = nullptr;
+    uint64_t size_ = 0;
+};
+
+// walks through the sections of a mapped graph with bound checks
+class SectionReader {
+public:
+    SectionReader(const MappedFile &file, const ::string &filename)
+        : file_(file), filename_(filename) {}
+
+    template<typename T>
+    const T *read(uint64_t count) {
+        if (count > (file_.size() - pos_) / sizeof(T))
+            throw ::runtime_error(filename_ + " is truncated");
+        auto const *result = reinterpret_cast<const T *>(file_.data() + pos_);
+        pos_ = std::min(file_.size(), pos_ + align_section(count * sizeof(T)));
+        return result;
+    }
+
+private:
+    const MappedFile &file_;
+    const ::string &filename_;
+    uint64_t pos_ = 0;
+};
+}
+
+bool is_binary_routing_graph(const std::string &filename) {
+    std::ifstream in(filename, std::ios::binary);
+    char magic[sizeof(GRAPH_MAGIC)] = {};
+    in.read(magic, sizeof(magic));
+    return in && std::memcmp(magic, GRAPH_MAGIC, sizeof(magic)) == 0;
+}
+
+RoutingGraph load_routing_graph_binary(const std::string &filename) {
+    if (!::exists(filename))
+        throw ::runtime_error(filename + " does not exist");
+    MappedFile file(filename);
+    SectionReader reader(file, filename);
+    auto const &header = *reader.read<GraphHeader>(1);
+    if (std::memcmp(header.magic, GRAPH_MAGIC, sizeof(GRAPH_MAGIC)) != 0)
+        throw ::runtime_error(filename + " is not a binary routing graph");
+    if (header.version != GRAPH_VERSION ||
+        header.endpoint_size != RoutingGraph::ENDPOINT_SIZE)
+        throw ::runtime_error("unsupported graph version " +
+                              ::to_string(header.version));
+    auto const *switches = reader.read<uint32_t>(header.num_switches * 4);
+    auto const *wires = reader.read<uint32_t>(header.num_wires * 4);
+    auto const *tiles = reader.read<uint32_t>(header.num_tiles * 4);
+    auto const *nodes = reader.read<uint32_t>(
+            header.num_nodes * RoutingGraph::ENDPOINT_SIZE);
+    auto const *offsets = reader.read<uint64_t>(header.num_nodes + 1);
+    auto const *targets = reader.read<uint32_t>(header.num_edges);
+    auto const *name_offsets = reader.read<uint64_t>(header.num_names + 1);
+    auto const *name_data = reader.read<char>(header.name_size);
+
+    ::vector<::string> names;
+    names.reserve(header.num_names);
+    for (uint64_t i = 0; i < header.num_names; i++) {
+        if (name_offsets[i] > name_offsets[i + 1] ||
+            name_offsets[i + 1] > header.name_size)
+            throw ::runtime_error("invalid node name in " + filename);
+        names.emplace_back(name_data + name_offsets[i],
+                           name_offsets[i + 1] - name_offsets[i]);
+    }
+    if (offsets[header.num_nodes] != header.num_edges)
+        throw ::runtime_error("invalid adjacency in " + filename);
+
+    RoutingGraph g;
+    ::map<uint32_t, Switch> switch_map;
+    uint64_t wire_index = 0;
+    for (uint64_t i = 0; i < header.num_switches; i++) {
+        auto const *sb = switches + i * 4;
+        auto const width = sb[0], id = sb[1], num_track = sb[2],
+                   num_wires = sb[3];
+        if (num_wires > header.num_wires - wire_index)
+            throw ::runtime_error("invalid switch box in " + filename);
+        std::set<std::tuple<uint32_t, SwitchBoxSide, uint32_t,
+                            SwitchBoxSide>> sb_wires;
+        for (uint32_t j = 0; j < num_wires; j++, wire_index++) {
+            auto const *wire = wires + wire_index * 4;
+            sb_wires.insert({wire[0], gsi(wire[1]), wire[2], gsi(wire[3])});
+        }
+        switch_map.insert({id, Switch(0, 0, num_track, width, id, sb_wires)});
+    }
+    for (uint64_t i = 0; i < header.num_tiles; i++) {
+        auto const *tile = tiles + i * 4;
+        g.add_tile(Tile(tile[0], tile[1], tile[2], switch_map.at(tile[3])));
+    }
+    g.add_adjacency(nodes, header.num_nodes, offsets, targets, names);
+    return g;
+}
+
+void convert_routing_graph(const std::string &src_filename,
+                           const std::string &dst_filename) {
+    // writes the other format
+    if (is_binary_routing_graph(src_filename)) {
+        auto g = load_routing_graph_binary(src_filename);
+        dump_routing_graph(g, dst_filename);
+    } else {
+        auto g = load_routing_graph(src_filename);
+        dump_routing_graph_binary(g, dst_filename);
+    }
+}
+
 void dump_wave_info(const std::map<std::string, uint64_t> &wave_info, const std::string &path) {
     // need to sort based on the pin id to get a consistent result
     std::ofstream out;
@@ -316,6 +617,8 @@ void connect_nodes(Node &from, std::ifstream &in, RoutingGraph &g) {
 RoutingGraph load_routing_graph(const std::string &filename) {
     if (!::exists(filename))
         throw ::runtime_error(filename + " does not exist");
+    if (is_binary_routing_graph(filename))
+        return load_routing_graph_binary(filename);
 
     std::ifstream in;
     in.open(filename);
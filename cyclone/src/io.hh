@@ -19,8 +19,19 @@ void dump_routing_graph(RoutingGraph &graph, const std::string &filename);
 
 void dump_wave_info(const std::map<std::string, uint64_t> &wave_info, const std::string &path);
 
+// loads either the text or the binary format
 RoutingGraph load_routing_graph(const std::string &filename);
 
+// compact binary format with a node table and adjacency lists. the file is
+// mapped read-only, so concurrent routers share the same pages
+void dump_routing_graph_binary(RoutingGraph &graph,
+                               const std::string &filename);
+RoutingGraph load_routing_graph_binary(const std::string &filename);
+bool is_binary_routing_graph(const std::string &filename);
+// converts a text graph into the binary format and vice versa
+void convert_routing_graph(const std::string &src_filename,
+                           const std::string &dst_filename);
+
 void dump_routing_result(const Router &r, const std::string &filename);
 
 void setup_router_input(Router &r, const std::string &packed_filename,
@@ -0,0 +1 @@
+../../thunder/src/packed.hh
\ No newline at end of file
@@ -1,20 +1,139 @@
 from __future__ import print_function
 from arch.cgra_packer import save_packing_result
+from arch.pack_cache import CACHE_SIZE
 from argparse import ArgumentParser
+from multiprocessing import Pool
+import sys
+import time
+import traceback
+
+BLOCK_TYPES = ["PE", "IO", "MEM", "REG"]
+
+
+def read_manifest(manifest_filename):
+    """each line has a netlist file and its packed file. lines starting with
+       # are ignored"""
+    jobs = []
+    with open(manifest_filename) as f:
+        for line in f:
+            line = line.strip()
+            if len(line) == 0 or line[0] == "#":
+                continue
+            entries = line.split()
+            if len(entries) != 2:
+                raise Exception("Expect <netlist> <packed> in manifest, " +
+                                "got " + line)
+            jobs.append((entries[0], entries[1]))
+    return jobs
+
+
+def pack_job(job):
+    netlist_filename, pack_filename, kwargs = job
+    start = time.time()
+    try:
+        counts = save_packing_result(netlist_filename, pack_filename,
+                                     **kwargs)
+        error = None
+    except Exception:
+        counts = None
+        error = traceback.format_exc()
+    return netlist_filename, time.time() - start, counts, error
+
+
+def print_summary(results):
+    print("\n{:<40} {:>8} ".format("Netlist", "Time (s)") +
+          " ".join(["{:>6}".format(t) for t in BLOCK_TYPES]))
+    total_time = 0
+    totals = dict([(t, 0) for t in BLOCK_TYPES])
+    num_failed = 0
+    for netlist_filename, elapsed, counts, _ in results:
+        total_time += elapsed
+        line = "{:<40} {:>8.2f} ".format(netlist_filename, elapsed)
+        if counts is None:
+            num_failed += 1
+            print(line + "FAILED")
+            continue
+        for t in BLOCK_TYPES:
+            totals[t] += counts[t]
+        print(line + " ".join(["{:>6}".format(counts[t])
+                               for t in BLOCK_TYPES]))
+    print("{:<40} {:>8.2f} ".format("Total", total_time) +
+          " ".join(["{:>6}".format(totals[t]) for t in BLOCK_TYPES]))
+    print("Packed:", len(results) - num_failed, "Failed:", num_failed)
+    return num_failed
+
 
 if __name__ == "__main__":
     parser = ArgumentParser("CGRA Packing tool")
     parser.add_argument("-n", "--netlist", help="Mapped netlist file, " +
-                                                "e.g. harris.json",
-                        required=True, action="store", dest="input")
+                                                "e.g. harris.json. Can be " +
+                                                "repeated for batch packing",
+                        required=False, action="append", dest="input",
+                        default=[])
     parser.add_argument("-o", "--output", help="Packed netlist file, " +
-                                               "e.g. harris.packed",
-                        required=True, action="store", dest="output")
+                                               "e.g. harris.packed. One for " +
+                                               "each netlist",
+                        required=False, action="append", dest="output",
+                        default=[])
+    parser.add_argument("-m", "--manifest", help="File with one " +
+                        "\"<netlist> <packed>\" pair per line for batch " +
+                        "packing", required=False, action="store",
+                        dest="manifest", default=None)
+    parser.add_argument("-j", "--jobs", help="Number of processes used in " +
+                        "batch packing", type=int, required=False,
+                        action="store", dest="jobs", default=1)
     parser.add_argument("--no-reg-fold", help="If set, the packer will turn " +
                         "registers into PE tiles", action="store_true",
                         required=False, dest="no_reg_fold", default=False)
+    parser.add_argument("--binary", help="If set, the packer will also " +
+                        "write a binary copy of the packed netlist for " +
+                        "faster loading", action="store_true",
+                        required=False, dest="binary", default=False)
+    parser.add_argument("--cache-dir", help="If set, packing results are " +
+                        "cached in this directory and reused for the same " +
+                        "netlist", action="store", required=False,
+                        dest="cache_dir", default=None)
+    parser.add_argument("--cache-size", help="Cache size limit in MB. " +
+                        "Least recently used entries are evicted when it " +
+                        "is exceeded", action="store", type=int,
+                        required=False, dest="cache_size",
+                        default=CACHE_SIZE >> 20)
+    parser.add_argument("--previous", help="Previous packed netlist of " +
+                        "the same design. If set, block and net IDs are " +
+                        "kept for unchanged instances and nets",
+                        action="store", required=False, dest="previous",
+                        default=None)
     args = parser.parse_args()
-    filename = args.input
-    packed = args.output
+    if len(args.input) != len(args.output):
+        parser.error("each netlist needs exactly one output")
+    jobs = list(zip(args.input, args.output))
+    if args.manifest is not None:
+        jobs += read_manifest(args.manifest)
+    if len(jobs) == 0:
+        parser.error("either -n/-o or a manifest is required")
+    if args.previous is not None and len(jobs) > 1:
+        parser.error("--previous only works with a single netlist")
+
     fold_reg = not args.no_reg_fold
-    save_packing_result(filename, packed, fold_reg=fold_reg)
+    kwargs = {"fold_reg": fold_reg, "save_binary": args.binary,
+              "cache_dir": args.cache_dir,
+              "cache_size": args.cache_size << 20,
+              "prev_pack_filename": args.previous}
+    if len(jobs) == 1:
+        filename, packed = jobs[0]
+        save_packing_result(filename, packed, **kwargs)
+    else:
+        jobs = [(filename, packed, kwargs) for filename, packed in jobs]
+        if args.jobs > 1:
+            pool = Pool(args.jobs)
+            results = pool.map(pack_job, jobs, chunksize=1)
+            pool.close()
+            pool.join()
+        else:
+            results = [pack_job(job) for job in jobs]
+        for netlist_filename, _, _, error in results:
+            if error is not None:
+                print("Failed to pack", netlist_filename + ":", error,
+                      file=sys.stderr)
+        if print_summary(results) > 0:
+            sys.exit(1)
@@ -1,14 +1,28 @@
 from __future__ import print_function, division
 
-from util import reduce_cluster_graph, compute_centroids
-from util import SetEncoder, choose_resource
+from util import reduce_cluster_graphs, compute_centroids, compute_hpwl
+from util import compute_centroid, get_unique_blocks
+from placement_executor import LocalExecutor, HTTPExecutor, LambdaExecutor
+from placement_executor import make_job_context, encode_job, decode_job_event
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from multiprocessing import Pool, Value, cpu_count
+import heapq
 import os
 import pythunder
-import json
-import threading
+import shutil
+import tempfile
+import time
+
+# best global placement HPWL among the portfolio workers
+PORTFOLIO_LEADER = None
+# how far from the new blocks incremental placement moves blocks around
+ECO_WINDOW = 2
 
 
 def detailed_placement_thunder(args, context=None):
+    if "job" in args:
+        # encoded by LambdaExecutor
+        args = decode_job_event(args)
     blks = list(args["clusters"])
     cells = args["cells"]
     netlist = args["new_netlist"]
@@ -57,30 +71,33 @@ def estimate_placement_time(args):
     placer = pythunder.DetailedPlacer(blks, netlist, new_cells,
                                       fixed_pos, clb_type,
                                       fold_reg)
-    t = placer.estimate(10000)
+    t = placer.estimate()
     return t
 
 
-def get_lambda_arn(map_args, aws_config):
-    from six.moves import queue
-    threads = []
-    que = queue.Queue()
-    for i in range(len(map_args)):
-        t = threading.Thread(target=lambda q, arg, index: q.put(
-            (index, estimate_placement_time(arg))), args=(que, map_args[i], i))
-        threads.append(t)
-    for t in threads:
-        t.start()
-    for t in threads:
-        t.join()
-    estimates = [-1] * len(map_args)
-    while not que.empty():
-        index, estimate = que.get()
-        estimates[index] = estimate
-
-    for t in estimates:
-        assert t != -1
-    return choose_resource(estimates, aws_config)
+def estimate_placement_times(map_args):
+    # the native estimate releases the GIL
+    with ThreadPoolExecutor(max(1, len(map_args))) as pool:
+        return list(pool.map(estimate_placement_time, map_args))
+
+
+def get_placement_executor(executor_spec):
+    """executor for detailed placement jobs from the command line spec:
+       local[:<num_workers>], lambda:<sls_config> or comma separated HTTP
+       worker urls. returns None for an empty spec, which places everything
+       in this process"""
+    if not executor_spec:
+        return None
+    if executor_spec == "local" or executor_spec.startswith("local:"):
+        num_workers = executor_spec[len("local:"):]
+        num_workers = int(num_workers) if num_workers else None
+        return LocalExecutor(detailed_placement_thunder, num_workers)
+    if executor_spec.startswith("lambda:"):
+        return LambdaExecutor(executor_spec[len("lambda:"):])
+    if executor_spec.startswith("http://") or \
+            executor_spec.startswith("https://"):
+        return HTTPExecutor(executor_spec.split(","))
+    raise ValueError("unknown executor " + executor_spec)
 
 
 def refine_global_thunder(layout, pre_placement, netlists, fixed_pos,
@@ -112,12 +129,296 @@ def make_board(layout):
     return board
 
 
+def get_global_hpwl(netlists, fixed_blk_pos, clusters, centroids):
+    # every block is at the centroid of its cluster
+    blk_pos = fixed_blk_pos.copy()
+    for c_id in clusters:
+        for blk_id in clusters[c_id]:
+            if blk_id not in blk_pos:
+                blk_pos[blk_id] = centroids[c_id]
+    return compute_hpwl(netlists, blk_pos)
+
+
+def place_design(layout, fixed_blk_pos, netlists, fold_reg, seed,
+                 executor=None, vis=True, leader=None, abort_ratio=0):
+    """places the design with one seed. if leader is set, it holds the best
+       global placement HPWL so far and the seed is dropped, returning None,
+       when its own is more than abort_ratio times of that"""
+    centroids, cluster_cells, clusters = perform_global_placement(
+        fixed_blk_pos, netlists, layout, seed=seed, vis=vis)
+    if leader is not None:
+        hpwl = get_global_hpwl(netlists, fixed_blk_pos, clusters, centroids)
+        with leader.get_lock():
+            if abort_ratio > 0 and hpwl > leader.value * abort_ratio:
+                print("Seed", seed, "dropped after global placement")
+                return None
+            leader.value = min(leader.value, hpwl)
+
+    # placer with each cluster
+    board_pos = perform_detailed_placement(centroids,
+                                           cluster_cells, clusters,
+                                           fixed_blk_pos, netlists,
+                                           fold_reg, seed,
+                                           layout,
+                                           executor)
+    # refinement
+    board_pos = refine_global_thunder(layout, board_pos, netlists,
+                                      fixed_blk_pos, fold_reg)
+    return board_pos
+
+
+def init_portfolio_worker(leader):
+    global PORTFOLIO_LEADER
+    PORTFOLIO_LEADER = leader
+
+
+def portfolio_job(job):
+    layout_filename, fixed_blk_pos, netlists, fold_reg, seed, \
+        executor_spec, abort_ratio = job
+    # layouts and executors can't be pickled
+    layout = pythunder.io.load_layout(layout_filename)
+    executor = get_placement_executor(executor_spec)
+    try:
+        board_pos = place_design(layout, fixed_blk_pos, netlists, fold_reg,
+                                 seed, executor, False, PORTFOLIO_LEADER,
+                                 abort_ratio)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    if board_pos is None:
+        return seed, None, None
+    return seed, board_pos, compute_hpwl(netlists, board_pos)
+
+
+def perform_portfolio_placement(layout, fixed_blk_pos, netlists, fold_reg,
+                                seeds, executor_spec="", abort_ratio=0,
+                                num_jobs=None):
+    """places the design with every seed in a process pool. returns the seed,
+       the placement and the HPWL of the placement with the lowest HPWL"""
+    if abort_ratio != 0 and abort_ratio < 1:
+        raise ValueError("abort ratio has to be at least 1")
+    if num_jobs is None:
+        num_jobs = min(len(seeds), cpu_count())
+    temp_dir = tempfile.mkdtemp()
+    try:
+        layout_filename = os.path.join(temp_dir, "portfolio.layout")
+        pythunder.io.dump_layout(layout, layout_filename)
+        jobs = [(layout_filename, fixed_blk_pos, netlists, fold_reg, seed,
+                 executor_spec, abort_ratio) for seed in seeds]
+        leader = Value("d", float("inf"))
+        pool = Pool(num_jobs, initializer=init_portfolio_worker,
+                    initargs=(leader,))
+        try:
+            results = pool.map(portfolio_job, jobs, chunksize=1)
+            pool.close()
+        except Exception:
+            # the other seeds are not needed anymore
+            pool.terminate()
+            raise
+        finally:
+            # the workers read the layout from temp_dir
+            pool.join()
+    finally:
+        shutil.rmtree(temp_dir)
+    # the seed with the best global placement is never dropped
+    results = [result for result in results if result[1] is not None]
+    for seed, _, hpwl in results:
+        print("Seed", seed, "HPWL:", hpwl)
+    return min(results, key=lambda result: (result[2], result[0]))
+
+
+def get_site_type(blk_id, layer_types):
+    # IOs of both widths are placed on the 16-bit IO sites, the same as
+    # place_special_blocks
+    if blk_id[0] == "i" and "I" in layer_types:
+        return "I"
+    return blk_id[0]
+
+
+def get_blk_nets(netlists):
+    blk_nets = {}
+    for net_id in netlists:
+        for blk_id in netlists[net_id]:
+            blk_nets.setdefault(blk_id, set()).add(net_id)
+    return blk_nets
+
+
+def get_neighbors(blk_id, netlists, blk_nets):
+    result = set()
+    for net_id in blk_nets.get(blk_id, ()):
+        result.update(netlists[net_id])
+    result.discard(blk_id)
+    return result
+
+
+def find_free_site(free_sites, pos, max_dist, forbidden=()):
+    """the free site closest to pos in manhattan distance, or None if there
+       is none within max_dist"""
+    x, y = pos
+    for dist in range(max_dist + 1):
+        for dx in range(-dist, dist + 1):
+            dy = dist - abs(dx)
+            sites = [(x + dx, y - dy)]
+            if dy != 0:
+                sites.append((x + dx, y + dy))
+            for site in sites:
+                if site in free_sites and site not in forbidden:
+                    return site
+    return None
+
+
+def insert_new_blocks(blk_pos, new_blks, netlists, blk_nets, free_sites,
+                      layer_types, center, max_dist, fold_reg):
+    """puts every new block on the free site closest to the centroid of its
+       placed neighbours, the ones with the most placed neighbours first.
+       blk_pos and free_sites are updated in place"""
+    neighbors = {}
+    counts = {}
+    for blk_id in new_blks:
+        neighbors[blk_id] = get_neighbors(blk_id, netlists, blk_nets)
+        counts[blk_id] = len([blk for blk in neighbors[blk_id]
+                              if blk in blk_pos])
+    heap = [(-counts[blk_id], blk_id) for blk_id in new_blks]
+    heapq.heapify(heap)
+    while heap:
+        count, blk_id = heapq.heappop(heap)
+        if blk_id in blk_pos or -count != counts[blk_id]:
+            continue
+        placed = [blk for blk in neighbors[blk_id] if blk in blk_pos]
+        if placed:
+            target = compute_centroid([blk_pos[blk] for blk in placed])
+        else:
+            target = center
+        forbidden = set()
+        if fold_reg:
+            # registers can't share a tile with the blocks they connect to
+            is_reg = blk_id[0] == "r"
+            for blk in placed:
+                if (blk[0] == "r") != is_reg:
+                    forbidden.add(blk_pos[blk])
+        site_type = get_site_type(blk_id, layer_types)
+        sites = free_sites.get(site_type, set())
+        pos = find_free_site(sites, target, max_dist, forbidden)
+        if pos is None:
+            raise Exception("No free site for blk " + blk_id)
+        sites.remove(pos)
+        blk_pos[blk_id] = pos
+        for blk in neighbors[blk_id]:
+            if blk in counts and blk not in blk_pos:
+                counts[blk] += 1
+                heapq.heappush(heap, (-counts[blk], blk))
+
+
+def get_eco_window(centers, window):
+    sites = set()
+    for x, y in centers:
+        for dx in range(-window, window + 1):
+            for dy in range(-window, window + 1):
+                sites.add((x + dx, y + dy))
+    return sites
+
+
+def perform_incremental_placement(layout, prev_pos, netlists, fixed_blk_pos,
+                                  fold_reg, seed, window=ECO_WINDOW,
+                                  id_to_name=None, prev_id_to_name=None):
+    """places the design starting from a previous placement. blocks with the
+       same ID and name stay at their old sites, new blocks are inserted next
+       to their neighbours and only the blocks within window of the new ones
+       are refined"""
+    start = time.time()
+    available_pos = layout.produce_available_pos()
+    layer_types = set(available_pos.keys())
+    layer_sites = {}
+    for blk_type in available_pos:
+        layer_sites[blk_type] = set(available_pos[blk_type])
+    free_sites = {blk_type: layer_sites[blk_type].copy()
+                  for blk_type in layer_sites}
+
+    board_pos = fixed_blk_pos.copy()
+    for blk_id in fixed_blk_pos:
+        site_type = get_site_type(blk_id, layer_types)
+        free_sites.get(site_type, set()).discard(tuple(board_pos[blk_id]))
+    blks = set()
+    for net_id in netlists:
+        blks.update(netlists[net_id])
+    new_blks = []
+    for blk_id in sorted(blks):
+        if blk_id in board_pos:
+            continue
+        pos = prev_pos.get(blk_id, None)
+        sites = free_sites.get(get_site_type(blk_id, layer_types), set())
+        if id_to_name and prev_id_to_name is not None and \
+                prev_id_to_name.get(blk_id, None) != id_to_name[blk_id]:
+            new_blks.append(blk_id)
+        elif pos is None or tuple(pos) not in sites:
+            new_blks.append(blk_id)
+        else:
+            pos = tuple(pos)
+            sites.remove(pos)
+            board_pos[blk_id] = pos
+    print("Incremental placement keeps", len(board_pos) - len(fixed_blk_pos),
+          "blocks and inserts", len(new_blks))
+
+    blk_nets = get_blk_nets(netlists)
+    center = (layout.width() // 2, layout.height() // 2)
+    insert_new_blocks(board_pos, new_blks, netlists, blk_nets, free_sites,
+                      layer_types, center, layout.width() + layout.height(),
+                      fold_reg)
+
+    # refine the blocks around the new ones. IOs stay where they are
+    window_sites = get_eco_window([board_pos[blk_id] for blk_id in new_blks],
+                                  window)
+    init_placement = {}
+    for blk_id in board_pos:
+        if blk_id in fixed_blk_pos or blk_id[0] == "i" or blk_id[0] == "I":
+            continue
+        if board_pos[blk_id] in window_sites:
+            init_placement[blk_id] = board_pos[blk_id]
+    if not init_placement:
+        return board_pos
+    # blocks outside the window are fixed. we use "x" for them so that the
+    # placer won't swap with them
+    new_netlist = {}
+    fixed_pos = {}
+    for blk_id in init_placement:
+        for net_id in blk_nets.get(blk_id, ()):
+            if net_id in new_netlist:
+                continue
+            net = []
+            for blk in get_unique_blocks(netlists[net_id]):
+                if blk in init_placement:
+                    net.append(blk)
+                else:
+                    node_id = "x" + blk
+                    fixed_pos[node_id] = board_pos[blk]
+                    net.append(node_id)
+            new_netlist[net_id] = net
+    cells = {}
+    for blk_id in init_placement:
+        blk_type = blk_id[0]
+        if blk_type not in cells:
+            cells[blk_type] = sorted(window_sites & layer_sites[blk_type])
+    placer = pythunder.DetailedPlacer(init_placement, new_netlist, cells,
+                                      fixed_pos, layout.get_clb_type(),
+                                      fold_reg)
+    placer.set_seed(seed)
+    placer.refine(int(100 * (len(init_placement) ** 1.33)), 0.001, False)
+    placement = placer.realize()
+    for blk_id in init_placement:
+        board_pos[blk_id] = placement[blk_id]
+    end = time.time()
+    print("Incremental placement refines", len(init_placement), "blocks in",
+          end - start, "seconds")
+    return board_pos
+
+
 def main():
     # only the main thread needs it
     # this is to avoid loading unnecessary crop while calling from aws lambda
     from argparse import ArgumentParser
     from arch import parse_cgra, parse_fpga
     from arch.cgra import place_special_blocks, save_placement, prune_netlist
+    from arch.cgra import parse_placement
     from arch.cgra_packer import load_packed_file
     from arch.fpga import load_packed_fpga_netlist
     from arch import mock_board_meta
@@ -151,6 +452,13 @@ def main():
                         "that arn",
                         dest="aws_config", type=str, required=False,
                         action="store", default="")
+    parser.add_argument("-e", "--executor", help="Where to run detailed " +
+                        "placement jobs: local[:<num_workers>] for a " +
+                        "process pool, or comma separated HTTP worker " +
+                        "urls. Workers are started with " +
+                        "placement_executor.py",
+                        dest="executor", type=str, required=False,
+                        action="store", default="")
     parser.add_argument("-f", "--fpga", action="store", dest="fpga_arch",
                         default="", help="ISPD FPGA architecture file")
     parser.add_argument("-l", "--layout", action="store", dest="cgra_layout",
@@ -158,6 +466,32 @@ def main():
     parser.add_argument("--mock", action="store", dest="mock_size",
                         default=0, type=int, help="Mock CGRA board with "
                                                   "provided size")
+    parser.add_argument("--portfolio", help="Number of seeds to place " +
+                                            "in parallel, starting from " +
+                                            "--seed. The placement with " +
+                                            "the lowest HPWL is saved",
+                        action="store", dest="portfolio", default=1,
+                        type=int)
+    parser.add_argument("--abort-ratio", help="Drop portfolio seeds whose " +
+                                              "global placement HPWL is " +
+                                              "more than this times the " +
+                                              "best one so far. 0 keeps " +
+                                              "all the seeds",
+                        action="store", dest="abort_ratio", default=0,
+                        type=float)
+    parser.add_argument("--previous", help="Placement of an earlier " +
+                                           "version of the design, e.g. " +
+                                           "harris.place. If set, only " +
+                                           "the blocks around the changes " +
+                                           "are placed",
+                        action="store", dest="previous_placement",
+                        default="")
+    parser.add_argument("--eco-window", help="How far from the new " +
+                                             "blocks the blocks are " +
+                                             "refined with --previous. " +
+                                             "default is " + str(ECO_WINDOW),
+                        action="store", dest="eco_window",
+                        default=ECO_WINDOW, type=int)
     args = parser.parse_args()
 
     cgra_arch = args.cgra_arch
@@ -173,11 +507,27 @@ def main():
 
     packed_filename = args.packed_filename
     placement_filename = args.placement_filename
-    aws_config = args.aws_config
+    executor_spec = args.executor
+    if args.aws_config:
+        if executor_spec:
+            parser.error("--aws and --executor can't be used together")
+        executor_spec = "lambda:" + args.aws_config
     fpga_place = len(fpga_arch) > 0
 
     seed = args.seed
-    print("Using seed", seed, "for placement")
+    if args.portfolio < 1:
+        parser.error("--portfolio has to be at least 1")
+    if args.abort_ratio != 0 and args.abort_ratio < 1:
+        parser.error("--abort-ratio has to be 0 or at least 1")
+    if args.portfolio > 1 and executor_spec.startswith("local"):
+        # portfolio workers can't have process pools of their own
+        parser.error("--portfolio can't be used with local executors")
+    if args.previous_placement and args.portfolio > 1:
+        parser.error("--previous can't be used with --portfolio")
+    if args.eco_window < 0:
+        parser.error("--eco-window can't be negative")
+    if args.portfolio == 1:
+        print("Using seed", seed, "for placement")
 
     vis_opt = not args.no_vis
     fold_reg = not args.no_reg_fold
@@ -224,26 +574,34 @@ def main():
             if blk[0] == "i" or blk[0] == "I":
                 special_blocks.add(blk)
 
-        # place the spacial blocks first
-        place_special_blocks(board, special_blocks, fixed_blk_pos, raw_netlist,
-                             place_on_board,
-                             layout)
+        # place the spacial blocks first. incremental placement keeps the
+        # old IO locations instead
+        if not args.previous_placement:
+            place_special_blocks(board, special_blocks, fixed_blk_pos,
+                                 raw_netlist, place_on_board, layout)
 
     # common routine
-    # produce layout structure
-    centroids, cluster_cells, clusters = perform_global_placement(
-        fixed_blk_pos, netlists, layout, seed=seed, vis=vis_opt)
-
-    # placer with each cluster
-    board_pos = perform_detailed_placement(centroids,
-                                           cluster_cells, clusters,
-                                           fixed_blk_pos, netlists,
-                                           fold_reg, seed,
-                                           layout,
-                                           aws_config)
-    # refinement
-    board_pos = refine_global_thunder(layout, board_pos, netlists,
-                                      fixed_blk_pos, fold_reg)
+    if args.previous_placement:
+        prev_pos, prev_id_to_name = parse_placement(args.previous_placement)
+        board_pos = perform_incremental_placement(layout, prev_pos, netlists,
+                                                  fixed_blk_pos, fold_reg,
+                                                  seed, args.eco_window,
+                                                  id_to_name, prev_id_to_name)
+    elif args.portfolio > 1:
+        seeds = list(range(seed, seed + args.portfolio))
+        print("Using seeds", seeds[0], "to", seeds[-1], "for placement")
+        seed, board_pos, hpwl = perform_portfolio_placement(
+            layout, fixed_blk_pos, netlists, fold_reg, seeds, executor_spec,
+            args.abort_ratio)
+        print("Seed", seed, "has the lowest HPWL", hpwl)
+    else:
+        executor = get_placement_executor(executor_spec)
+        try:
+            board_pos = place_design(layout, fixed_blk_pos, netlists,
+                                     fold_reg, seed, executor, vis_opt)
+        finally:
+            if executor is not None:
+                executor.shutdown()
 
     for blk_id in board_pos:
         pos = board_pos[blk_id]
@@ -335,18 +693,16 @@ def detailed_placement_thunder_wrapper(args):
 def perform_detailed_placement(centroids, cluster_cells, clusters,
                                fixed_blk_pos, netlists,
                                fold_reg, seed, layout,
-                               aws_config=""):
-    from six.moves import queue
-    import boto3
+                               executor=None):
     board_pos = fixed_blk_pos.copy()
     map_args = []
 
     clb_type = layout.get_clb_type()
+    new_netlists = reduce_cluster_graphs(netlists, clusters, fixed_blk_pos)
 
     for c_id in cluster_cells:
         cells = cluster_cells[c_id]
-        new_netlist = reduce_cluster_graph(netlists, clusters,
-                                           fixed_blk_pos, c_id)
+        new_netlist = new_netlists[c_id]
         blk_pos = fixed_blk_pos.copy()
         for i in centroids:
             if i == c_id:
@@ -359,48 +715,24 @@ def perform_detailed_placement(centroids, cluster_cells, clusters,
                 "blk_pos": blk_pos, "fold_reg": fold_reg,
                 "seed": seed, "clb_type": clb_type}
         map_args.append(args)
-    if not aws_config:
+    if executor is None:
         return detailed_placement_thunder_wrapper(map_args)
     else:
-        # user need to specify a region in the environment
-        client = boto3.client("lambda")
-        import time
-        threads = []
-        lambda_arns = get_lambda_arn(map_args, aws_config)
-        que = queue.Queue()
-        lambda_res = {}
         start = time.time()
-        for i in range(len(map_args)):
-            t = threading.Thread(target=lambda q, arg, arn:
-            q.put(client.invoke(
-                **{"FunctionName": arn,
-                   "InvocationType": "RequestResponse",
-                   "Payload":
-                       bytes(json.dumps(arg, cls=SetEncoder))})
-                  ["Payload"].read()),
-                                 args=(que, map_args[i], lambda_arns[i][1]))
-            threads.append(t)
-            lambda_res[i] = lambda_arns[i][0]
-        # sort the threads so that the ones needs most resources runs first
-        # this gives us some spaces for mis-calculated runtime approximation
-        index_list = list(range(len(map_args)))
-        index_list.sort(key=lambda x: lambda_res[x], reverse=True)
-        # start
-        for i in index_list:
-            t = threads[i]
-            t.start()
-        # skip join, use blocking while loop to aggressively waiting threads
-        # to finish
-        job_count = 0
+        # shared by all the jobs
+        context_pos = fixed_blk_pos.copy()
+        for i in centroids:
+            context_pos["x" + str(i)] = centroids[i]
+        context = make_job_context(context_pos, fold_reg, seed, clb_type)
+        jobs = [encode_job(context, "x" + str(c_id), args)
+                for c_id, args in zip(cluster_cells, map_args)]
+        futures = executor.submit_all(context, jobs,
+                                      estimate_placement_times(map_args))
         # merge
-        while job_count < len(map_args):
-            if not que.empty():
-                res = json.loads(que.get())
-                r = res["body"]
-                board_pos.update(r)
-                job_count += 1
+        for future in as_completed(futures):
+            board_pos.update(future.result())
         end = time.time()
-        print("Lambda takes", end - start, "seconds")
+        print("Detailed placement takes", end - start, "seconds")
         return board_pos
 
 
@@ -0,0 +1,381 @@
+"""
+Executors that run detailed placement jobs somewhere else. Every executor
+returns futures of the placement of the jobs. Jobs are submitted in
+longest-processing-time-first order so that the longest ones don't end up
+running last.
+
+Jobs are sent in a compact binary format. What all the jobs of a placement
+share, i.e. the fixed blocks, the cluster centroids and the placer
+parameters, goes into a context that workers keep between jobs. A job only
+has its cluster blocks, cells and nets, where blocks are integer indices
+into the context blocks followed by the cluster blocks.
+
+Run this file to start an HTTP worker for HTTPExecutor:
+    python placement_executor.py --port 8000
+"""
+from __future__ import print_function
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from six.moves import BaseHTTPServer, queue
+from six.moves.urllib.request import Request, urlopen
+from util import choose_resource
+import base64
+import hashlib
+import json
+import struct
+import numpy as np
+
+JOB_VERSION = 1
+# decoded contexts kept by the workers
+JOB_CONTEXT_CACHE_SIZE = 16
+JOB_CONTEXT_CACHE = {}
+# worker response when it doesn't have the context of a job
+MISSING_CONTEXT = 409
+
+
+class MissingContextError(Exception):
+    pass
+
+
+def pack_arrays(arrays):
+    """[version, count] and then [dtype, size, data] of every array. arrays
+       are flattened"""
+    chunks = [struct.pack("<II", JOB_VERSION, len(arrays))]
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        data = array.tobytes()
+        chunks.append(struct.pack("<2sQ", array.dtype.str[1:].encode(),
+                                  len(data)))
+        chunks.append(data)
+    return b"".join(chunks)
+
+
+def unpack_arrays(data):
+    version, count = struct.unpack_from("<II", data)
+    if version != JOB_VERSION:
+        raise ValueError("unsupported job version " + str(version))
+    pos = struct.calcsize("<II")
+    arrays = []
+    for _ in range(count):
+        dtype, size = struct.unpack_from("<2sQ", data, pos)
+        pos += struct.calcsize("<2sQ")
+        if pos + size > len(data):
+            raise ValueError("truncated job")
+        arrays.append(np.frombuffer(data, "<" + dtype.decode(), size //
+                                    np.dtype(dtype.decode()).itemsize, pos))
+        pos += size
+    return arrays
+
+
+def compact_array(values):
+    """smallest unsigned integer array that holds the values"""
+    array = np.array(values, dtype=np.int64)
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if len(array) == 0 or (array.min() >= 0 and
+                               array.max() <= np.iinfo(dtype).max):
+            return array.astype(dtype)
+    return array
+
+
+def pack_names(names):
+    return np.frombuffer("\n".join(names).encode(), np.uint8)
+
+
+def unpack_names(array):
+    if len(array) == 0:
+        return []
+    return array.tobytes().decode().split("\n")
+
+
+def make_job_context(blk_pos, fold_reg, seed, clb_type):
+    """blk_pos has the fixed blocks and the centroids of all the clusters"""
+    names = list(blk_pos.keys())
+    positions = compact_array([blk_pos[blk_id] for blk_id in names])
+    data = pack_arrays([pack_names(names), positions,
+                        np.array([seed, fold_reg, ord(clb_type)],
+                                 dtype=np.int64)])
+    return {"key": hashlib.sha256(data).hexdigest(), "data": data,
+            "index": {blk_id: i for i, blk_id in enumerate(names)}}
+
+
+def decode_job_context(data):
+    names, positions, params = unpack_arrays(data)
+    seed, fold_reg, clb_type = params.tolist()
+    names = unpack_names(names)
+    positions = positions.reshape((-1, 2)).tolist()
+    return {"names": names, "blk_pos": dict(zip(names, positions)),
+            "seed": seed, "fold_reg": bool(fold_reg),
+            "clb_type": chr(clb_type)}
+
+
+def encode_job(context, node_id, args):
+    """node_id is the context block of the cluster itself"""
+    blks = list(args["clusters"])
+    blk_index = {blk_id: i + len(context["index"])
+                 for i, blk_id in enumerate(blks)}
+    net_ids = list(args["new_netlist"].keys())
+    net_offsets = [0]
+    net_blks = []
+    for net_id in net_ids:
+        for blk_id in args["new_netlist"][net_id]:
+            if blk_id in blk_index:
+                net_blks.append(blk_index[blk_id])
+            else:
+                net_blks.append(context["index"][blk_id])
+        net_offsets.append(len(net_blks))
+    cell_types = list(args["cells"].keys())
+    cells = []
+    for blk_type in cell_types:
+        cells += list(args["cells"][blk_type])
+    return pack_arrays([np.frombuffer(context["key"].encode(), np.uint8),
+                        np.array([context["index"].get(node_id, -1)],
+                                 dtype=np.int64),
+                        pack_names(blks), pack_names(net_ids),
+                        compact_array(net_offsets), compact_array(net_blks),
+                        pack_names(cell_types),
+                        compact_array([len(args["cells"][blk_type])
+                                       for blk_type in cell_types]),
+                        compact_array(cells)])
+
+
+def decode_job(job, context_data=None):
+    """returns the arguments of detailed_placement_thunder. raises
+       MissingContextError if the context is neither given nor cached"""
+    key, node_index, blks, net_ids, net_offsets, net_blks, cell_types, \
+        cell_counts, cells = unpack_arrays(job)
+    key = key.tobytes().decode()
+    if key not in JOB_CONTEXT_CACHE:
+        if context_data is None:
+            raise MissingContextError(key)
+        if len(JOB_CONTEXT_CACHE) >= JOB_CONTEXT_CACHE_SIZE:
+            JOB_CONTEXT_CACHE.clear()
+        JOB_CONTEXT_CACHE[key] = decode_job_context(context_data)
+    context = JOB_CONTEXT_CACHE[key]
+    node_index = int(node_index[0])
+
+    blks = unpack_names(blks)
+    names = context["names"] + blks
+    net_blks = net_blks.tolist()
+    net_offsets = net_offsets.tolist()
+    new_netlist = {}
+    for i, net_id in enumerate(unpack_names(net_ids)):
+        new_netlist[net_id] = [names[index] for index in
+                               net_blks[net_offsets[i]:net_offsets[i + 1]]]
+    cell_list = [tuple(cell) for cell in cells.reshape((-1, 2)).tolist()]
+    blk_cells = {}
+    start = 0
+    for blk_type, count in zip(unpack_names(cell_types),
+                               cell_counts.tolist()):
+        blk_cells[blk_type] = cell_list[start:start + count]
+        start += count
+    blk_pos = context["blk_pos"].copy()
+    if node_index >= 0:
+        blk_pos.pop(context["names"][node_index])
+    return {"clusters": blks, "cells": blk_cells, "new_netlist": new_netlist,
+            "blk_pos": blk_pos, "fold_reg": context["fold_reg"],
+            "seed": context["seed"], "clb_type": context["clb_type"]}
+
+
+def encode_job_event(context, job):
+    """JSON event for the serverless function"""
+    return {"context": base64.b64encode(context["data"]).decode(),
+            "job": base64.b64encode(job).decode()}
+
+
+def decode_job_event(event):
+    return decode_job(base64.b64decode(event["job"]),
+                      base64.b64decode(event["context"]))
+
+
+def pack_request(job, context_data=None):
+    """HTTP request body: the job, followed by the context if the worker
+       doesn't have it yet"""
+    if context_data is None:
+        context_data = b""
+    return struct.pack("<Q", len(job)) + job + context_data
+
+
+def unpack_request(data):
+    size, = struct.unpack_from("<Q", data)
+    start = struct.calcsize("<Q")
+    job = data[start:start + size]
+    context_data = data[start + size:]
+    return job, context_data if len(context_data) > 0 else None
+
+
+def get_lpt_order(estimates):
+    """indices of the jobs, longest estimated time first"""
+    index_list = list(range(len(estimates)))
+    index_list.sort(key=lambda x: estimates[x], reverse=True)
+    return index_list
+
+
+class PlacementExecutor(object):
+    def submit(self, context, job):
+        """returns a future of the placement of the encoded job"""
+        raise NotImplementedError
+
+    def submit_all(self, context, jobs, estimates):
+        """returns the futures in the same order as jobs"""
+        futures = [None] * len(jobs)
+        for i in get_lpt_order(estimates):
+            futures[i] = self.submit(context, jobs[i])
+        return futures
+
+    def shutdown(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+
+def place_job(placement_func, job, context_data):
+    return placement_func(decode_job(job, context_data))
+
+
+class LocalExecutor(PlacementExecutor):
+    """runs the jobs in a local process pool"""
+    def __init__(self, placement_func, num_workers=None):
+        self.placement_func = placement_func
+        self.pool = ProcessPoolExecutor(num_workers)
+
+    def submit(self, context, job):
+        # the context is only decoded once per process
+        return self.pool.submit(place_job, self.placement_func, job,
+                                context["data"])
+
+    def shutdown(self):
+        self.pool.shutdown()
+
+
+def post_job(url, job, context_data=None, timeout=None):
+    """sends the job to a worker and returns its response, which is the
+       same as the Lambda one"""
+    request = Request(url, pack_request(job, context_data),
+                      {"Content-Type": "application/octet-stream"})
+    response = urlopen(request, timeout=timeout)
+    try:
+        return json.loads(response.read().decode())
+    finally:
+        response.close()
+
+
+class HTTPExecutor(PlacementExecutor):
+    """sends the jobs to HTTP workers. every worker gets one job at a time
+       and the context of a placement is only sent to a worker once"""
+    def __init__(self, urls, timeout=None):
+        if len(urls) == 0:
+            raise ValueError("HTTPExecutor needs at least one worker url")
+        self.timeout = timeout
+        self.pool = ThreadPoolExecutor(len(urls))
+        self.idle_urls = queue.Queue()
+        for url in urls:
+            self.idle_urls.put(url)
+        # (url, context key) of the contexts sent
+        self.sent_contexts = set()
+
+    def post_job(self, context, job):
+        # there are as many threads as urls, so this never blocks
+        url = self.idle_urls.get()
+        try:
+            sent = (url, context["key"]) in self.sent_contexts
+            res = post_job(url, job, None if sent else context["data"],
+                           self.timeout)
+            if res["statusCode"] == MISSING_CONTEXT:
+                # the worker is restarted or has evicted the context
+                res = post_job(url, job, context["data"], self.timeout)
+            self.sent_contexts.add((url, context["key"]))
+        finally:
+            self.idle_urls.put(url)
+        if res["statusCode"] != 200:
+            raise Exception("worker " + url + " failed: " + str(res["body"]))
+        return res["body"]
+
+    def submit(self, context, job):
+        return self.pool.submit(self.post_job, context, job)
+
+    def shutdown(self):
+        self.pool.shutdown()
+
+
+def invoke_lambda(client, arn, event):
+    res = client.invoke(FunctionName=arn,
+                        InvocationType="RequestResponse",
+                        Payload=json.dumps(event).encode())
+    return json.loads(res["Payload"].read())["body"]
+
+
+class LambdaExecutor(PlacementExecutor):
+    """invokes the serverless function from aws_config. the memory size of
+       each job is chosen based on its estimated time"""
+    def __init__(self, aws_config, max_workers=32):
+        import boto3
+        self.aws_config = aws_config
+        # user need to specify a region in the environment
+        self.client = boto3.client("lambda")
+        self.pool = ThreadPoolExecutor(max_workers)
+
+    def submit_all(self, context, jobs, estimates):
+        resources = choose_resource(estimates, self.aws_config)
+        futures = [None] * len(jobs)
+        for i in get_lpt_order(estimates):
+            # there is no telling which instance gets the job
+            event = encode_job_event(context, jobs[i])
+            futures[i] = self.pool.submit(invoke_lambda, self.client,
+                                          resources[i][1], event)
+        return futures
+
+    def shutdown(self):
+        self.pool.shutdown()
+
+
+def make_worker_handler(placement_func):
+    class PlacementHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+        def do_POST(self):
+            size = int(self.headers["Content-Length"])
+            try:
+                job, context_data = unpack_request(self.rfile.read(size))
+                res = placement_func(decode_job(job, context_data),
+                                     context=True)
+            except MissingContextError as ex:
+                res = {"statusCode": MISSING_CONTEXT,
+                       "body": "missing context " + str(ex)}
+            except Exception as ex:
+                res = {"statusCode": 500, "body": str(ex)}
+            data = json.dumps(res).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+    return PlacementHandler
+
+
+def make_worker_server(placement_func, host="", port=0):
+    """HTTP worker that places the jobs it receives with placement_func"""
+    return BaseHTTPServer.HTTPServer((host, port),
+                                     make_worker_handler(placement_func))
+
+
+def main():
+    from argparse import ArgumentParser
+    from place import detailed_placement_thunder
+    parser = ArgumentParser("Detailed placement worker")
+    parser.add_argument("--host", help="Address to listen on",
+                        action="store", dest="host", default="")
+    parser.add_argument("-p", "--port", help="Port to listen on",
+                        action="store", dest="port", type=int, default=8000)
+    args = parser.parse_args()
+    server = make_worker_server(detailed_placement_thunder, args.host,
+                                args.port)
+    print("Listening on port", server.server_address[1])
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
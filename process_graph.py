@@ -1,16 +1,20 @@
 from __future__ import print_function
+import fcntl
+import hashlib
 import os
+import tempfile
 from argparse import ArgumentParser
+import numpy as np
+import threading
 import pycyclone
-from pycyclone import RoutingGraph, SwitchBoxNode, PortNode, SwitchBoxSide
-from pycyclone import Tile, RegisterNode, NodeType
+from pycyclone import RoutingGraph, SwitchBoxSide
+from pycyclone import Tile, NodeType
 from pycyclone import GlobalRouter, SwitchBoxIO, Switch
-from pycyclone.util import get_side_int as gsi, get_disjoint_sb_wires, gsv
-from pycyclone.util import get_opposite_side as gos
+from pycyclone.util import get_disjoint_sb_wires, gsv
 from pycyclone.io import load_placement, load_netlist, setup_router_input
 
-from arch import parse_cgra
-from arch.cgra_route import parse_routing_resource, build_routing_resource
+from arch import load_cgra_arch
+from arch.arch_cache import get_arch_cache_key
 
 REG_DELAY = 10
 SWITCHBOX_DELAY = 50
@@ -18,6 +22,12 @@ ALU_DELAY = 200
 
 GRAPH_16 = "16bit.graph"
 GRAPH_1 = "1bit.graph"
+# the cgra_info hash and the generator version of the graphs in a directory
+GRAPH_KEY = "graph.key"
+# held while the graphs in a directory are checked and updated
+GRAPH_LOCK = "graph.lock"
+# bump this whenever the graphs built from the same cgra_info file change
+GRAPH_VERSION = 1
 
 
 def get_new_coord(x, y, side):
@@ -34,8 +44,154 @@ def get_new_coord(x, y, side):
         raise Exception(str(side) + " is not a valid side")
 
 
-def is_fu_tile(layout, x, y):
-    return layout.get_blk_type(x, y) != ' '
+def is_fu_tile(blk_types, x, y):
+    return blk_types[y, x] != ' '
+
+
+# endpoints passed to RoutingGraph.add_edges are
+# (type, x, y, width, track, side, io, name), where name indexes into the
+# list of node names
+SB_NODE = int(NodeType.SwitchBox)
+PORT_NODE = int(NodeType.Port)
+REG_NODE = int(NodeType.Register)
+SB_IN = int(SwitchBoxIO.SB_IN)
+SB_OUT = int(SwitchBoxIO.SB_OUT)
+
+
+def sb_endpoint(x, y, width, track, side, io):
+    return SB_NODE, x, y, width, track, side, io, 0
+
+
+def named_endpoint(node_type, x, y, width, track, name, names):
+    """names maps node name to its index in add_edges"""
+    if name not in names:
+        names[name] = len(names)
+    return node_type, x, y, width, track, 0, 0, names[name]
+
+
+def reg_endpoint(x, y, track, side, names):
+    return named_endpoint(REG_NODE, x, y, 16, track,
+                          "reg_" + str(track) + "_" + str(side), names)
+
+
+def get_wire_template(width, num_track, vertical, reg_from, reg_to, names):
+    """edges between the tile at (0, 0) and the one below it, or the one to
+       its right if not vertical. reg_from and reg_to tell which tiles have
+       registers on the wires"""
+    if vertical:
+        dx, dy = 0, 1
+        side_from, side_to = gsv(SwitchBoxSide.Bottom), gsv(SwitchBoxSide.Top)
+    else:
+        dx, dy = 1, 0
+        side_from, side_to = gsv(SwitchBoxSide.Right), gsv(SwitchBoxSide.Left)
+    edges = []
+    for track in range(num_track):
+        sb_from_out = sb_endpoint(0, 0, width, track, side_from, SB_OUT)
+        sb_to_in = sb_endpoint(dx, dy, width, track, side_to, SB_IN)
+        edges += sb_from_out + sb_to_in
+        # also add reg as well
+        if reg_from:
+            reg1 = reg_endpoint(0, 0, track, side_from, names)
+            edges += sb_from_out + reg1 + reg1 + sb_to_in
+
+        sb_to_out = sb_endpoint(dx, dy, width, track, side_to, SB_OUT)
+        sb_from_in = sb_endpoint(0, 0, width, track, side_from, SB_IN)
+        edges += sb_to_out + sb_from_in
+        if reg_to:
+            reg2 = reg_endpoint(dx, dy, track, side_to, names)
+            edges += sb_to_out + reg2 + reg2 + sb_from_in
+    return edges
+
+
+def get_port_templates(ports, port_io, neighbors, names):
+    """port edges of a tile at (0, 0) in the 1-bit and the 16-bit graph.
+       neighbors tells whether there is a tile on each side"""
+    edges_1 = []
+    edges_16 = []
+    # handling ports
+    # sort them
+    port_names = list(ports.keys())
+    port_names.sort()
+    for port_name in port_names:
+        port_width = 0
+        port_entries = list(ports[port_name])
+        # in-place sort
+        for i in range(4):
+            port_entries.sort(key=lambda x: x[i])
+        for width, io, side, track in port_entries:
+            if width == 16:
+                edges = edges_16
+            else:
+                edges = edges_1
+            if port_width == 0:
+                port_width = width
+            else:
+                assert port_width == width
+            port = named_endpoint(PORT_NODE, 0, 0, port_width, 0, port_name,
+                                  names)
+            # a lot of complications
+            io_dir = port_io[port_name]
+            if io_dir == 0:
+                if io == 0:
+                    # this is coming in, so we need to recalculate the
+                    # coordinates to see where the connection comes from
+                    if not neighbors[side]:
+                        continue
+                    sb_x, sb_y = get_new_coord(0, 0, side)
+                    new_side = (side + 2) % 4
+                    edges += sb_endpoint(sb_x, sb_y, width, track, new_side,
+                                         SB_OUT) + port
+
+                    # we also need to connect the registers
+                    if width == 16:
+                        reg = reg_endpoint(sb_x, sb_y, track, new_side, names)
+                        edges += reg + port
+
+                else:
+                    edges += sb_endpoint(0, 0, width, track, side,
+                                         SB_OUT) + port
+            else:
+                edges += port + sb_endpoint(0, 0, width, track, side, SB_OUT)
+    return edges_1, edges_16
+
+
+def make_stamps(template, xs, ys):
+    stamps = np.empty((len(xs), 3), dtype=np.uint32)
+    stamps[:, 0] = template
+    stamps[:, 1] = xs
+    stamps[:, 2] = ys
+    return stamps
+
+
+def stamp_edges(g, templates, stamps, names):
+    templates = [np.array(edges, dtype=np.int32).reshape((-1, 16))
+                 for edges in templates]
+    stamps = np.concatenate(stamps)
+    name_list = [None] * len(names)
+    for name, index in names.items():
+        name_list[index] = name
+    g.stamp_edges(templates, stamps, name_list)
+
+
+def run_in_threads(jobs):
+    """runs (function, args) jobs in their own threads and waits for all of
+       them. native graph building and dumping release the GIL, so the
+       1-bit and 16-bit graphs are processed in parallel"""
+    errors = []
+
+    def run(func, args):
+        try:
+            func(*args)
+        except Exception as ex:
+            errors.append(ex)
+
+    threads = [threading.Thread(target=run, args=job) for job in jobs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if len(errors) > 0:
+        raise errors[0]
 
 
 def build_routing_graph(routing_resource, layout):
@@ -52,6 +208,8 @@ def build_routing_graph(routing_resource, layout):
     layout_height = layout.height()
     clb_type = layout.get_clb_type()
     margin = layout.get_layout_margin()[0]
+    # one call instead of crossing the binding for every tile
+    blk_types, _ = layout.to_numpy()
 
     sb_16 = Switch(0, 0, NUM_TRACK, 16, SWITCH_ID,
                    get_disjoint_sb_wires(NUM_TRACK))
@@ -60,8 +218,11 @@ def build_routing_graph(routing_resource, layout):
     tiles = list(routing_resource.keys())
     for i in range(2):
         tiles.sort(key=lambda x: x[i])
+    # both graphs have the same tiles
+    graph_tiles = set()
+    has_tile = np.zeros((layout_height, layout_width), dtype=bool)
     for x, y in tiles:
-        if not is_fu_tile(layout, x, y):
+        if not is_fu_tile(blk_types, x, y):
             continue
         # if "out" not in routing_resource[(x, y)]["port"]:
         #    continue
@@ -69,164 +230,158 @@ def build_routing_graph(routing_resource, layout):
         t16 = Tile(x, y, sb_16)
         g_1.add_tile(t1)
         g_16.add_tile(t16)
+        graph_tiles.add((x, y))
+        has_tile[y, x] = True
 
-    for y in range(layout_height - 1):
-        for x in range(margin, layout_width - margin):
-            if (not is_fu_tile(layout, x, y)) or \
-                    (not is_fu_tile(layout, x, y + 1)):
-                continue
-            if not g_16.has_tile(x, y) or not g_16.has_tile(x, y + 1):
-                continue
-            for width in [1, 16]:
-                if width == 1:
-                    g = g_1
-                else:
-                    g = g_16
-                for track in range(NUM_TRACK):
-                    sb_top = SwitchBoxNode(x, y, width, track,
-                                           SwitchBoxSide.Bottom,
-                                           SwitchBoxIO.SB_OUT)
-                    sb_bottom = SwitchBoxNode(x, y + 1, width, track,
-                                              SwitchBoxSide.Top,
-                                              SwitchBoxIO.SB_IN)
-                    g.add_edge(sb_top, sb_bottom)
-                    # also add reg as well
-                    if width == 16 and layout.get_blk_type(x, y) == clb_type:
-                        reg1 = RegisterNode("reg_" + str(track) + "_"
-                                            + str(gsv(SwitchBoxSide.Bottom)),
-                                            x, y,
-                                            16,
-                                            track)
-                        g.add_edge(sb_top, reg1)
-                        g.add_edge(reg1, sb_bottom)
-
-                    sb_bottom.io = SwitchBoxIO.SB_OUT
-                    sb_top.io = SwitchBoxIO.SB_IN
-                    g.add_edge(sb_bottom, sb_top)
-                    if width == 16 and\
-                       layout.get_blk_type(x, y + 1) == clb_type:
-                        reg2 = RegisterNode("reg_" + str(track) + "_"
-                                            + str(gsv(SwitchBoxSide.Top)),
-                                            x, y + 1,
-                                            16,
-                                            track)
-                        g.add_edge(sb_bottom, reg2)
-                        g.add_edge(reg2, sb_top)
-
-    for y in range(margin, layout_height - margin):
-        # connect from left to right and right to left
-        for x in range(layout_width - 1):
-            if (not is_fu_tile(layout, x, y)) or \
-                    (not is_fu_tile(layout, x + 1, y)):
-                continue
-            if not g_16.has_tile(x, y) or not g_16.has_tile(x + 1, y):
-                continue
-            for width in [1, 16]:
-                if width == 1:
-                    g = g_1
-                else:
-                    g = g_16
-                for track in range(NUM_TRACK):
-                    sb_left = SwitchBoxNode(x, y, width, track,
-                                            SwitchBoxSide.Right,
-                                            SwitchBoxIO.SB_OUT)
-                    sb_right = SwitchBoxNode(x + 1, y, width, track,
-                                             SwitchBoxSide.Left,
-                                             SwitchBoxIO.SB_IN)
-                    g.add_edge(sb_left, sb_right)
-                    # also add reg as well
-                    if width == 16  and layout.get_blk_type(x, y) == clb_type:
-                        reg1 = RegisterNode("reg_" + str(track) + "_"
-                                            + str(gsv(SwitchBoxSide.Right)),
-                                            x, y,
-                                            16,
-                                            track)
-                        g.add_edge(sb_left, reg1)
-                        g.add_edge(reg1, sb_right)
-
-                    sb_right.io = SwitchBoxIO.SB_OUT
-                    sb_left.io = SwitchBoxIO.SB_IN
-                    g.add_edge(sb_right, sb_left)
-                    # also add reg as well
-                    if width == 16 and \
-                            layout.get_blk_type(x + 1, y) == clb_type:
-                        reg2 = RegisterNode("reg_" + str(track) + "_"
-                                            + str(gsv(SwitchBoxSide.Left)),
-                                            x + 1, y,
-                                            16,
-                                            track)
-                        g.add_edge(sb_right, reg2)
-                        g.add_edge(reg2, sb_left)
+    # tiles of the same kind get the same edges. they are built once as
+    # templates relative to the tile and stamped natively, in the same order
+    # as the edges used to be added one by one
+    names = {}
+    templates_1 = []
+    templates_16 = []
+    stamps_1 = []
+    stamps_16 = []
+    clb_tiles = blk_types == clb_type
+    # connect from top to bottom and bottom to top, then left to right and
+    # right to left
+    for vertical in [True, False]:
+        if vertical:
+            wires = has_tile[:-1, :] & has_tile[1:, :]
+            wires[:, :margin] = False
+            wires[:, layout_width - margin:] = False
+            next_clb_tiles = clb_tiles[1:, :]
+        else:
+            wires = has_tile[:, :-1] & has_tile[:, 1:]
+            wires[:margin, :] = False
+            wires[layout_height - margin:, :] = False
+            next_clb_tiles = clb_tiles[:, 1:]
+        ys, xs = np.nonzero(wires)
+        stamps_1.append(make_stamps(len(templates_1), xs, ys))
+        templates_1.append(get_wire_template(1, NUM_TRACK, vertical, False,
+                                             False, names))
+        # registers are only on the 16-bit wires of clb tiles
+        reg_index = clb_tiles[ys, xs] * 2 + next_clb_tiles[ys, xs]
+        stamps_16.append(make_stamps(len(templates_16) + reg_index, xs, ys))
+        for reg_from in [False, True]:
+            for reg_to in [False, True]:
+                templates_16.append(get_wire_template(16, NUM_TRACK, vertical,
+                                                      reg_from, reg_to,
+                                                      names))
+
+    port_templates = {}
+    port_stamps_1 = []
+    port_stamps_16 = []
     for x, y in tiles:
         ports = routing_resource[(x, y)]["port"]
         port_io = routing_resource[(x, y)]["port_io"]
 
-        if not is_fu_tile(layout, x, y):
+        if not is_fu_tile(blk_types, x, y):
             for port in ports:
                 assert len(ports[port]) == 0
             continue
-        if not g_16.has_tile(x, y):
+        if (x, y) not in graph_tiles:
             continue
 
-        # handling ports
-        # sort them
-        port_names = list(ports.keys())
-        port_names.sort()
-        for port_name in port_names:
-            port = PortNode(port_name, x, y, 0)
-            sb = SwitchBoxNode(0, 0, 0, 0, SwitchBoxSide.Bottom,
-                               SwitchBoxIO.SB_OUT)
-            port_entries = list(ports[port_name])
-            # in-place sort
-            for i in range(4):
-                port_entries.sort(key=lambda x: x[i])
-            for width, io, side, track in port_entries:
-                if width == 16:
-                    g = g_16
-                else:
-                    g = g_1
-                if port.width == 0:
-                    port.width = width
-                else:
-                    assert port.width == width
-                sb.width = width
-                sb.track = track
-                # a lot of complications
-                io_dir = port_io[port_name]
-                if io_dir == 0:
-                    sb.io = SwitchBoxIO.SB_OUT
-                    if io == 0:
-                        # this is coming in, so we need to recalculate the
-                        # coordinates to see where the connection comes from
-                        sb.x, sb.y = get_new_coord(x, y, side)
-                        if not g.has_tile(sb.x, sb.y):
-                            continue
-                        new_side = gos(side)
-                        sb.side = new_side
-                        g.add_edge(sb, port)
-
-                        # we also need to connect the registers
-                        if width == 16:
-                            reg = RegisterNode("reg_" + str(track) + "_"
-                                               + str(gsv(new_side)),
-                                               sb.x, sb.y,
-                                               16,
-                                               track)
-                            g.add_edge(reg, port)
-
-                    else:
-                        sb.x, sb.y = x, y
-                        sb.side = gsi(side)
-                        g.add_edge(sb, port)
-                else:
-                    sb.x, sb.y = x, y
-                    sb.side = gsi(side)
-                    sb.io = SwitchBoxIO.SB_OUT
-                    g.add_edge(port, sb)
+        neighbors = tuple([get_new_coord(x, y, side) in graph_tiles
+                           for side in range(4)])
+        key = (tuple([(port_name, port_io.get(port_name),
+                       tuple(sorted(ports[port_name])))
+                      for port_name in sorted(ports)]), neighbors)
+        if key not in port_templates:
+            edges_1, edges_16 = get_port_templates(ports, port_io, neighbors,
+                                                   names)
+            port_templates[key] = len(templates_1), len(templates_16)
+            templates_1.append(edges_1)
+            templates_16.append(edges_16)
+        template_1, template_16 = port_templates[key]
+        port_stamps_1.append((template_1, x, y))
+        port_stamps_16.append((template_16, x, y))
+    stamps_1.append(np.array(port_stamps_1, dtype=np.uint32).reshape((-1, 3)))
+    stamps_16.append(np.array(port_stamps_16,
+                              dtype=np.uint32).reshape((-1, 3)))
 
+    run_in_threads([(stamp_edges, (g_16, templates_16, stamps_16, names)),
+                    (stamp_edges, (g_1, templates_1, stamps_1, names))])
     return g_1, g_16
 
 
+def get_graph_key(cgra_filename, binary=False):
+    sha = hashlib.sha256(get_arch_cache_key(cgra_filename).encode())
+    sha.update("graph={} binary={}".format(GRAPH_VERSION, binary).encode())
+    return sha.hexdigest()
+
+
+def is_graph_valid(graph_dirname, key):
+    for filename in (GRAPH_16, GRAPH_1, GRAPH_KEY):
+        if not os.path.isfile(os.path.join(graph_dirname, filename)):
+            return False
+    with open(os.path.join(graph_dirname, GRAPH_KEY)) as f:
+        return f.read().strip() == key
+
+
+def get_default_mode():
+    # the mode open() gives to new files. os.umask can only be read by
+    # setting it, so this is not thread safe
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+def write_atomic(write, filename, mode):
+    """calls write with a temporary file and moves it to filename, so that
+       readers either see the complete file or the old one"""
+    fd, tmp_filename = tempfile.mkstemp(dir=os.path.dirname(filename),
+                                        prefix=".tmp")
+    os.close(fd)
+    try:
+        write(tmp_filename)
+        # mkstemp files are only readable by the owner
+        os.chmod(tmp_filename, mode)
+        os.rename(tmp_filename, filename)
+    except Exception:
+        os.remove(tmp_filename)
+        raise
+
+
+def write_graph_key(key, filename):
+    with open(filename, "w") as f:
+        f.write(key + "\n")
+
+
+def update_routing_graphs(cgra_filename, graph_dirname, override=False,
+                          binary=False):
+    """builds the graphs into graph_dirname unless the ones there are built
+       from the same cgra_info file. returns True if the graphs are built"""
+    key = get_graph_key(cgra_filename, binary)
+    # flows sharing the directory update the graphs one at a time, so that
+    # the graphs and the key always come from the same cgra_info file
+    with open(os.path.join(graph_dirname, GRAPH_LOCK), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        if not override and is_graph_valid(graph_dirname, key):
+            return False
+        if binary:
+            dump_routing_graph = pycyclone.io.dump_routing_graph_binary
+        else:
+            dump_routing_graph = pycyclone.io.dump_routing_graph
+
+        layouts, routing_resource = load_cgra_arch(cgra_filename)
+        layout = layouts["CGRA"]
+        g_1, g_16 = build_routing_graph(routing_resource, layout)
+        g_16_filename = os.path.join(graph_dirname, GRAPH_16)
+        g_1_filename = os.path.join(graph_dirname, GRAPH_1)
+        mode = get_default_mode()
+        run_in_threads([(write_atomic,
+                         (lambda filename: dump_routing_graph(g_16, filename),
+                          g_16_filename, mode)),
+                        (write_atomic,
+                         (lambda filename: dump_routing_graph(g_1, filename),
+                          g_1_filename, mode))])
+        # the key goes last so that a partial update is never valid
+        write_atomic(lambda filename: write_graph_key(key, filename),
+                     os.path.join(graph_dirname, GRAPH_KEY), mode)
+        return True
+
+
 def main():
     parser = ArgumentParser("CGRA graph creation")
     parser.add_argument("-i", "--input", help="CGRA info file",
@@ -235,10 +390,15 @@ def main():
                                                "cyclone router",
                         required=True, action="store",
                         dest="graph_dirname")
-    parser.add_argument("-O", "--override", help="Override the existing one "
-                                                 "if the output file exists",
+    parser.add_argument("-O", "--override", help="Build the graphs even if "
+                                                 "the existing ones are up "
+                                                 "to date",
                         required=False, default=False, action="store_true",
                         dest="override_graph")
+    parser.add_argument("-b", "--binary", help="Save the graphs in the "
+                                               "binary format",
+                        required=False, default=False, action="store_true",
+                        dest="binary_graph")
 
     args = parser.parse_args()
     cgra_filename = args.cgra_filename
@@ -248,24 +408,20 @@ def main():
     # if the directory doesn't exit, create one
     if not os.path.isdir(graph_dirname):
         print("creating folder", graph_dirname)
-        os.mkdir(graph_dirname)
+        try:
+            os.makedirs(graph_dirname)
+        except OSError:
+            # created by another flow in the meantime
+            if not os.path.isdir(graph_dirname):
+                raise
 
-    g_16_filename = os.path.join(graph_dirname, GRAPH_16)
-    g_1_filename = os.path.join(graph_dirname, GRAPH_1)
-    if os.path.isfile(g_16_filename) and not override_graph:
-        print("found existing", g_16_filename, "skipped.")
+    if not update_routing_graphs(cgra_filename, graph_dirname,
+                                 override_graph, args.binary_graph):
+        print("graphs in", graph_dirname, "are up to date. skipped.")
         exit(0)
-    elif os.path.isfile(g_16_filename):
-        print("override existing graph file")
-
-    layout = parse_cgra(cgra_filename)["CGRA"]
-    raw_routing_resource = parse_routing_resource(cgra_filename)
-    routing_resource = build_routing_resource(raw_routing_resource)
-    g_1, g_16 = build_routing_graph(routing_resource, layout)
-    pycyclone.io.dump_routing_graph(g_16, g_16_filename)
-    pycyclone.io.dump_routing_graph(g_1, g_1_filename)
 
-    print("graph saved to", g_1_filename, g_16_filename)
+    print("graph saved to", os.path.join(graph_dirname, GRAPH_1),
+          os.path.join(graph_dirname, GRAPH_16))
 
 
 if __name__ == "__main__":
@@ -49,10 +49,13 @@ fi
 
 BASEDIR=$(dirname "$0")
 packed="${netlist%.json}.packed"
+# packing results are reused across runs of the same netlist
+pack_cache="${PACK_CACHE_DIR:-${HOME}/.cache/cgra_pnr/packed}"
 
 # assume user already have the env activated
 # pack
-python ${BASEDIR}/../packer.py -n ${netlist} -o ${packed} ${option}
+python ${BASEDIR}/../packer.py -n ${netlist} -o ${packed} ${option} --binary \
+    --cache-dir ${pack_cache}
 
 # detect if the cgra file is cgra_info from CGRAGenerator or from garnet
 detect_garnet ${cgra}
@@ -0,0 +1,8 @@
+import os
+import sys
+
+
+# make the top-level modules, e.g. arch and util, importable from the tests
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if root_dir not in sys.path:
+    sys.path.insert(0, root_dir)
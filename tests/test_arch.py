@@ -0,0 +1,220 @@
+import os
+import pytest
+
+import numpy as np
+import pythunder
+import arch.arch
+import arch.cgra_route
+from arch.arch import parse_cgra, parse_cgra_info, load_cgra_arch, parse_vpr
+from arch.arch import parse_fpga, parse_fpga_sites
+from arch.cgra_route import parse_routing_resource, build_routing_resource
+from arch.cgra_route import decode_wire
+from arch.arch_cache import load_arch_cache, save_arch_cache
+
+CGRA_INFO = """<CGRA>
+  <tile type="empty" tile_addr="0x0000" row="0" col="0"/>
+  <tile type="io1bit" tile_addr="0x0001" row="0" col="1" name="pad_1">
+    <io_bit>0</io_bit>
+    <tri><direction>in</direction><direction>out</direction></tri>
+    <f2p_1bit>in_1BIT_S1_T0</f2p_1bit>
+    <p2f_1bit>out_1BIT_S1_T0</p2f_1bit>
+    <f2p_wide>in_16BIT_S1_T0</f2p_wide>
+    <p2f_wide>out_16BIT_S1_T0</p2f_wide>
+  </tile>
+  <tile type="io1bit" tile_addr="0x0002" row="0" col="2" name="pad_1">
+    <io_bit>1</io_bit>
+    <tri><direction>in</direction></tri>
+    <f2p_1bit>in_1BIT_S1_T0</f2p_1bit>
+    <p2f_1bit>out_1BIT_S1_T1</p2f_1bit>
+  </tile>
+  <tile type="pe_tile_new" tile_addr="0x0003" row="1" col="1">
+    <cb bus="BUS16"><mux snk="data0"><src>in_0_BUS16_S1_T0</src></mux></cb>
+    <sb bus="BUS16">
+      <mux snk="out_0_BUS16_S0_T0"><src>in_0_BUS16_S2_T0</src>
+        <src>pe_out_res</src></mux>
+      <reg src="out_0_BUS16_S0_T0"/>
+    </sb>
+  </tile>
+  <tile type="memory_tile" tile_addr="0x0004" row="1" col="2">
+    <cb bus="BUS16"><mux snk="wdata"><src>in_0_BUS16_S1_T0</src></mux></cb>
+  </tile>
+  <tile type="gst" tile_addr="0x0005"/>
+  <tile type="pe_tile_new" tile_addr="0x0006" row="2" col="1"/>
+</CGRA>
+"""
+
+VPR_ARCH = """<architecture><layout>
+  <fixed_layout name="test" width="8" height="5">
+    <fill type="clb" priority="1"/>
+    <perimeter type="io" priority="10"/>
+    <corners type="EMPTY" priority="20"/>
+    <col type="memory" startx="2" starty="1" repeatx="4" priority="20"/>
+    <col type="mult_36" startx="2" starty="2" repeatx="4" priority="5"/>
+    <col type="mult_36" startx="3" starty="2" repeatx="8" priority="5"/>
+  </fixed_layout>
+</layout></architecture>
+"""
+
+FPGA_SCL = """SITE SLICE
+  LUT 16
+END SITE
+
+SITEMAP 3 2
+0 0 IO
+1 0 SLICE
+2 0 IO
+0 1 BRAM
+1 1 DSP
+END SITEMAP
+"""
+
+
+def write_cgra_info(tmp_path):
+    filename = str(tmp_path / "cgra_info.txt")
+    with open(filename, "w") as f:
+        f.write(CGRA_INFO)
+    return filename
+
+
+def test_parse_cgra_info(tmp_path):
+    filename = write_cgra_info(tmp_path)
+    layouts, routing_resource = parse_cgra_info(filename, True)
+    layout, info, tile_mapping = layouts["CGRA"]
+    ref_layout, ref_info, ref_tile_mapping = \
+        parse_cgra(filename, True, cache_dir=None)["CGRA"]
+    assert repr(layout) == repr(ref_layout)
+    assert info == ref_info
+    assert tile_mapping == ref_tile_mapping
+    assert routing_resource == parse_routing_resource(filename)
+
+    assert layout.get_blk_type(1, 0) == "I"
+    assert layout.get_blk_type(2, 0) == "i"
+    assert layout.get_blk_type(1, 2) == "p"
+    assert info["io16_tile"] == {"pad_1": [1, 2]}
+    # gst stops the routing resource
+    assert sorted(routing_resource.keys()) == [(0, 0), (1, 0), (1, 1),
+                                               (2, 0), (2, 1)]
+    assert routing_resource[(1, 1)]["sb"]["BUS16"]["mux"] == \
+        {"out_0_BUS16_S0_T0": {"in_0_BUS16_S2_T0", "pe_out_res"}}
+    assert routing_resource[(2, 0)]["input"] == {"in_1BIT_S1_T0"}
+
+
+def test_arch_cache(tmp_path, monkeypatch):
+    filename = write_cgra_info(tmp_path)
+    cache_dir = str(tmp_path / "cache")
+    layouts, routing_resource = load_cgra_arch(filename, True, cache_dir)
+    layout, info, tile_mapping = layouts["CGRA"]
+    assert routing_resource == \
+        build_routing_resource(parse_routing_resource(filename))
+
+    # hits should not touch the cgra_info file again
+    def iter_cgra_tiles(_):
+        raise Exception("cgra_info is parsed")
+    monkeypatch.setattr(arch.arch, "iter_cgra_tiles", iter_cgra_tiles)
+    cached_layouts, cached_routing_resource = load_cgra_arch(filename, True,
+                                                             cache_dir)
+    cached_layout, cached_info, cached_tile_mapping = cached_layouts["CGRA"]
+    assert repr(cached_layout) == repr(layout)
+    assert cached_info == info
+    assert cached_tile_mapping == tile_mapping
+    assert cached_routing_resource == routing_resource
+    assert repr(parse_cgra(filename, cache_dir=cache_dir)["CGRA"]) == \
+        repr(layout)
+
+    # a different file is a different entry
+    with open(filename, "a") as f:
+        f.write("\n")
+    with pytest.raises(Exception):
+        parse_cgra(filename, cache_dir=cache_dir)
+
+
+def test_arch_cache_eviction(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    save_arch_cache(cache_dir, "a", "board", "a" * 1000)
+    save_arch_cache(cache_dir, "a", "routing", "a" * 1000)
+    entry_size = sum([os.path.getsize(os.path.join(cache_dir, "a", filename))
+                      for filename in os.listdir(os.path.join(cache_dir,
+                                                              "a"))])
+    save_arch_cache(cache_dir, "b", "board", "b" * 1000)
+    os.utime(os.path.join(cache_dir, "a"), (0, 0))
+    os.utime(os.path.join(cache_dir, "b"), (1, 1))
+    # loading marks a as recently used, so b is evicted
+    assert load_arch_cache(cache_dir, "a", "board") == "a" * 1000
+    save_arch_cache(cache_dir, "c", "board", "c" * 1000,
+                    max_size=entry_size + 1500)
+    assert load_arch_cache(cache_dir, "b", "board") is None
+    assert load_arch_cache(cache_dir, "a", "routing") == "a" * 1000
+    assert load_arch_cache(cache_dir, "c", "board") == "c" * 1000
+
+
+def test_parse_vpr(tmp_path, monkeypatch):
+    filename = str(tmp_path / "arch.xml")
+    with open(filename, "w") as f:
+        f.write(VPR_ARCH)
+    boards = []
+    monkeypatch.setattr(arch.arch, "get_layout",
+                        lambda board: boards.append(board.tolist()))
+    parse_vpr(filename)
+    assert ["".join(row) for row in boards[0]] == [" iiiiii ",
+                                                   "icmcccmi",
+                                                   "icmuccmi",
+                                                   "icmuccmi",
+                                                   " iiiiii "]
+
+
+def test_parse_fpga(tmp_path):
+    filename = str(tmp_path / "design.scl")
+    with open(filename, "w") as f:
+        f.write(FPGA_SCL)
+    board_layout, io_sites = parse_fpga_sites(filename)
+    assert ["".join(row) for row in board_layout.tolist()] == ["ici", "md "]
+    assert io_sites.tolist() == [[0, 0], [2, 0]]
+    layout = parse_fpga(filename)["fpga"]
+    assert layout.get_blk_type(2, 0) == "i"
+    assert layout.get_blk_type(1, 1) == "d"
+
+
+def test_empty_src(tmp_path):
+    filename = str(tmp_path / "cgra_info.txt")
+    with open(filename, "w") as f:
+        f.write(CGRA_INFO.replace("<src>pe_out_res</src>", "<src/>"))
+    routing_resource = parse_routing_resource(filename)
+    # the same as before the names were interned
+    assert routing_resource[(1, 1)]["sb"]["BUS16"]["mux"] == \
+        {"out_0_BUS16_S0_T0": {"in_0_BUS16_S2_T0", None}}
+
+
+def test_decode_wire(monkeypatch):
+    monkeypatch.setattr(arch.cgra_route, "WIRE_CACHE_SIZE", 2)
+    monkeypatch.setattr(arch.cgra_route, "WIRE_CACHE", {})
+    wire = decode_wire("out_BUS16_S0_T3")
+    assert wire == (16, 1, 0, 3)
+    assert decode_wire("out_BUS16_S0_T3") is wire
+    assert decode_wire("sb_wire_in_1_BUS1_S3_T4") == (1, 0, 7, 4)
+    assert decode_wire("pe_out_res") is None
+    # the cache is bounded
+    assert len(arch.cgra_route.WIRE_CACHE) <= 2
+    with pytest.raises(Exception):
+        decode_wire("foo_BUS16_S0_T0")
+
+
+def test_layout_numpy(tmp_path):
+    filename = write_cgra_info(tmp_path)
+    layout = parse_cgra_info(filename)[0]["CGRA"]
+    blk_types, masks = layout.to_numpy()
+    assert blk_types.shape == (layout.height(), layout.width())
+    assert sorted(masks.keys()) == sorted(layout.get_layer_types())
+    for y in range(layout.height()):
+        for x in range(layout.width()):
+            assert blk_types[y, x] == layout.get_blk_type(x, y)
+            for blk_type, mask in masks.items():
+                assert mask[y, x] == layout.get_layer(blk_type)[x, y]
+
+    board = np.array([["i", "p"], [" ", "m"]])
+    new_layout = pythunder.Layout.from_numpy(board)
+    assert repr(new_layout) == repr(pythunder.Layout(board.tolist()))
+    assert repr(pythunder.Layout.from_numpy(board.astype("S1"))) == \
+        repr(new_layout)
+    assert (new_layout.to_numpy()[0] == board).all()
+    with pytest.raises(Exception):
+        pythunder.Layout.from_numpy(np.array([1, 2]))
@@ -0,0 +1,46 @@
+import json
+import os
+import tempfile
+import pytest
+
+from arch.coreir import load_top_module
+
+
+def get_design():
+    top = {"type": ["Record", [["in", ["Array", 16, "BitIn"]]]],
+           "instances": {"add_1": {"genref": "coreir.add",
+                                   "genargs": {"width": ["Int", 16]}},
+                         "const\"2\\": {"modref": "corebit.const",
+                                        "modargs": {"value": ["Bool", True]}},
+                         "mem_é": {"genref": "cgralib.Mem",
+                                        "modargs": {"depth": ["Int", -1.5e3],
+                                                    "init": None}}},
+           "connections": [["add_1.out", "mem_é.wdata"],
+                           ["self.in", "add_1.in0"]]}
+    lib = {"modules": {"DesignTop": {"instances": {}},
+                       "other": {"instances": {"x": {}}}}}
+    return {"namespaces": {"lib": lib,
+                           "global": {"generators": {"g": [1, 2, {}]},
+                                      "modules": {"other": {"x": []},
+                                                  "DesignTop": top}}}}
+
+
+@pytest.mark.parametrize("top_first", [True, False])
+@pytest.mark.parametrize("chunk_size", [1, 7, 1 << 16])
+def test_load_top_module(top_first, chunk_size):
+    design = get_design()
+    if top_first:
+        data = {"top": "global.DesignTop"}
+        data.update(design)
+    else:
+        data = design
+        data["top"] = "global.DesignTop"
+    with tempfile.TemporaryDirectory() as temp:
+        filename = os.path.join(temp, "design.json")
+        with open(filename, "w") as f:
+            json.dump(data, f, indent=2)
+        top = load_top_module(filename, chunk_size)
+    expected = data["namespaces"]["global"]["modules"]["DesignTop"]
+    assert top == {"instances": expected["instances"],
+                   "connections": expected["connections"]}
+    assert list(top["instances"].keys()) == list(expected["instances"].keys())
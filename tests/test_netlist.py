@@ -0,0 +1,25 @@
+from arch.netlist import group_reg_nets
+
+
+def test_group_reg_nets():
+    netlists = {"e0": [("r3", "out"), ("p4", "data0"), ("r5", "in")],
+                "e1": [("p0", "out"), ("r2", "in"), ("p1", "data0")],
+                "e2": [("r2", "out"), ("r3", "in"), ("r6", "in")],
+                "e3": [("r5", "out"), ("p1", "data1")],
+                "e4": [("r6", "out"), ("p0", "data0")],
+                "e5": [("p1", "out"), ("p0", "data1")]}
+    linked_nets, net_id_to_remove, reg_net_order = group_reg_nets(netlists)
+    assert linked_nets == {"e1": ["e2", "e0", "e4", "e3"]}
+    assert net_id_to_remove == {"e0", "e2", "e3", "e4"}
+    assert reg_net_order == {"e2": "e1", "e0": "e2", "e4": "e2", "e3": "e0"}
+
+
+def test_group_reg_nets_deep_chain():
+    depth = 5000
+    netlists = {"e0": [("p0", "out"), ("r1", "in")]}
+    for i in range(1, depth):
+        netlists["e" + str(i)] = [("r" + str(i), "out"),
+                                  ("r" + str(i + 1), "in")]
+    linked_nets, net_id_to_remove, _ = group_reg_nets(netlists)
+    assert linked_nets["e0"] == ["e" + str(i) for i in range(1, depth)]
+    assert len(net_id_to_remove) == depth - 1
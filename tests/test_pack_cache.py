@@ -0,0 +1,62 @@
+import os
+
+from arch.cgra_packer import load_packed_text, load_packed_file
+from arch.cgra_packer import write_packing_result
+from arch.pack_cache import get_cache_key, load_from_cache, save_to_cache
+from arch.pack_cache import evict_cache
+from arch.packed_binary import save_packed_binary, load_packed_binary
+
+
+def write_packed(pack_filename):
+    netlists = {"e1": [("p1", "out"), ("m2", "wdata")],
+                "e2": [("m2", "rdata"), ("I3", "f2io_16")]}
+    folded_blocks = {("c0", "out"): ("p1", "const", "data0")}
+    id_to_name = {"p1": "add_1", "m2": "mem_2", "I3": "io16_out"}
+    write_packing_result(set(), folded_blocks, id_to_name, netlists,
+                         pack_filename, {"e1": 16, "e2": 16})
+
+
+def test_cache_key(tmp_path):
+    netlist_filename = str(tmp_path / "design.json")
+    with open(netlist_filename, "w") as f:
+        f.write("{}")
+    key = get_cache_key(netlist_filename, True)
+    assert key == get_cache_key(netlist_filename, True)
+    assert key != get_cache_key(netlist_filename, False)
+    with open(netlist_filename, "w") as f:
+        f.write("{ }")
+    assert key != get_cache_key(netlist_filename, True)
+
+
+def test_cache_round_trip(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    pack_filename = str(tmp_path / "design.packed")
+    write_packed(pack_filename)
+    result = load_packed_text(pack_filename)
+    save_packed_binary(pack_filename, *result)
+
+    assert not load_from_cache(cache_dir, "a", pack_filename)
+    save_to_cache(cache_dir, "a", pack_filename)
+    os.remove(pack_filename)
+    os.remove(pack_filename + ".bin")
+
+    assert load_from_cache(cache_dir, "a", pack_filename)
+    assert load_packed_binary(pack_filename) == result
+    assert load_packed_file(pack_filename, load_track_mode=True) == result
+
+
+def test_cache_eviction(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    pack_filename = str(tmp_path / "design.packed")
+    write_packed(pack_filename)
+    size = os.path.getsize(pack_filename)
+    for index, key in enumerate(["a", "b", "c"]):
+        save_to_cache(cache_dir, key, pack_filename, max_size=2 * size)
+        # make sure the entries are ordered by their mtime
+        os.utime(os.path.join(cache_dir, key), (index, index))
+    assert sorted(os.listdir(cache_dir)) == ["b", "c"]
+
+    # a cache hit makes the entry the most recently used one
+    assert load_from_cache(cache_dir, "b", pack_filename)
+    assert evict_cache(cache_dir, size) == 1
+    assert os.listdir(cache_dir) == ["b"]
@@ -0,0 +1,127 @@
+import pythunder
+
+from arch.cgra_packer import convert2netlist, pack_netlists
+from arch.cgra_packer import change_name_to_id, match_net_ids
+from arch.cgra_packer import write_packing_result, load_packed_file
+from arch.cgra_packer import load_packed_text, rename_id_changed
+from arch.packed_binary import save_packed_binary, load_packed_binary
+from packer import read_manifest
+
+
+def test_convert2netlist_star():
+    connections = [["a.data0", "b.out"],
+                   ["c.in", "d.out"],
+                   ["b.out", "e.in"],
+                   ["d.out", "b.data1"],
+                   ["f.in", "b.out"]]
+    netlists = convert2netlist(connections)
+    assert netlists == [["b.out", "a.data0", "e.in", "f.in"],
+                        ["d.out", "c.in", "b.data1"]]
+
+
+def test_convert2netlist_merge():
+    # two partial nets only joined by the last connection
+    connections = [["a.out", "b.in"],
+                   ["c.in", "d.in"],
+                   ["b.in", "c.in"]]
+    netlists = convert2netlist(connections)
+    assert netlists == [["a.out", "b.in", "c.in", "d.in"]]
+
+
+def get_reg_netlists():
+    name_to_id = {"const": "c0", "pe1": "p1", "pe2": "p2", "reg3": "r3",
+                  "reg4": "r4", "reg5": "r5", "io6": "I6"}
+    netlists = {"e0": [("c0", "out"), ("p1", "data1")],
+                "e1": [("p2", "out"), ("r3", "in")],
+                "e2": [("r3", "out"), ("p1", "data0")],
+                "e3": [("p1", "out"), ("r4", "in")],
+                "e4": [("r4", "out"), ("r5", "in"), ("p2", "data0")],
+                "e5": [("r5", "out"), ("I6", "f2io_16")]}
+    return netlists, name_to_id
+
+
+def test_pack_netlists_fold_reg():
+    netlists, name_to_id = get_reg_netlists()
+    netlists, folded_blocks, changed_pe = pack_netlists(netlists, name_to_id)
+    assert netlists == {"e1": [("p2", "out"), ("p1", "data0")],
+                        "e3": [("p1", "out"), ("r4", "reg")],
+                        "e4": [("r4", "reg"), ("I6", "f2io_16"),
+                               ("p2", "data0")]}
+    assert folded_blocks == {("c0", "out"): ("p1", "const", "data1"),
+                             ("r3", "out"): ("p1", "data0"),
+                             ("r5", "out"): ("I6", "f2io_16")}
+    assert len(changed_pe) == 0
+
+
+def test_pack_netlists_no_fold_reg():
+    netlists, name_to_id = get_reg_netlists()
+    netlists, _, changed_pe = pack_netlists(netlists, name_to_id,
+                                            fold_reg=False)
+    assert netlists == {"e1": [("p2", "out"), ("p1", "data0")],
+                        "e3": [("p1", "out"), ("p4", "data0")],
+                        "e4": [("p4", "out"), ("I6", "f2io_16"),
+                               ("p2", "data0")]}
+    assert changed_pe == {"r4"}
+
+
+def test_packed_binary(tmp_path):
+    netlists, name_to_id = get_reg_netlists()
+    netlists, folded_blocks, changed_pe = pack_netlists(netlists, name_to_id,
+                                                        fold_reg=False)
+    id_to_name = {"p1": "pe1", "p2": "pe2", "r4": "reg4", "I6": "io16"}
+    rename_id_changed(id_to_name, changed_pe)
+    track_mode = {"e1": 16, "e3": 16, "e4": 1}
+    pack_filename = str(tmp_path / "test.packed")
+    write_packing_result(changed_pe, folded_blocks, id_to_name, netlists,
+                         pack_filename, track_mode)
+    save_packed_binary(pack_filename, netlists, folded_blocks, id_to_name,
+                       changed_pe, track_mode)
+    result = load_packed_binary(pack_filename)
+    assert result == load_packed_text(pack_filename)
+    assert result == pythunder.io.load_packed_file(pack_filename)
+    assert result == load_packed_file(pack_filename, load_track_mode=True)
+
+    # stale sidecar is ignored
+    with open(pack_filename, "a") as f:
+        f.write("\n")
+    assert load_packed_binary(pack_filename) is None
+    assert load_packed_file(pack_filename, load_track_mode=True) == result
+
+
+def test_change_name_to_id_stable():
+    pe = {"genref": "cgralib.PE"}
+    reg = {"genref": "coreir.reg"}
+    instances = {"b": pe, "c": reg, "d": pe}
+    name_to_id = change_name_to_id(instances)
+    assert name_to_id == {"b": "p0", "c": "r1", "d": "p2"}
+    # c has been turned into a PE and d is removed
+    prev_id_to_name = {"p0": "b", "p1": "c"}
+    instances = {"a": pe, "b": pe, "c": reg, "e": pe}
+    name_to_id = change_name_to_id(instances, prev_id_to_name)
+    assert name_to_id == {"a": "p2", "b": "p0", "c": "r1", "e": "p3"}
+
+
+def test_match_net_ids():
+    prev_netlists = {"e0": [("p0", "out"), ("p1", "data0")],
+                     "e2": [("p1", "out"), ("I2", "f2io_16")],
+                     "e3": [("p3", "out"), ("p1", "data1")]}
+    netlists = {"e0": [("p4", "out"), ("p0", "data0")],
+                "e1": [("p0", "out"), ("p1", "data0")],
+                "e2": [("p1", "out"), ("p0", "data1"), ("I2", "f2io_16")]}
+    netlists, added, removed, changed = match_net_ids(netlists, prev_netlists)
+    assert netlists == {"e0": [("p0", "out"), ("p1", "data0")],
+                        "e2": [("p1", "out"), ("p0", "data1"),
+                               ("I2", "f2io_16")],
+                        "e4": [("p4", "out"), ("p0", "data0")]}
+    assert added == ["e4"]
+    assert removed == ["e3"]
+    assert changed == ["e2"]
+
+
+def test_read_manifest(tmp_path):
+    manifest = tmp_path / "manifest.txt"
+    manifest.write_text(u"# app packed\n\nharris.json harris.packed\n" +
+                        u"  gaussian.json\tgaussian.packed  \n")
+    assert read_manifest(str(manifest)) == [("harris.json", "harris.packed"),
+                                            ("gaussian.json",
+                                             "gaussian.packed")]
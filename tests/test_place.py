@@ -0,0 +1,152 @@
+import multiprocessing
+import pytest
+import pythunder
+import place
+from place import find_free_site, insert_new_blocks, get_blk_nets
+from place import perform_incremental_placement, place_design
+from place import perform_portfolio_placement
+
+BOARD = ["iiiiiiii",
+         "ipppppmi",
+         "ipppppmi",
+         "ipppppmi",
+         "ipppppmi",
+         "ipppppmi",
+         "iiiiiiii"]
+
+NETLISTS = {"e0": ["i0", "p1", "p2"], "e1": ["p2", "m3"]}
+FIXED_POS = {"i0": (0, 1)}
+
+
+def fake_global_placement(fixed_blk_pos, netlists, layout, seed, vis=True):
+    # seed is the x of the only cluster, so it is also the HPWL
+    clusters = {0: {"p1", "p2", "m3"}}
+    centroids = {0: (seed, 1)}
+    return centroids, {0: {}}, clusters
+
+
+def fake_detailed_placement(centroids, cluster_cells, clusters,
+                            fixed_blk_pos, netlists, fold_reg, seed, layout,
+                            executor=None):
+    # the HPWL is 2 * |seed - 4| + 2
+    x = abs(seed - 4)
+    board_pos = fixed_blk_pos.copy()
+    board_pos.update({"p1": (x, 1), "p2": (x, 2), "m3": (0, 1)})
+    return board_pos
+
+
+def fake_place_design(layout, fixed_blk_pos, netlists, fold_reg, seed,
+                      executor=None, vis=True, leader=None, abort_ratio=0):
+    if seed == 3:
+        return None
+    if seed < 0:
+        raise Exception("bad seed")
+    return fake_detailed_placement(None, None, None, fixed_blk_pos, netlists,
+                                   fold_reg, seed, layout)
+
+
+def test_find_free_site():
+    free_sites = {(0, 0), (3, 1), (2, 4)}
+    assert find_free_site(free_sites, (3, 3), 10) == (2, 4)
+    assert find_free_site(free_sites, (3, 3), 10, {(2, 4)}) == (3, 1)
+    assert find_free_site(free_sites, (3, 3), 1) is None
+    assert find_free_site(set(), (3, 3), 10) is None
+
+
+def test_insert_new_blocks():
+    netlists = {"e0": ["i0", "p1"], "e1": ["p1", "r2"], "e2": ["r2", "p3"]}
+    blk_pos = {"i0": (0, 2), "p3": (5, 2)}
+    free_sites = {"i": {(0, 1), (0, 3)},
+                  "p": {(1, 2), (2, 2), (3, 2)},
+                  "r": {(1, 2), (2, 2), (3, 2)}}
+    insert_new_blocks(blk_pos, ["p1", "r2"], netlists, get_blk_nets(netlists),
+                      free_sites, {"i", "p", "r"}, (3, 3), 10, True)
+    assert blk_pos["p1"] == (1, 2)
+    # r2 can't share the tile with p1
+    assert blk_pos["r2"] == (3, 2)
+    assert free_sites["p"] == {(2, 2), (3, 2)}
+    assert free_sites["r"] == {(1, 2), (2, 2)}
+
+
+def test_incremental_placement():
+    layout = pythunder.Layout([list(row) for row in BOARD])
+    prev_pos = {"i0": (0, 3), "p1": (1, 3), "p2": (2, 3), "p3": (5, 5),
+                "p4": (4, 1), "m5": (6, 2)}
+    prev_id_to_name = {"i0": "io", "p1": "a", "p2": "b", "p3": "c",
+                       "p4": "old", "m5": "mem"}
+    # p4 is renamed and p6 is new
+    netlists = {"e0": ["i0", "p1", "p6"], "e1": ["p6", "p2", "p4"],
+                "e2": ["p4", "m5"], "e3": ["p3", "m5"]}
+    id_to_name = {"i0": "io", "p1": "a", "p2": "b", "p3": "c", "p4": "new",
+                  "m5": "mem", "p6": "d"}
+    board_pos = perform_incremental_placement(layout, prev_pos, netlists, {},
+                                              False, 0, 1, id_to_name,
+                                              prev_id_to_name)
+    assert sorted(board_pos.keys()) == sorted(id_to_name.keys())
+    # blocks away from the new ones and IOs stay
+    assert board_pos["i0"] == (0, 3)
+    assert board_pos["p3"] == (5, 5)
+    for blk_id in ("p4", "p6"):
+        x, y = board_pos[blk_id]
+        assert BOARD[y][x] == "p"
+    assert len(set(board_pos.values())) == len(board_pos)
+
+    # nothing changed
+    netlists = {"e0": ["i0", "p1"], "e1": ["p2", "p4"], "e2": ["p4", "m5"],
+                "e3": ["p3", "m5"]}
+    board_pos = perform_incremental_placement(layout, prev_pos, netlists, {},
+                                              False, 0, 1)
+    assert board_pos == {blk_id: prev_pos[blk_id] for blk_id in board_pos}
+
+
+def test_place_design_abort(monkeypatch):
+    monkeypatch.setattr(place, "perform_global_placement",
+                        fake_global_placement)
+    monkeypatch.setattr(place, "perform_detailed_placement",
+                        fake_detailed_placement)
+    monkeypatch.setattr(place, "refine_global_thunder",
+                        lambda layout, board_pos, *args: board_pos)
+    leader = multiprocessing.Value("d", float("inf"))
+    # the global HPWL is the seed
+    assert place_design(None, FIXED_POS, NETLISTS, False, 4, vis=False,
+                        leader=leader, abort_ratio=1.5) is not None
+    assert leader.value == 4
+    assert place_design(None, FIXED_POS, NETLISTS, False, 2, vis=False,
+                        leader=leader, abort_ratio=1.5) is not None
+    assert leader.value == 2
+    # 2 is not more than 2 * 1
+    assert place_design(None, FIXED_POS, NETLISTS, False, 2, vis=False,
+                        leader=leader, abort_ratio=1) is not None
+    # 5 > 2 * 1.5 is dropped without changing the leader
+    assert place_design(None, FIXED_POS, NETLISTS, False, 5, vis=False,
+                        leader=leader, abort_ratio=1.5) is None
+    assert leader.value == 2
+    # 0 keeps every seed
+    assert place_design(None, FIXED_POS, NETLISTS, False, 5, vis=False,
+                        leader=leader) is not None
+    assert leader.value == 2
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != "fork",
+                    reason="workers need the patched place_design")
+def test_portfolio_placement(monkeypatch):
+    monkeypatch.setattr(place, "place_design", fake_place_design)
+    layout = pythunder.Layout([list(row) for row in BOARD])
+    # seed 3 is dropped. seed 4 has the lowest HPWL
+    seed, board_pos, hpwl = perform_portfolio_placement(
+        layout, FIXED_POS, NETLISTS, False, [1, 2, 3, 4], abort_ratio=2,
+        num_jobs=2)
+    assert seed == 4
+    assert board_pos == fake_place_design(layout, FIXED_POS, NETLISTS,
+                                          False, 4)
+    assert hpwl == 2
+
+    with pytest.raises(ValueError):
+        perform_portfolio_placement(layout, FIXED_POS, NETLISTS, False, [0],
+                                    abort_ratio=0.5)
+
+    # errors in any seed are raised and the workers are stopped
+    with pytest.raises(Exception):
+        perform_portfolio_placement(layout, FIXED_POS, NETLISTS, False,
+                                    [-1, 1, 2], num_jobs=2)
+    assert multiprocessing.active_children() == []
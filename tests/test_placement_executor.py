@@ -0,0 +1,109 @@
+import threading
+import pytest
+from concurrent.futures import Future
+import placement_executor
+from placement_executor import PlacementExecutor, HTTPExecutor, LocalExecutor
+from placement_executor import make_worker_server, make_job_context
+from placement_executor import encode_job, decode_job, MissingContextError
+
+FIXED_POS = {"i0": (0, 1), "x1": (3, 3), "x2": (5, 2)}
+
+
+def fake_placement(args, context=None):
+    if args["seed"] < 0:
+        raise Exception("bad seed")
+    placement = {blk: [args["seed"], i]
+                 for i, blk in enumerate(sorted(args["clusters"]))}
+    return {"statusCode": 200, "body": placement}
+
+
+def local_placement(args):
+    # local workers return the placement itself
+    return fake_placement(args)["body"]
+
+
+def make_args(blks):
+    return {"clusters": set(blks), "cells": {"p": {(1, 1), (2, 1)}},
+            "new_netlist": {"e0": ["i0"] + sorted(blks), "e1": ["x2"]}}
+
+
+class RecordExecutor(PlacementExecutor):
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, context, job):
+        self.jobs.append(job)
+        future = Future()
+        future.set_result(job)
+        return future
+
+
+def test_lpt_order():
+    executor = RecordExecutor()
+    futures = executor.submit_all(None, ["a", "b", "c"], [1.0, 3.0, 2.0])
+    assert executor.jobs == ["b", "c", "a"]
+    # futures are still in the job order
+    assert [future.result() for future in futures] == ["a", "b", "c"]
+
+
+def test_encode_job(monkeypatch):
+    monkeypatch.setattr(placement_executor, "JOB_CONTEXT_CACHE", {})
+    context = make_job_context(FIXED_POS, True, 3, "p")
+    args = make_args(["p3", "p4"])
+    job = encode_job(context, "x1", args)
+    with pytest.raises(MissingContextError):
+        decode_job(job)
+    decoded = decode_job(job, context["data"])
+    assert sorted(decoded["clusters"]) == ["p3", "p4"]
+    assert sorted(decoded["cells"]["p"]) == [(1, 1), (2, 1)]
+    assert decoded["new_netlist"] == args["new_netlist"]
+    # the cluster itself is not fixed
+    assert decoded["blk_pos"] == {"i0": [0, 1], "x2": [5, 2]}
+    assert (decoded["fold_reg"], decoded["seed"], decoded["clb_type"]) == \
+        (True, 3, "p")
+    # the context is cached
+    assert decode_job(job) == decoded
+
+
+@pytest.fixture
+def worker_urls():
+    servers = [make_worker_server(fake_placement, "localhost")
+               for _ in range(2)]
+    for server in servers:
+        threading.Thread(target=server.serve_forever).start()
+    yield ["http://localhost:{}".format(server.server_address[1])
+           for server in servers]
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_http_executor(worker_urls, monkeypatch):
+    monkeypatch.setattr(placement_executor, "JOB_CONTEXT_CACHE", {})
+    context = make_job_context(FIXED_POS, False, 0, "p")
+    jobs = [encode_job(context, "x1", make_args(["p1", "p0"])),
+            encode_job(context, "x2", make_args(["m2"]))]
+    with HTTPExecutor(worker_urls) as executor:
+        futures = executor.submit_all(context, jobs, [1, 2])
+        assert [future.result() for future in futures] == \
+            [{"p0": [0, 0], "p1": [0, 1]}, {"m2": [0, 0]}]
+        # workers that lost the context get it again
+        placement_executor.JOB_CONTEXT_CACHE.clear()
+        assert executor.submit(context, jobs[1]).result() == {"m2": [0, 0]}
+        # worker errors show up in the future
+        bad_context = make_job_context(FIXED_POS, False, -1, "p")
+        future = executor.submit(bad_context,
+                                 encode_job(bad_context, "x1",
+                                            make_args(["p0"])))
+        with pytest.raises(Exception):
+            future.result()
+
+
+def test_local_executor():
+    context = make_job_context(FIXED_POS, False, 1, "p")
+    jobs = [encode_job(context, "x1", make_args(["p1", "p0"])),
+            encode_job(context, "x2", make_args(["m2"]))]
+    with LocalExecutor(local_placement, 2) as executor:
+        futures = executor.submit_all(context, jobs, [1, 2])
+        assert [future.result() for future in futures] == \
+            [{"p0": [1, 0], "p1": [1, 1]}, {"m2": [1, 0]}]
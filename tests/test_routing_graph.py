@@ -0,0 +1,222 @@
+import fcntl
+import os
+import numpy as np
+import pytest
+import pycyclone
+import process_graph
+from pycyclone import RoutingGraph, Switch, Tile, SwitchBoxNode
+from pycyclone import SwitchBoxSide, SwitchBoxIO, PortNode, RegisterNode
+from pycyclone.util import get_disjoint_sb_wires
+
+from process_graph import SB_NODE, PORT_NODE, REG_NODE, SB_IN, SB_OUT
+from process_graph import run_in_threads, update_routing_graphs
+from process_graph import GRAPH_16, GRAPH_1, GRAPH_KEY, GRAPH_LOCK
+
+
+def make_graph():
+    g = RoutingGraph()
+    switch = Switch(0, 0, 2, 16, 0, get_disjoint_sb_wires(2))
+    g.add_tile(Tile(0, 0, switch))
+    g.add_tile(Tile(1, 0, switch))
+    return g
+
+
+def test_add_edges(tmp_path):
+    g = make_graph()
+    sb_out = SwitchBoxNode(0, 0, 16, 1, SwitchBoxSide.Right,
+                           SwitchBoxIO.SB_OUT)
+    sb_in = SwitchBoxNode(1, 0, 16, 1, SwitchBoxSide.Left, SwitchBoxIO.SB_IN)
+    reg = RegisterNode("reg_1_0", 0, 0, 16, 1)
+    port = PortNode("data0", 1, 0, 16)
+    g.add_edge(sb_out, sb_in)
+    g.add_edge(sb_out, reg)
+    g.add_edge(reg, sb_in)
+    g.add_edge(sb_in, port)
+
+    sb_out = (SB_NODE, 0, 0, 16, 1, int(SwitchBoxSide.Right), SB_OUT, 0)
+    sb_in = (SB_NODE, 1, 0, 16, 1, int(SwitchBoxSide.Left), SB_IN, 0)
+    reg = (REG_NODE, 0, 0, 16, 1, 0, 0, 1)
+    port = (PORT_NODE, 1, 0, 16, 0, 0, 0, 0)
+    edges = np.array([sb_out + sb_in, sb_out + reg, reg + sb_in,
+                      sb_in + port])
+    bulk_g = make_graph()
+    bulk_g.add_edges(edges, ["data0", "reg_1_0"])
+
+    filename = str(tmp_path / "edge.graph")
+    bulk_filename = str(tmp_path / "bulk.graph")
+    pycyclone.io.dump_routing_graph(g, filename)
+    pycyclone.io.dump_routing_graph(bulk_g, bulk_filename)
+    with open(filename) as f, open(bulk_filename) as bulk_f:
+        assert f.read() == bulk_f.read()
+
+    # the same checks as add_edge
+    with pytest.raises(Exception):
+        bulk_g.add_edges(np.array([sb_out + sb_in]))
+    with pytest.raises(Exception):
+        bulk_g.add_edges(np.array([sb_out + (PORT_NODE, 0, 0, 1, 0, 0, 0,
+                                             0)]), ["data1"])
+    with pytest.raises(Exception):
+        bulk_g.add_edges(np.array([port + port]))
+    with pytest.raises(Exception):
+        bulk_g.add_edges(np.array([sb_out]))
+
+
+def test_stamp_edges(tmp_path):
+    right, left = int(SwitchBoxSide.Right), int(SwitchBoxSide.Left)
+
+    def edge_template(x):
+        # a wire from the tile on the left, and a register into the port
+        return np.array([(SB_NODE, x - 1, 0, 16, 0, right, SB_OUT, 0) +
+                         (SB_NODE, x, 0, 16, 0, left, SB_IN, 0),
+                         (REG_NODE, x, 0, 16, 0, 0, 0, 0) +
+                         (PORT_NODE, x, 0, 16, 0, 0, 0, 1)])
+
+    names = ["reg_0_0", "data0"]
+    switch = Switch(0, 0, 1, 16, 0, get_disjoint_sb_wires(1))
+    g = RoutingGraph()
+    stamped_g = RoutingGraph()
+    for x in range(3):
+        g.add_tile(Tile(x, 0, switch))
+        stamped_g.add_tile(Tile(x, 0, switch))
+    g.add_edges(np.concatenate([edge_template(1), edge_template(2)]), names)
+    stamped_g.stamp_edges([np.zeros((0, 16)), edge_template(0)],
+                          np.array([[1, 1, 0], [1, 2, 0], [0, 0, 0]]), names)
+
+    filename = str(tmp_path / "edge.graph")
+    stamped_filename = str(tmp_path / "stamped.graph")
+    pycyclone.io.dump_routing_graph(g, filename)
+    pycyclone.io.dump_routing_graph(stamped_g, stamped_filename)
+    with open(filename) as f, open(stamped_filename) as stamped_f:
+        assert f.read() == stamped_f.read()
+
+    with pytest.raises(Exception):
+        # no tile on the left of x = 0
+        stamped_g.stamp_edges([edge_template(0)], np.array([[0, 0, 0]]),
+                              names)
+    with pytest.raises(Exception):
+        stamped_g.stamp_edges([edge_template(0)], np.array([[1, 1, 0]]),
+                              names)
+
+
+def test_run_in_threads(tmp_path):
+    graphs = [make_graph(), make_graph()]
+    sb_out = (SB_NODE, 0, 0, 16, 1, int(SwitchBoxSide.Right), SB_OUT, 0)
+    sb_in = (SB_NODE, 1, 0, 16, 1, int(SwitchBoxSide.Left), SB_IN, 0)
+    run_in_threads([(g.add_edges, (np.array([sb_out + sb_in]), []))
+                    for g in graphs])
+    filenames = [str(tmp_path / "g0.graph"), str(tmp_path / "g1.graph")]
+    run_in_threads([(pycyclone.io.dump_routing_graph, (g, filename))
+                    for g, filename in zip(graphs, filenames)])
+    with open(filenames[0]) as f0, open(filenames[1]) as f1:
+        assert f0.read() == f1.read()
+
+    # errors in any of the threads are raised
+    with pytest.raises(Exception):
+        run_in_threads([(graphs[0].add_edges, (np.array([sb_out]), [])),
+                        (graphs[1].get_sb, (0, 0, SwitchBoxSide.Right, 1,
+                                            SwitchBoxIO.SB_OUT))])
+
+
+def test_binary_graph(tmp_path):
+    g = make_graph()
+    sb_out = (SB_NODE, 0, 0, 16, 1, int(SwitchBoxSide.Right), SB_OUT, 0)
+    sb_in = (SB_NODE, 1, 0, 16, 1, int(SwitchBoxSide.Left), SB_IN, 0)
+    reg = (REG_NODE, 0, 0, 16, 1, 0, 0, 1)
+    port = (PORT_NODE, 1, 0, 16, 0, 0, 0, 0)
+    g.add_edges(np.array([sb_out + sb_in, sb_out + reg, reg + sb_in,
+                          sb_in + port]), ["data0", "reg_1_0"])
+
+    filename = str(tmp_path / "edge.graph")
+    binary_filename = str(tmp_path / "edge.bin")
+    converted_filename = str(tmp_path / "converted.graph")
+    pycyclone.io.dump_routing_graph(g, filename)
+    pycyclone.io.dump_routing_graph_binary(g, binary_filename)
+    assert pycyclone.io.is_binary_routing_graph(binary_filename)
+    assert not pycyclone.io.is_binary_routing_graph(filename)
+    pycyclone.io.convert_routing_graph(binary_filename, converted_filename)
+    with open(filename) as f, open(converted_filename) as converted_f:
+        assert f.read() == converted_f.read()
+
+    # text to binary, and load_routing_graph reads both formats
+    converted_filename = str(tmp_path / "converted.bin")
+    pycyclone.io.convert_routing_graph(filename, converted_filename)
+    with open(binary_filename, "rb") as f, \
+            open(converted_filename, "rb") as converted_f:
+        assert f.read() == converted_f.read()
+    loaded_filename = str(tmp_path / "loaded.graph")
+    pycyclone.io.dump_routing_graph(
+        pycyclone.io.load_routing_graph(binary_filename), loaded_filename)
+    with open(filename) as f, open(loaded_filename) as loaded_f:
+        assert f.read() == loaded_f.read()
+
+    # truncated files are rejected
+    with open(binary_filename, "rb") as f:
+        data = f.read()
+    with open(binary_filename, "wb") as f:
+        f.write(data[:len(data) // 2])
+    with pytest.raises(Exception):
+        pycyclone.io.load_routing_graph_binary(binary_filename)
+
+
+def test_update_routing_graphs(tmp_path, monkeypatch):
+    cgra_filename = str(tmp_path / "cgra_info.txt")
+    with open(cgra_filename, "w") as f:
+        f.write("<CGRA></CGRA>\n")
+    graph_dirname = str(tmp_path)
+    builds = []
+
+    def build_routing_graph(routing_resource, layout):
+        # other flows can't update the directory in the meantime
+        with open(os.path.join(graph_dirname, GRAPH_LOCK)) as f:
+            with pytest.raises(IOError):
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        builds.append(layout)
+        return make_graph(), make_graph()
+    monkeypatch.setattr(process_graph, "load_cgra_arch",
+                        lambda _: ({"CGRA": None}, {}))
+    monkeypatch.setattr(process_graph, "build_routing_graph",
+                        build_routing_graph)
+
+    assert update_routing_graphs(cgra_filename, graph_dirname)
+    for filename in (GRAPH_16, GRAPH_1, GRAPH_KEY):
+        assert os.path.isfile(os.path.join(graph_dirname, filename))
+    assert not update_routing_graphs(cgra_filename, graph_dirname)
+    assert update_routing_graphs(cgra_filename, graph_dirname, override=True)
+    assert len(builds) == 2
+
+    # changes to the cgra_info file or the format are rebuilt
+    with open(cgra_filename, "a") as f:
+        f.write("\n")
+    assert update_routing_graphs(cgra_filename, graph_dirname)
+    assert update_routing_graphs(cgra_filename, graph_dirname, binary=True)
+    assert pycyclone.io.is_binary_routing_graph(
+        os.path.join(graph_dirname, GRAPH_16))
+    assert not update_routing_graphs(cgra_filename, graph_dirname,
+                                     binary=True)
+    # missing graphs are rebuilt as well
+    os.remove(os.path.join(graph_dirname, GRAPH_1))
+    assert update_routing_graphs(cgra_filename, graph_dirname, binary=True)
+    # no temporary files are left behind
+    assert sorted(os.listdir(graph_dirname)) == \
+        sorted(["cgra_info.txt", GRAPH_16, GRAPH_1, GRAPH_KEY, GRAPH_LOCK])
+
+
+def test_graph_mode(tmp_path, monkeypatch):
+    cgra_filename = str(tmp_path / "cgra_info.txt")
+    with open(cgra_filename, "w") as f:
+        f.write("<CGRA></CGRA>\n")
+    monkeypatch.setattr(process_graph, "load_cgra_arch",
+                        lambda _: ({"CGRA": None}, {}))
+    monkeypatch.setattr(process_graph, "build_routing_graph",
+                        lambda routing_resource, layout: (make_graph(),
+                                                          make_graph()))
+    old_umask = os.umask(0o022)
+    try:
+        update_routing_graphs(cgra_filename, str(tmp_path))
+        # the umask is left as it is
+        assert os.umask(0o022) == 0o022
+    finally:
+        os.umask(old_umask)
+    # the same as files created with open()
+    for filename in (GRAPH_16, GRAPH_1, GRAPH_KEY):
+        assert os.stat(str(tmp_path / filename)).st_mode & 0o777 == 0o644
@@ -0,0 +1,48 @@
+import pytest
+from util import compute_hpwl, compute_centroid, compute_centroids
+from util import reduce_cluster_graph, reduce_cluster_graphs
+
+
+def test_compute_hpwl():
+    netlists = {"e0": ["p0", "p1", "i2"],
+                "e1": ["p1", "m3"],
+                "e2": ["p0", "x1"]}
+    blk_pos = {"p0": (1, 1), "p1": (3, 2), "i2": (0, 4), "m3": (3, 2)}
+    # x1 has no position yet, so e2 does not count
+    assert compute_hpwl(netlists, blk_pos) == (3 + 3) + 0
+    assert compute_hpwl(netlists, {}) == 0
+
+
+def test_reduce_cluster_graphs():
+    netlists = {"e0": ["p0", "p1", "p0"],
+                "e1": ["i0", "p1", "p2", "m3"],
+                "e2": ["i0", "m3"],
+                "e3": ["p2", "i1"]}
+    clusters = {0: {"p0", "p1"}, 1: {"p2"}, 2: {"m3"}}
+    fixed_blocks = {"i0": (0, 1), "i1": (0, 2)}
+    new_netlists = reduce_cluster_graphs(netlists, clusters, fixed_blocks)
+    assert new_netlists == {0: {"e0": ["p0", "p1"],
+                                "e1": ["i0", "p1", "x1", "x2"]},
+                            1: {"e1": ["i0", "x0", "p2", "x2"],
+                                "e3": ["p2", "i1"]},
+                            2: {"e1": ["i0", "x0", "x1", "m3"],
+                                "e2": ["i0", "m3"]}}
+    for cluster_id in clusters:
+        assert reduce_cluster_graph(netlists, clusters, fixed_blocks,
+                                    cluster_id) == new_netlists[cluster_id]
+    # without a cluster, cluster 0 is condensed into x0
+    assert reduce_cluster_graph(netlists, clusters, fixed_blocks) == \
+        {"e0": ["x0", "x0"], "e1": ["i0", "x0", "x1", "x2"]}
+
+    with pytest.raises(Exception):
+        reduce_cluster_graphs({"e0": ["p0", "p9"]}, clusters, fixed_blocks)
+
+
+def test_compute_centroids():
+    assert compute_centroid([(0, 1), (3, 4)]) == (1, 2)
+    assert compute_centroid({"p0": (0, 1), "p1": (3, 4)}) == (1, 2)
+    cluster_cells = {0: {"p": {(1, 1), (2, 5)}, "m": {(9, 9)}},
+                     1: {"p": [(4, 0)]}}
+    assert compute_centroids(cluster_cells, "p") == {0: (1, 3), 1: (4, 0)}
+    with pytest.raises(Exception):
+        compute_centroid((0, 1))
@@ -1,5 +1,7 @@
 #include <pybind11/pybind11.h>
 #include <pybind11/stl.h>
+#include <pybind11/numpy.h>
+#include <cstring>
 #include <vector>
 #include <algorithm>
 #include "../src/detailed.hh"
@@ -8,6 +10,7 @@
 #include "../src/multi_place.hh"
 #include "../src/layout.hh"
 #include "../src/io.hh"
+#include "../src/packed.hh"
 #include "../src/graph.hh"
 #include "../src/util.hh"
 
@@ -20,6 +23,94 @@ using std::pair;
 using std::set;
 
 
+// same structures as load_packed_file in arch/cgra_packer.py, with dicts
+// in file order
+py::tuple load_packed_file(const std::string &filename) {
+    auto packed = load_packed_netlist(filename);
+
+    py::dict netlists;
+    for (auto const &[net_id, net]: packed.netlists) {
+        py::list pins;
+        for (auto const &[blk_id, port]: net)
+            pins.append(py::make_tuple(blk_id, port));
+        netlists[py::str(net_id)] = pins;
+    }
+    py::dict folded_blocks;
+    for (auto const &[entry, folded]: packed.folded_blocks)
+        folded_blocks[py::tuple(py::cast(entry))] = py::tuple(py::cast(folded));
+    py::dict id_to_name;
+    for (auto const &[blk_id, name]: packed.id_to_name)
+        id_to_name[py::str(blk_id)] = py::str(name);
+    py::set changed_pe;
+    for (auto const &blk_id: packed.changed_pe)
+        changed_pe.add(py::str(blk_id));
+    py::dict track_mode;
+    for (auto const &[net_id, width]: packed.track_mode)
+        track_mode[py::str(net_id)] = width;
+
+    return py::make_tuple(netlists, folded_blocks, id_to_name, changed_pe,
+                          track_mode);
+}
+
+// resolved blk types as a U1 array indexed by [y][x], and the availability
+// mask of every layer, including the ones get_blk_type skips such as 'r'
+py::tuple layout_to_numpy(const Layout &layout) {
+    const auto height = static_cast<ssize_t>(layout.height());
+    const auto width = static_cast<ssize_t>(layout.width());
+    py::array blk_types(py::dtype("<U1"), {height, width});
+    auto *blk_data = static_cast<uint32_t *>(blk_types.mutable_data());
+    for (ssize_t y = 0; y < height; y++) {
+        for (ssize_t x = 0; x < width; x++) {
+            auto const blk_type = layout.get_blk_type(x, y);
+            blk_data[y * width + x] = static_cast<unsigned char>(blk_type);
+        }
+    }
+    py::dict masks;
+    for (auto const blk_type: layout.get_layer_types()) {
+        auto const &layer = layout.get_layer(blk_type);
+        py::array_t<bool> mask({height, width});
+        auto m = mask.mutable_unchecked<2>();
+        for (ssize_t y = 0; y < height; y++) {
+            for (ssize_t x = 0; x < width; x++) {
+                m(y, x) = layer[{x, y}];
+            }
+        }
+        masks[py::str(std::string(1, blk_type))] = mask;
+    }
+    return py::make_tuple(blk_types, masks);
+}
+
+// same as Layout(vector<vector<char>>), from a U1 or S1 array indexed by
+// [y][x]
+Layout layout_from_numpy(const py::array &board) {
+    if (board.ndim() != 2)
+        throw std::runtime_error("board has to be a 2D array");
+    const auto kind = board.dtype().kind();
+    const auto item_size = board.itemsize();
+    if (!((kind == 'U' && item_size == 4) || (kind == 'S' && item_size == 1)))
+        throw std::runtime_error("board has to be an array of single chars");
+    const auto height = board.shape(0);
+    const auto width = board.shape(1);
+    auto const *data = static_cast<const char *>(board.data());
+    vector<vector<char>> layers(height, vector<char>(width));
+    for (ssize_t y = 0; y < height; y++) {
+        for (ssize_t x = 0; x < width; x++) {
+            auto const *item = data + y * board.strides(0) +
+                               x * board.strides(1);
+            if (kind == 'U') {
+                uint32_t c;
+                std::memcpy(&c, item, sizeof(c));
+                if (c > 127)
+                    throw std::runtime_error("blk type has to be ascii");
+                layers[y][x] = static_cast<char>(c);
+            } else {
+                layers[y][x] = *item;
+            }
+        }
+    }
+    return Layout(layers);
+}
+
 void init_io(py::module &m) {
     auto io_m = m.def_submodule("io");
 
@@ -28,7 +119,8 @@ void init_io(py::module &m) {
         .def("load_id_to_name", &load_id_to_name)
         .def("load_placement", &load_id_to_name)
         .def("save_placement", &save_placement)
-        .def("load_netlist", &load_netlist);
+        .def("load_netlist", &load_netlist)
+        .def("load_packed_file", &load_packed_file);
 }
 
 void init_graph(py::module &m) {
@@ -84,6 +176,8 @@ void init_layout(py::module &m) {
             .def("get_layout_margin", &Layout::get_layout_margin)
             .def("height", &Layout::height)
             .def("width", &Layout::width)
+            .def("to_numpy", &layout_to_numpy)
+            .def_static("from_numpy", &layout_from_numpy)
             .def("__repr__", &Layout::layout_repr);
 
     py::class_<LayerMask>(m, "LayerMask")
@@ -122,7 +216,8 @@ void init_pythunder(py::module &m) {
             .def("anneal", &SimAnneal::anneal)
             .def("realize", &DetailedPlacer::realize)
             .def("refine", &SimAnneal::refine)
-            .def("estimate", &DetailedPlacer::estimate)
+            .def("estimate", &DetailedPlacer::estimate,
+                 py::call_guard<py::gil_scoped_release>())
             .def("set_seed", &DetailedPlacer::set_seed)
             .def_readwrite("steps", &DetailedPlacer::steps)
             .def_readwrite("tmax", &DetailedPlacer::tmax)
@@ -1,5 +1,6 @@
 #include "io.hh"
 #include "layout.hh"
+#include "packed.hh"
 #include <iostream>
 #include <fstream>
 #include <algorithm>
@@ -71,76 +72,119 @@ inline bool exists(const std::string &filename) {
     return tokens;
 }
 
-::pair<::map<::string, ::vector<::pair<::string, ::string>>>,
-       ::map<::string, uint32_t>>
-load_netlist(const std::string &filename) {
+// split "(a, b, c)" into its entries
+::vector<::string> get_tuple(::string entry) {
+    trim(entry);
+    if (entry.size() < 2 || entry.front() != '(' || entry.back() != ')')
+        throw ::runtime_error("expect a tuple, got " + entry);
+    return get_tokens(entry.substr(1, entry.size() - 2));
+}
+
+// split "key: value" at the first colon
+::pair<::string, ::string> get_key_value(const ::string &line) {
+    auto pos = line.find(':');
+    if (pos == ::string::npos)
+        throw ::runtime_error("unable to process line " + line);
+    auto key = line.substr(0, pos);
+    auto value = line.substr(pos + 1);
+    trim(key);
+    trim(value);
+    return {key, value};
+}
+
+PackedNetlist load_packed_netlist(const std::string &filename) {
     if (!::exists(filename))
         throw ::runtime_error(filename + " does not exist");
     ::ifstream in;
     in.open(filename);
 
+    enum class Section { None, Netlists, Folded, IDToName, ChangedPE, Bus,
+                         Unknown };
+    Section section = Section::None;
+    PackedNetlist packed;
     ::string line;
-    bool in_netlist = false;
-    bool in_bus = false;
-
-    ::map<::string, ::vector<::pair<::string, ::string>>> netlist;
-    ::map<::string, uint32_t> track_mode;
 
     while(std::getline(in, line)) {
-        // we are only interested in the packed netlist section
-        trim(line);
-        if (line[0] == '#')
-            continue;
-        if (in_netlist) {
-            if (line.empty()) {
-                in_netlist = false;
+        auto comment_pos = line.find('#');
+        if (comment_pos != ::string::npos) {
+            line.erase(comment_pos);
+            trim(line);
+            // comment lines do not end a section
+            if (line.empty())
                 continue;
-            }
-            const ::vector<::string> tokens = get_tokens(line);
-
-            if (tokens.size() % 2 != 1)
-                throw ::runtime_error("unable to process line " + line);
-            const ::string &net_id = tokens[0];
-            ::vector<::pair<::string, ::string>> net;
-            for (uint32_t i = 1; i < tokens.size(); i+= 2) {
-                ::string const &blk_id = tokens[i];
-                ::string const &port = tokens[i + 1];
-                net.emplace_back(make_pair(blk_id, port));
-            }
-            netlist.insert({net_id, net});
-            // skip the rest of logic
-            continue;
         }
-
-        if (in_bus) {
-            if (line.empty()) {
-                in_bus = false;
-                continue;
-            }
-            const ::vector<::string> tokens = get_tokens(line);
-            if (tokens.size() != 2)
-                throw ::runtime_error("unable to process line " + line);
-            const ::string net_id = tokens[0];
-            const ::string track_str = tokens[1];
-
-            auto width = static_cast<uint32_t>(std::stoi(track_str));
-            track_mode.insert({net_id, width});
-
-            // skip the rest of logic
+        trim(line);
+        if (line.empty()) {
+            section = Section::None;
             continue;
         }
 
-        // state control
-        if (line == "Netlists:") {
-            in_netlist = true;
-            continue;
-        } else if (line == "Netlist Bus:") {
-            in_bus = true;
-        } else {
-            in_netlist = false;
-            in_bus = false;
+        switch (section) {
+            case Section::None: {
+                if (line == "Netlists:")
+                    section = Section::Netlists;
+                else if (line == "Folded Blocks:")
+                    section = Section::Folded;
+                else if (line == "ID to Names:")
+                    section = Section::IDToName;
+                else if (line == "Changed to PE:")
+                    section = Section::ChangedPE;
+                else if (line == "Netlist Bus:")
+                    section = Section::Bus;
+                else
+                    section = Section::Unknown;
+                break;
+            }
+            case Section::Netlists: {
+                const ::vector<::string> tokens = get_tokens(line);
+                if (tokens.size() % 2 != 1)
+                    throw ::runtime_error("unable to process line " + line);
+                ::vector<::pair<::string, ::string>> net;
+                for (uint32_t i = 1; i < tokens.size(); i+= 2)
+                    net.emplace_back(make_pair(tokens[i], tokens[i + 1]));
+                packed.netlists.emplace_back(make_pair(tokens[0], net));
+                break;
+            }
+            case Section::Folded: {
+                auto pos = line.find("->");
+                if (pos == ::string::npos)
+                    throw ::runtime_error("unable to process line " + line);
+                packed.folded_blocks.emplace_back(
+                        make_pair(get_tuple(line.substr(0, pos)),
+                                  get_tuple(line.substr(pos + 2))));
+                break;
+            }
+            case Section::IDToName: {
+                packed.id_to_name.emplace_back(get_key_value(line));
+                break;
+            }
+            case Section::ChangedPE: {
+                packed.changed_pe.emplace_back(get_key_value(line).first);
+                break;
+            }
+            case Section::Bus: {
+                const ::vector<::string> tokens = get_tokens(line);
+                if (tokens.size() != 2)
+                    throw ::runtime_error("unable to process line " + line);
+                auto width = static_cast<uint32_t>(std::stoi(tokens[1]));
+                packed.track_mode.emplace_back(make_pair(tokens[0], width));
+                break;
+            }
+            case Section::Unknown:
+                break;
         }
     }
+    return packed;
+}
+
+::pair<::map<::string, ::vector<::pair<::string, ::string>>>,
+       ::map<::string, uint32_t>>
+load_netlist(const std::string &filename) {
+    auto packed = load_packed_netlist(filename);
+    ::map<::string, ::vector<::pair<::string, ::string>>> netlist(
+            packed.netlists.begin(), packed.netlists.end());
+    ::map<::string, uint32_t> track_mode(packed.track_mode.begin(),
+                                         packed.track_mode.end());
 
     if (netlist.size() != track_mode.size()) {
         throw ::runtime_error("netlist size doesn't match with netlist bus");
@@ -374,33 +418,9 @@ void save_placement(const std::map<std::string, std::pair<int, int>> &placement,
 
 std::map<std::string, std::string>
 load_id_to_name(const std::string &filename) {
-    if (!::exists(filename))
-        throw ::runtime_error(filename + " does not exist");
-    ::ifstream in;
-    in.open(filename);
-
-    ::string line;
-    std::map<std::string, std::string> id_to_name;
-    bool in_section = false;
-    while(std::getline(in, line)) {
-        trim(line);
-        if (in_section) {
-            if (line[0] == '#') {
-                continue;
-            } else if (line.empty()) {
-                break;
-            }
-            auto tokens = get_tokens(line);
-            if (tokens.size() != 2)
-                throw ::runtime_error("expected line " + line);
-            auto blk_id = tokens[0];
-            auto name = tokens[1];
-            id_to_name.insert({blk_id, name});
-            continue;
-        }
-        in_section = line == "ID to Names:";
-    }
-    return id_to_name;
+    auto packed = load_packed_netlist(filename);
+    return std::map<std::string, std::string>(packed.id_to_name.begin(),
+                                              packed.id_to_name.end());
 }
 
 
@@ -0,0 +1,22 @@
+#ifndef THUNDER_PACKED_HH
+#define THUNDER_PACKED_HH
+
+#include <string>
+#include <vector>
+#include <cstdint>
+
+// content of a packed netlist file. every section is kept in file order
+struct PackedNetlist {
+    std::vector<std::pair<std::string,
+                          std::vector<std::pair<std::string,
+                                                std::string>>>> netlists;
+    std::vector<std::pair<std::vector<std::string>,
+                          std::vector<std::string>>> folded_blocks;
+    std::vector<std::pair<std::string, std::string>> id_to_name;
+    std::vector<std::string> changed_pe;
+    std::vector<std::pair<std::string, uint32_t>> track_mode;
+};
+
+PackedNetlist load_packed_netlist(const std::string &filename);
+
+#endif //THUNDER_PACKED_HH
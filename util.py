@@ -1,78 +1,103 @@
 from __future__ import division
 import json
+import numpy as np
+
+
+def get_cluster_index(clusters):
+    """block ID -> IDs of the clusters that have the block, in cluster
+       order"""
+    cluster_index = {}
+    for cluster_id in clusters:
+        for blk_id in clusters[cluster_id]:
+            cluster_index.setdefault(blk_id, []).append(cluster_id)
+    return cluster_index
+
+
+def get_unique_blocks(blks):
+    result = []
+    seen = set()
+    for blk_id in blks:
+        if blk_id not in seen:
+            seen.add(blk_id)
+            result.append(blk_id)
+    return result
+
+
+def reduce_net(netlist, cluster_id, fixed_blocks, cluster_index,
+               condense_self=False):
+    # we use "x" for clusters
+    new_net = []
+    for blk_id in netlist:
+        owners = cluster_index.get(blk_id, ())
+        if cluster_id in owners:
+            if condense_self:
+                new_net.append("x" + str(cluster_id))
+            else:
+                new_net.append(blk_id)
+        elif blk_id in fixed_blocks:
+            new_net.append(blk_id)
+        elif len(owners) > 0:
+            new_net.append("x" + str(owners[0]))
+        else:
+            raise Exception("not found blk", blk_id)
+    return new_net
 
 
 def reduce_cluster_graph(netlists, clusters, fixed_blocks,
-                         cluster_id=None):
+                         cluster_id=None, cluster_index=None):
     """NOTE: cluster_blocks holds block IDs, not cell locations"""
     if cluster_id is None:
         cluster_id = 0
         condense_self = True
     else:
         condense_self = False
-    current_cluster = clusters[cluster_id]
+    if cluster_index is None:
+        cluster_index = get_cluster_index(clusters)
     new_netlist = {}
     for net_id in netlists:
-        netlist = []
-        for blk_id in netlists[net_id]:
-            if blk_id not in netlist:
-                netlist.append(blk_id)
-        netlist_set = set(netlist)
-        if len(netlist_set.intersection(current_cluster)) > 0:
-            # we need to reduce the net
-            new_net = []
-            for blk_id in netlist:
-                if blk_id in current_cluster:
-                    if condense_self:
-                        new_node = "x" + str(cluster_id)
-                        new_net.append(new_node)
-                    else:
-                        new_net.append(blk_id)
-                elif blk_id in fixed_blocks:
-                    new_net.append(blk_id)
-                else:
-                    # search for all the other netlists
-                    # we use "x" for clusters
-                    found = False
-                    for cid in clusters:
-                        if cid == cluster_id:
-                            continue
-                        if blk_id in clusters[cid]:
-                            new_node = "x" + str(cid)
-                            new_net.append(new_node)
-                            found = True
-                            break
-                    if not found:
-                        raise Exception("not found blk", blk_id)
-
-            new_netlist[net_id] = new_net
+        netlist = get_unique_blocks(netlists[net_id])
+        for blk_id in netlist:
+            if cluster_id in cluster_index.get(blk_id, ()):
+                # we need to reduce the net
+                new_netlist[net_id] = reduce_net(netlist, cluster_id,
+                                                 fixed_blocks, cluster_index,
+                                                 condense_self)
+                break
     return new_netlist
 
 
+def reduce_cluster_graphs(netlists, clusters, fixed_blocks):
+    """reduce_cluster_graph of every cluster with a single pass over the
+       nets"""
+    cluster_index = get_cluster_index(clusters)
+    result = {cluster_id: {} for cluster_id in clusters}
+    for net_id in netlists:
+        netlist = get_unique_blocks(netlists[net_id])
+        net_clusters = []
+        for blk_id in netlist:
+            for cluster_id in cluster_index.get(blk_id, ()):
+                if cluster_id not in net_clusters:
+                    net_clusters.append(cluster_id)
+        for cluster_id in net_clusters:
+            result[cluster_id][net_id] = reduce_net(netlist, cluster_id,
+                                                    fixed_blocks,
+                                                    cluster_index)
+    return result
+
+
 def compute_centroid(cluster_cells):
     if type(cluster_cells) == list or type(cluster_cells) == set:
-        x_sum = 0
-        y_sum = 0
-        cluster_size = len(cluster_cells)
-        for cell in cluster_cells:
-            x_sum += cell[0]
-            y_sum += cell[1]
-        pos_x = int(x_sum / cluster_size)
-        pos_y = int(y_sum / cluster_size)
-        return pos_x, pos_y
+        cells = list(cluster_cells)
     elif type(cluster_cells) == dict:
-        x_sum = 0
-        y_sum = 0
-        cluster_size = len(cluster_cells)
-        for cell_id in cluster_cells:
-            cell = cluster_cells[cell_id]
-            x_sum += cell[0]
-            y_sum += cell[0]
-        pos_x = int(x_sum / cluster_size)
-        pos_y = int(y_sum / cluster_size)
-        return pos_x, pos_y
+        cells = list(cluster_cells.values())
     else:
         raise Exception("Unknown type: " + str(type(cluster_cells)))
+    cluster_size = len(cells)
+    x_sum, y_sum = np.array(cells, dtype=np.int64).reshape(
+        (-1, 2)).sum(axis=0).tolist()
+    pos_x = int(x_sum / cluster_size)
+    pos_y = int(y_sum / cluster_size)
+    return pos_x, pos_y
 
 
 def compute_centroids(cluster_cells, b_type):
@@ -88,6 +113,23 @@ def compute_centroids(cluster_cells, b_type):
     return result
 
 
+def compute_hpwl(netlists, blk_pos):
+    """half-perimeter wire length of all the nets. blocks without a position
+       are ignored"""
+    total_hpwl = 0
+    for net_id in netlists:
+        xs = []
+        ys = []
+        for blk_id in netlists[net_id]:
+            if blk_id in blk_pos:
+                x, y = blk_pos[blk_id]
+                xs.append(x)
+                ys.append(y)
+        if len(xs) > 1:
+            total_hpwl += max(xs) - min(xs) + max(ys) - min(ys)
+    return total_hpwl
+
+
 def deepcopy(obj_to_copy):
     import six
     if isinstance(obj_to_copy, dict):
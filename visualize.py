@@ -1,6 +1,7 @@
 from __future__ import print_function
 import os
 from PIL import Image, ImageDraw
+import numpy as np
 import sys
 
 SCALE_FACTOR = 10
@@ -103,13 +104,11 @@ def visualize_board(cgra_file):
     scale = 30
     height, width = layout.height(), layout.width()
     im, draw = draw_board(width, height, scale)
-    for y in range(height):
-        for x in range(width):
-            blk_type = layout.get_blk_type(x, y)
-            if blk_type is not None:
-                index = color_index.index(blk_type)
-                color = color_palette[index % len(color_palette)]
-                draw_cell(draw, (x, y), color, scale)
+    blk_types, _ = layout.to_numpy()
+    for y, x in zip(*np.nonzero(blk_types != " ")):
+        index = color_index.index(blk_types[y, x])
+        color = color_palette[index % len(color_palette)]
+        draw_cell(draw, (int(x), int(y)), color, scale)
     im.show()
 
     basename = os.path.basename(cgra_file)